@@ -73,8 +73,8 @@ class DatabaseFix(object):
             A sequence of day TimeSpan objects
         """
 
-        _sql = "SELECT dateTime FROM %s_day_%s "\
-            " WHERE dateTime >= ? AND dateTime <= ?" % (self.dbm.table_name, obs)
+        _sql = "SELECT dateTime FROM %s "\
+            " WHERE dateTime >= ? AND dateTime <= ?" % (self.dbm._day_table(obs),)
 
         _cursor = self.dbm.connection.cursor()
         try:
@@ -95,8 +95,7 @@ class DatabaseFix(object):
             observation. None is returned if no record culd be found.
         """
 
-        _sql_str = "SELECT MIN(dateTime) FROM %s_day_%s" % (self.dbm.table_name,
-                                                            obs_type)
+        _sql_str = "SELECT MIN(dateTime) FROM %s" % (self.dbm._day_table(obs_type),)
         _row = self.dbm.getSql(_sql_str)
         if _row:
             return _row[0]
@@ -220,6 +219,7 @@ class WindSpeedRecalculation(DatabaseFix):
         # initialise a few things
         day = start_greg
         n_days = 0
+        first_start = None
         last_start = None
         while day <= stop_greg:
             # get the start and stop timestamps for this tranche
@@ -242,10 +242,17 @@ class WindSpeedRecalculation(DatabaseFix):
                     # give the user some information on progress
                     if n_days % 50 == 0:
                         self._progress(n_days, day_span.start)
+                    if first_start is None:
+                        first_start = day_span.start
                     last_start = day_span.start
             # advance to the next tranche
             day += self.trans_days
 
+        # The month and year rollups, if any, hold the maximums of the days.
+        # Rebuild them for the days that were changed.
+        if not self.dry_run and self.dbm._rollups and first_start is not None:
+            self.dbm._fill_rollups(first_start, weeutil.weeutil.archiveDaySpan(last_start, 0).stop)
+
         # we have finished, give the user some final information on progress,
         # mainly so the total tallies with the log
         self._progress(n_days, last_start)
@@ -324,11 +331,13 @@ class WindSpeedRecalculation(DatabaseFix):
 
         _cursor = cursor or self.dbm.connection.cursor()
 
-        max_update_str = "UPDATE %s_day_%s SET %s=?,%s=? WHERE datetime=?" % (self.dbm.table_name,
-                                                                              obs,
-                                                                              'max',
-                                                                              'maxtime')
+        max_update_str = "UPDATE %s SET %s=?,%s=? WHERE datetime=?" % (self.dbm._day_table(obs),
+                                                                       self.dbm._day_column(obs, 'max'),
+                                                                       self.dbm._day_column(obs, 'maxtime'))
         _cursor.execute(max_update_str, (value, when_ts, row_ts))
+        # Any saved aggregates that include the day are now out of date:
+        _day_span = weeutil.weeutil.archiveDaySpan(row_ts, 0)
+        self.dbm._invalidate_aggregates(_day_span.start, _day_span.stop, _cursor)
         if cursor is None:
             _cursor.close()
 
@@ -447,6 +456,13 @@ class IntervalWeighting(DatabaseFix):
                     if not self.dry_run:
                         with weedb.Transaction(self.dbm.connection) as _cursor:
                             self.dbm._write_metadata('Version', '2.0', _cursor)
+                        # The rollups, if any, hold unweighted sums as well.
+                        # Rebuild them, weighting the hours from the archive
+                        # as version 2.0 does.
+                        if self.dbm._rollups and self.dbm.first_timestamp is not None:
+                            self.dbm.version = '2.0'
+                            self.dbm._fill_rollups(self.dbm.first_timestamp - 1,
+                                                   self.dbm.last_timestamp)
                 except weewx.ViolatedPrecondition, e:
                     syslog.syslog(syslog.LOG_INFO,
                                   "intervalweighting: %s not applied: %s"
@@ -518,6 +534,8 @@ class IntervalWeighting(DatabaseFix):
                                     _day_accum[_day_key].xsum *= _weight
                                     _day_accum[_day_key].ysum *= _weight
                                     _day_accum[_day_key].dirsumtime *= _weight
+                                # Make sure the weighted stats get written
+                                _day_accum[_day_key].dirty = True
                         except Exception, e:
                             # log the exception and re-raise it
                             syslog.syslog(syslog.LOG_INFO,
@@ -250,11 +250,34 @@ class Cursor(object):
 
         return self
 
+    @guard
+    def executemany(self, sql_string, sql_list):
+        """Execute a SQL statement once for each tuple in a list.
+        
+        sql_string: A SQL statement to be executed. It should use ? as
+        a placeholder.
+        
+        sql_list: A list of tuples with the values to be used in the placeholders."""
+
+        # MySQL uses '%s' as placeholders, so replace the ?'s with %s
+        mysql_string = sql_string.replace('?', '%s')
+
+        # MySQLdb turns this into a single, multi-row INSERT statement
+        self.cursor.executemany(mysql_string, [tuple(sql_tuple) for sql_tuple in sql_list])
+
+        return self
+
     def fetchone(self):
         # Get a result from the MySQL cursor, then run it through the _massage
         # filter below
         return _massage(self.cursor.fetchone())
 
+    def fetchmany(self, size=None):
+        # Get several results from the MySQL cursor, running each through the
+        # _massage filter
+        if size is None: size = self.cursor.arraysize
+        return [_massage(_row) for _row in self.cursor.fetchmany(size)]
+
     def close(self):
         try:
             self.cursor.close()
@@ -601,6 +601,15 @@ class WeeutilTest(unittest.TestCase):
                                             timestamp_to_local(t[1])),
                                  expected[i][j][4])
 
+    def test_getSunRiseSet(self):
+        import weeutil.weeutil
+        weeutil.weeutil._sun_rise_set.clear()
+        times = getSunRiseSet(2012, 1, 3, -71.06, 42.358)
+        self.assertEqual(times, Sun.sunRiseSet(2012, 1, 3, -71.06, 42.358))
+        # The second time, the memoized times should be returned
+        self.assertTrue(getSunRiseSet(2012, 1, 3, -71.06, 42.358) is times)
+        self.assertEqual(len(weeutil.weeutil._sun_rise_set), 1)
+
     def test_utc_conversions(self):
         self.assertEqual(utc_to_ts(2009, 3, 27, 14.5), 1238164200)
         os.environ['TZ'] = 'America/Los_Angeles'
@@ -1002,7 +1002,7 @@ def getDayNightTransitions(start_ts, end_ts, lat, lon):
         x = startOfDayUTC(t)
         x_tt = time.gmtime(x)
         y, m, d = x_tt[:3]
-        (sunrise_utc, sunset_utc) = Sun.sunRiseSet(y, m, d, lon, lat)
+        (sunrise_utc, sunset_utc) = getSunRiseSet(y, m, d, lon, lat)
         daystart_ts = calendar.timegm((y,m,d,0,0,0,0,0,-1))
         sunrise_ts = int(daystart_ts + sunrise_utc * 3600.0 + 0.5)
         sunset_ts = int(daystart_ts + sunset_utc * 3600.0 + 0.5)
@@ -1017,6 +1017,28 @@ def getDayNightTransitions(start_ts, end_ts, lat, lon):
                 first = 'day'
     return first, values
     
+# Memoized sunrise and sunset times, keyed by (year, month, day, lon, lat)
+_sun_rise_set = {}
+MAX_SUN_RISE_SET = 1000
+
+def getSunRiseSet(year, month, day, lon, lat):
+    """Return the times of sunrise and sunset on a day, memoized.
+
+    The times are calculated by Sun.sunRiseSet() the first time a day and
+    location are asked for, and then shared by everyone who asks again, such
+    as plots that show day/night bands.
+
+    returns: A tuple (sunrise, sunset), in hours UTC.
+    """
+    key = (year, month, day, lon, lat)
+    times = _sun_rise_set.get(key)
+    if times is None:
+        if len(_sun_rise_set) >= MAX_SUN_RISE_SET:
+            _sun_rise_set.clear()
+        times = Sun.sunRiseSet(year, month, day, lon, lat)
+        _sun_rise_set[key] = times
+    return times
+
 def secs_to_string(secs):
     """Convert seconds to a string with days, hours, and minutes"""
     str_list = []
@@ -23,7 +23,10 @@ class ScalarStats(object):
     """Accumulates statistics (min, max, average, etc.) for a scalar value.
     
     Property 'last' is the last non-None value seen. Property 'lasttime' is
-    the time it was seen. """
+    the time it was seen. 
+    
+    Attribute 'dirty' is True if the stats-tuple has changed since it was set
+    from a stored tuple. Whoever stores it is responsible for clearing it."""
     
     default_init = (None, None, None, None, 0.0, 0, 0.0, 0)
     
@@ -37,6 +40,8 @@ class ScalarStats(object):
          self.max, self.maxtime,
          self.sum, self.count,
          self.wsum,self.sumtime) = stats_tuple if stats_tuple else ScalarStats.default_init
+        # Default statistics have never been stored
+        self.dirty = not stats_tuple
          
     def getStatsTuple(self):
         """Return a stats-tuple. That is, a tuple containing the gathered statistics.
@@ -50,10 +55,12 @@ class ScalarStats(object):
             if self.min is None or x_stats.min < self.min:
                 self.min     = x_stats.min
                 self.mintime = x_stats.mintime
+                self.dirty   = True
         if x_stats.max is not None:
             if self.max is None or x_stats.max > self.max:
                 self.max     = x_stats.max
                 self.maxtime = x_stats.maxtime
+                self.dirty   = True
         if x_stats.lasttime is not None:
             if self.lasttime is None or x_stats.lasttime >= self.lasttime:
                 self.lasttime = x_stats.lasttime
@@ -65,6 +72,8 @@ class ScalarStats(object):
         self.count   += x_stats.count
         self.wsum    += x_stats.wsum
         self.sumtime += x_stats.sumtime
+        if x_stats.count:
+            self.dirty = True
 
     def addHiLo(self, val, ts):
         """Include a scalar value in my highs and lows.
@@ -75,9 +84,11 @@ class ScalarStats(object):
             if self.min is None or val < self.min:
                 self.min     = val
                 self.mintime = ts
+                self.dirty   = True
             if self.max is None or val > self.max:
                 self.max     = val
                 self.maxtime = ts
+                self.dirty   = True
             if self.lasttime is None or ts >= self.lasttime:
                 self.last    = val
                 self.lasttime= ts
@@ -89,6 +100,7 @@ class ScalarStats(object):
             self.count   += 1
             self.wsum    += val * weight
             self.sumtime += weight
+            self.dirty    = True
         
     @property
     def avg(self):
@@ -98,7 +110,9 @@ class VecStats(object):
     """Accumulates statistics for a vector value.
      
     Property 'last' is the last non-None value seen. It is a two-way tuple (mag, dir).
-    Property 'lasttime' is the time it was seen. """
+    Property 'lasttime' is the time it was seen. 
+    
+    Attribute 'dirty' is the same as for ScalarStats."""
 
     default_init = (None, None, None, None, 
                     0.0, 0, 0.0, 0, None, 0.0, 0.0, 0, 0.0, 0.0)
@@ -116,6 +130,8 @@ class VecStats(object):
          self.max_dir, self.xsum, self.ysum, 
          self.dirsumtime, self.squaresum, 
          self.wsquaresum) = stats_tuple if stats_tuple else VecStats.default_init
+        # Default statistics have never been stored
+        self.dirty = not stats_tuple
         
     def getStatsTuple(self):
         """Return a stats-tuple. That is, a tuple containing the gathered statistics."""
@@ -132,11 +148,13 @@ class VecStats(object):
             if self.min is None or x_stats.min < self.min:
                 self.min     = x_stats.min
                 self.mintime = x_stats.mintime
+                self.dirty   = True
         if x_stats.max is not None:
             if self.max is None or x_stats.max > self.max:
                 self.max     = x_stats.max
                 self.maxtime = x_stats.maxtime
                 self.max_dir = x_stats.max_dir
+                self.dirty   = True
         if x_stats.lasttime is not None:
             if self.lasttime is None or x_stats.lasttime >= self.lasttime:
                 self.lasttime = x_stats.lasttime
@@ -153,6 +171,8 @@ class VecStats(object):
         self.dirsumtime += x_stats.dirsumtime
         self.squaresum  += x_stats.squaresum
         self.wsquaresum += x_stats.wsquaresum
+        if x_stats.count:
+            self.dirty = True
          
     def addHiLo(self, val, ts):
         """Include a vector value in my highs and lows.
@@ -164,10 +184,12 @@ class VecStats(object):
             if self.min is None or speed < self.min:
                 self.min = speed
                 self.mintime = ts
+                self.dirty = True
             if self.max is None or speed > self.max:
                 self.max = speed
                 self.maxtime = ts
                 self.max_dir = dirN
+                self.dirty = True
             if self.lasttime is None or ts >= self.lasttime:
                 self.last    = (speed, dirN)
                 self.lasttime= ts
@@ -188,6 +210,7 @@ class VecStats(object):
                 self.xsum += weight * speed * math.cos(math.radians(90.0 - dirN))
                 self.ysum += weight * speed * math.sin(math.radians(90.0 - dirN))
                 self.dirsumtime += weight
+            self.dirty = True
              
     @property
     def avg(self):
@@ -351,10 +374,12 @@ class Accum(dict):
             if self[obs_type].min is None or x_stats.min < self[obs_type].min:
                 self[obs_type].min     = x_stats.min
                 self[obs_type].mintime = x_stats.mintime
+                self[obs_type].dirty   = True
         if x_stats.avg is not None:
             if self[obs_type].max is None or x_stats.avg > self[obs_type].max:
                 self[obs_type].max     = x_stats.avg
                 self[obs_type].maxtime = x_accumulator.timespan.stop
+                self[obs_type].dirty   = True
         if x_stats.lasttime is not None:
             if self[obs_type].lasttime is None or x_stats.lasttime >= self[obs_type].lasttime:
                 self[obs_type].lasttime = x_stats.lasttime
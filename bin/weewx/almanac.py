@@ -14,6 +14,7 @@ import math
 import copy
 
 import weeutil.Moon
+import weeutil.weeutil
 import weewx.units
 
 # If the user has installed ephem, use it. Otherwise, fall back to the weeutil algorithms:
@@ -232,7 +233,7 @@ class Almanac(object):
         else:
             
             # No ephem package. Use the weeutil algorithms, which supply a minimum of functionality
-            (sunrise_utc_h, sunset_utc_h) = weeutil.Sun.sunRiseSet(y, m, d, self.lon, self.lat)
+            (sunrise_utc_h, sunset_utc_h) = weeutil.weeutil.getSunRiseSet(y, m, d, self.lon, self.lat)
             sunrise_ts = weeutil.weeutil.utc_to_ts(y, m, d, sunrise_utc_h)
             sunset_ts  = weeutil.weeutil.utc_to_ts(y, m, d, sunset_utc_h)
             self._sunrise = weewx.units.ValueHelper((sunrise_ts, "unix_epoch", "group_time"), 
@@ -440,6 +441,66 @@ def djd_to_timestamp(djd):
     """Convert from number of days since 12/31/1899 12:00 UTC ("Dublin Julian Days") to unix time stamp"""
     return (djd-25567.5) * 86400.0
 
+# Memoized positions of the sun, keyed by (lat, lon, altitude, minute). These
+# are shared by everything that calls get_sun_position(), such as the maximum
+# solar radiation calculated for every LOOP packet.
+_sun_positions = {}
+MAX_SUN_POSITIONS = 2880
+
+def get_sun_position(time_ts, lat, lon, altitude=None):
+    """Return the position of the sun, as seen by an observer.
+
+    The position is calculated once for the start of each minute and memoized.
+    The position at any time in between is interpolated linearly from the
+    positions at the two minutes that bracket it. While the sun is more than 2
+    degrees above the horizon, this is within an arc second of the exact
+    elevation. Near and below the horizon, where the refraction changes
+    quickly, it can be off by more than a minute of arc.
+
+    time_ts: The time in unix epoch time.
+
+    lat, lon: Observer's location in degrees.
+
+    altitude: Observer's elevation in meters. [Optional. Default is 0]
+
+    returns: A tuple (alt, earth_distance), with the elevation of the sun above
+    the horizon in degrees, and its distance from the earth in AU. Raises
+    AttributeError if the module 'ephem' is not installed.
+    """
+    if 'ephem' not in sys.modules:
+        raise AttributeError("Unknown attribute sun")
+    if altitude is None:
+        altitude = 0.0
+    minute_ts = int(time_ts // 60) * 60
+    (alt0, dist0) = _get_minute_position(minute_ts, lat, lon, altitude)
+    if time_ts == minute_ts:
+        return (alt0, dist0)
+    (alt1, dist1) = _get_minute_position(minute_ts + 60, lat, lon, altitude)
+    frac = (time_ts - minute_ts) / 60.0
+    return (alt0 + frac * (alt1 - alt0), dist0 + frac * (dist1 - dist0))
+
+def _get_minute_position(minute_ts, lat, lon, altitude):
+    key = (lat, lon, altitude, minute_ts)
+    position = _sun_positions.get(key)
+    if position is None:
+        if len(_sun_positions) >= MAX_SUN_POSITIONS:
+            _sun_positions.clear()
+        # Use the same observer as an Almanac with the default temperature,
+        # pressure and horizon, so the results agree with $almanac.sun.alt
+        observer           = ephem.Observer()
+        observer.lat       = math.radians(lat)
+        observer.long      = math.radians(lon)
+        observer.elevation = altitude
+        observer.horizon   = 0.0
+        observer.temp      = 15.0
+        observer.pressure  = 1010.0
+        observer.date      = timestamp_to_djd(minute_ts)
+        sun = ephem.Sun()
+        sun.compute(observer)
+        position = (math.degrees(sun.alt), sun.earth_distance)
+        _sun_positions[key] = position
+    return position
+
 if __name__ == '__main__':
     
     def dummy_no_ephem():
@@ -14,6 +14,7 @@ Configuration Options
   stale_age = s                      # age in seconds
   search_list = a, b, c
   search_list_extensions = d, e, f
+  template_cache_dir = dirname         # relative to WEEWX_ROOT
 
 The strings YYYY and MM will be replaced if they appear in the filename.
 
@@ -27,6 +28,13 @@ class in the list must be derived from SearchList.
 Generally it is better to extend by using search_list_extensions rather than
 search_list, just in case the default search list changes.
 
+Compiled templates are kept for the life of the process, and recompiled only
+when the template file changes. If template_cache_dir is given, the Python code
+generated from each template is also saved there, so that other processes,
+such as wee_reports, can skip the compilation as well. When the reports are run
+in worker processes, the templates are compiled before the workers are started,
+so the workers inherit them.
+
 Example:
 
 [CheetahGenerator]
@@ -56,6 +64,9 @@ Example:
 """
 
 from __future__ import with_statement
+import glob
+import hashlib
+import imp
 import os.path
 import syslog
 import time
@@ -99,6 +110,105 @@ def logerr(msg):
 def logcrt(msg):
     logmsg(syslog.LOG_CRIT, msg)
 
+# Compiled template classes, keyed by the path of the template. Each entry
+# holds the modification time of the file the class was compiled from.
+_template_cache = {}
+
+def get_template_class(template, cache_dir=None):
+    """Return the compiled class of a template.
+
+    Compiling a template into Python is far more expensive than filling it in,
+    so classes are kept for the life of the process and only recompiled when
+    the template file changes.
+
+    template: The path of the template file.
+
+    cache_dir: A directory in which the generated Python is saved. [Optional.
+    If not given, compiled templates are kept in memory only.]
+    """
+    mtime = os.path.getmtime(template)
+    if template in _template_cache and _template_cache[template][0] == mtime:
+        return _template_cache[template][1]
+    template_class = None
+    if cache_dir:
+        try:
+            template_class = _load_template_class(template, mtime, cache_dir)
+        except (IOError, OSError, ImportError, SyntaxError), e:
+            logerr("Unable to use template cache %s: %s" % (cache_dir, e))
+    if template_class is None:
+        template_class = Cheetah.Template.Template.compile(file=template)
+    _template_cache[template] = (mtime, template_class)
+    return template_class
+
+def compile_templates(config_dict, skin_dict):
+    """Compile the templates of a report ahead of time, without generating
+    anything. They are kept as get_template_class() keeps them.
+
+    returns: The number of templates compiled, or found already compiled."""
+    # Options are in [CheetahGenerator], or [FileGenerator] for backward
+    # compatibility, as with CheetahGenerator.run()
+    section_name = "CheetahGenerator"
+    if "FileGenerator" in skin_dict and "CheetahGenerator" not in skin_dict:
+        section_name = "FileGenerator"
+    if section_name not in skin_dict:
+        return 0
+    cache_dir = skin_dict[section_name].get('template_cache_dir')
+    if cache_dir:
+        cache_dir = os.path.join(config_dict['WEEWX_ROOT'], cache_dir)
+    return _compile_section(config_dict, skin_dict[section_name], cache_dir)
+
+def _compile_section(config_dict, section, cache_dir):
+    ncompiled = 0
+    for subsection in section.sections:
+        ncompiled += _compile_section(config_dict, section[subsection], cache_dir)
+    if 'template' in section:
+        report_dict = weeutil.weeutil.accumulateLeaves(section)
+        # The same path as CheetahGenerator._prepGen() uses
+        template = os.path.join(config_dict['WEEWX_ROOT'],
+                                config_dict['StdReport']['SKIN_ROOT'],
+                                report_dict['skin'],
+                                report_dict['template']).encode('ascii', 'ignore')
+        try:
+            get_template_class(template, cache_dir)
+            ncompiled += 1
+        except Exception, e:
+            # The report itself will run into it again, and log it as usual
+            logdbg("Unable to compile template %s ahead of time: %s" % (template, e))
+    return ncompiled
+
+def _load_template_class(template, mtime, cache_dir):
+    """Load the compiled class of a template from the cache directory,
+    compiling it into a module there first if need be."""
+    # The module name is made from the path of the template, then from
+    # everything the generated code depends on.
+    path_key = hashlib.md5(template).hexdigest()[:16]
+    code_key = hashlib.md5("%r %s" % (mtime, Cheetah.Version)).hexdigest()[:16]
+    module_name = "tmpl_%s_%s" % (path_key, code_key)
+    module_path = os.path.join(cache_dir, module_name + '.py')
+    if not os.path.exists(module_path):
+        source = Cheetah.Template.Template.compile(file=template, returnAClass=False,
+                                                   moduleName=module_name,
+                                                   className=module_name)
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        # Remove anything compiled from earlier versions of the template. Leave
+        # alone what another process may be writing or loading at the same time:
+        # this very module, and temporary files.
+        for stale_path in glob.glob(os.path.join(cache_dir, "tmpl_%s_*" % path_key)):
+            if stale_path != module_path and not stale_path.endswith('.tmp'):
+                try:
+                    os.remove(stale_path)
+                except OSError:
+                    # Another process got to it first
+                    pass
+        # Write to a temporary file, so another process never loads half a module
+        tmp_path = "%s.%d.tmp" % (module_path, os.getpid())
+        with open(tmp_path, 'w') as module_file:
+            module_file.write(source)
+        os.rename(tmp_path, module_path)
+        logdbg("Compiled template %s to %s" % (template, module_path))
+    return getattr(imp.load_source(module_name, module_path), module_name)
+
 # =============================================================================
 # CheetahGenerator
 # =============================================================================
@@ -151,6 +261,12 @@ class CheetahGenerator(weewx.reportengine.ReportGenerator):
         # determine how much logging is desired
         log_success = to_bool(gen_dict[section_name].get('log_success', True))
 
+        # where compiled templates are saved, if anywhere
+        self.template_cache_dir = gen_dict[section_name].get('template_cache_dir')
+        if self.template_cache_dir:
+            self.template_cache_dir = os.path.join(self.config_dict['WEEWX_ROOT'],
+                                                   self.template_cache_dir)
+
         # configure the search list extensions
         self.initExtensions(gen_dict[section_name])
 
@@ -321,8 +437,8 @@ class CheetahGenerator(weewx.reportengine.ReportGenerator):
             tmpname = _fullname + '.tmp'
             
             try:
-                compiled_template = Cheetah.Template.Template(
-                    file=template,
+                template_class = get_template_class(template, self.template_cache_dir)
+                compiled_template = template_class(
                     searchList=searchList,
                     filter=encoding,
                     filtersLib=weewx.cheetahgenerator)
@@ -528,7 +644,8 @@ class Current(SearchList):
     def get_extension_list(self, timespan, db_lookup):
         record_binder = weewx.tags.RecordBinder(db_lookup, timespan.stop,
                                                 self.generator.formatter, self.generator.converter, 
-                                                record=self.generator.record)
+                                                record=self.generator.record,
+                                                record_cache=self.generator.record_cache)
         return [record_binder]
     
 class Stats(SearchList):
@@ -548,6 +665,8 @@ class Stats(SearchList):
             timespan.stop,
             formatter=self.generator.formatter,
             converter=self.generator.converter,
+            aggregate_cache=self.generator.aggregate_cache,
+            record_cache=self.generator.record_cache,
             week_start=self.generator.stn_info.week_start,
             rain_year_start=self.generator.stn_info.rain_year_start,
             trend=trend_dict,
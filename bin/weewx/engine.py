@@ -6,9 +6,14 @@
 
 """Main engine for the weewx weather system."""
 
+from __future__ import with_statement
+
 # Python imports
+import collections
 import gc
+import json
 import locale
+import math
 import os
 import os.path
 import platform
@@ -79,6 +84,16 @@ class StdEngine(object):
 
         # Another hook for after the services load.
         self.postLoadServices(config_dict)
+
+        # Fuse the services that filter LOOP packets, if requested:
+        if to_bool(config_dict['Engine'].get('fuse_services', False)):
+            self.fuseServices()
+
+        # Time the callbacks of the services, if requested. This comes last,
+        # so the callbacks are timed as they will be called.
+        self.service_stats = None
+        if to_bool(config_dict['Engine'].get('service_stats', False)):
+            self.timeServices(config_dict)
         
     def setupStation(self, config_dict):
         """Set up the weather station hardware."""
@@ -150,6 +165,28 @@ class StdEngine(object):
     def postLoadServices(self, config_dict):
         pass
 
+    def fuseServices(self):
+        """Replace the LOOP packet callbacks of StdConvert, StdCalibrate, StdQC
+        and StdWXCalculate with a single callback that does the same work.
+        Only services whose callbacks follow each other are fused."""
+        import weewx.pipeline
+        if weewx.NEW_LOOP_PACKET in self.callbacks:
+            self.callbacks[weewx.NEW_LOOP_PACKET] = \
+                weewx.pipeline.fuse_callbacks(self.callbacks[weewx.NEW_LOOP_PACKET])
+
+    def timeServices(self, config_dict):
+        """Have every callback record its wall time, and report the
+        statistics periodically."""
+        stats_file = config_dict['Engine'].get('service_stats_file')
+        if stats_file:
+            stats_file = os.path.join(config_dict.get('WEEWX_ROOT', ''), stats_file)
+        self.service_stats = ServiceStats(
+            to_int(config_dict['Engine'].get('service_stats_interval', 3600)), stats_file)
+        for event_type in self.callbacks:
+            self.callbacks[event_type] = [self.service_stats.wrap(event_type, callback)
+                                          for callback in self.callbacks[event_type]]
+        syslog.syslog(syslog.LOG_INFO, "engine: Timing the callbacks of the services")
+
     def run(self):
         """Main execution entry point."""
         
@@ -209,6 +246,10 @@ class StdEngine(object):
     def bind(self, event_type, callback):
         """Binds an event to a callback function."""
 
+        # If the callbacks are being timed, time this one as well:
+        if getattr(self, 'service_stats', None) is not None:
+            callback = self.service_stats.wrap(event_type, callback)
+
         # Each event type has a list of callback functions to be called.
         # If we have not seen the event type yet, then create an empty list,
         # otherwise append to the existing list:
@@ -245,6 +286,9 @@ class StdEngine(object):
         except AttributeError:
             pass
 
+        if getattr(self, 'service_stats', None) is not None:
+            self.service_stats.report()
+
         try:
             # Close the console:
             self.console.closePort()
@@ -264,6 +308,130 @@ class StdEngine(object):
         except NotImplementedError:
             return int(time.time() + 0.5)
 
+#==============================================================================
+#                    Class ServiceStats
+#==============================================================================
+
+class ServiceStats(object):
+    """Statistics of the wall time taken by the callbacks bound to each event
+    type. They are logged, and optionally written to a file in JSON format,
+    every report_interval seconds."""
+
+    # How many of the latest times of a callback are kept for the percentiles
+    max_samples = 1000
+
+    def __init__(self, report_interval=3600, stats_file=None):
+        self.report_interval = report_interval
+        self.stats_file = stats_file
+        # Key is (event type, callback name), value is a CallbackStats
+        self.callback_stats = {}
+        self.last_report = time.time()
+
+    def wrap(self, event_type, callback):
+        """Return a callback that calls the given one, and records its time."""
+        name = _get_callback_name(callback)
+        key = (event_type.__name__, name)
+        if key not in self.callback_stats:
+            self.callback_stats[key] = CallbackStats(self.max_samples)
+        return TimedCallback(callback, self.callback_stats[key], self)
+
+    def check_report(self, now):
+        if now - self.last_report >= self.report_interval:
+            self.report(now)
+
+    def report(self, now=None):
+        """Log the statistics, and write them to the file, if there is one."""
+        self.last_report = now if now is not None else time.time()
+        stats_list = []
+        for (event_name, name) in sorted(self.callback_stats):
+            stats = self.callback_stats[(event_name, name)]
+            if not stats.count:
+                continue
+            stats_dict = stats.get_stats()
+            syslog.syslog(syslog.LOG_INFO,
+                          "engine: %s %s: %d calls, %.3f s; mean %.1f ms, "
+                          "p50 %.1f ms, p95 %.1f ms, p99 %.1f ms, max %.1f ms"
+                          % (event_name, name, stats_dict['count'], stats_dict['total'],
+                             1000.0 * stats_dict['mean'], 1000.0 * stats_dict['p50'],
+                             1000.0 * stats_dict['p95'], 1000.0 * stats_dict['p99'],
+                             1000.0 * stats_dict['max']))
+            stats_dict['event'] = event_name
+            stats_dict['callback'] = name
+            stats_list.append(stats_dict)
+        if self.stats_file:
+            self._write_file({'time': int(self.last_report), 'callbacks': stats_list})
+
+    def _write_file(self, data):
+        # Write to a temporary file, then rename it, so readers never see a
+        # partial file
+        tmp_file = self.stats_file + '.tmp'
+        try:
+            with open(tmp_file, 'w') as fd:
+                json.dump(data, fd, indent=2, sort_keys=True)
+            os.rename(tmp_file, self.stats_file)
+        except (IOError, OSError), e:
+            syslog.syslog(syslog.LOG_ERR, "engine: Unable to write service statistics to %s: %s"
+                          % (self.stats_file, e))
+
+class CallbackStats(object):
+    """The number of calls and wall time of a callback, and its latest times."""
+
+    def __init__(self, max_samples):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = collections.deque(maxlen=max_samples)
+
+    def add(self, elapsed):
+        self.count += 1
+        self.total += elapsed
+        if elapsed > self.max:
+            self.max = elapsed
+        self.samples.append(elapsed)
+
+    def get_stats(self):
+        """Return the statistics as a dictionary. Times are in seconds. The
+        percentiles are of the latest times only."""
+        samples = sorted(self.samples)
+        return {'count' : self.count,
+                'total' : self.total,
+                'mean'  : self.total / self.count if self.count else None,
+                'max'   : self.max,
+                'p50'   : _percentile(samples, 50),
+                'p95'   : _percentile(samples, 95),
+                'p99'   : _percentile(samples, 99)}
+
+class TimedCallback(object):
+    """A callback that records the wall time of another."""
+
+    def __init__(self, callback, stats, service_stats):
+        self.callback = callback
+        self.stats = stats
+        self.service_stats = service_stats
+
+    def __call__(self, event):
+        t0 = time.time()
+        try:
+            self.callback(event)
+        finally:
+            t1 = time.time()
+            self.stats.add(t1 - t0)
+            self.service_stats.check_report(t1)
+
+def _get_callback_name(callback):
+    """Return a name for a callback, such as 'weewx.engine.StdArchive.new_loop_packet'."""
+    if getattr(callback, 'im_self', None) is not None:
+        cls = callback.im_self.__class__
+        return "%s.%s.%s" % (cls.__module__, cls.__name__, callback.__name__)
+    return "%s.%s" % (getattr(callback, '__module__', None), getattr(callback, '__name__', repr(callback)))
+
+def _percentile(sorted_samples, percent):
+    """Return a percentile of a sorted list, using the nearest rank."""
+    if not sorted_samples:
+        return None
+    rank = int(math.ceil(percent / 100.0 * len(sorted_samples)))
+    return sorted_samples[max(rank, 1) - 1]
+
 #==============================================================================
 #                    Class StdService
 #==============================================================================
@@ -9,6 +9,7 @@ Needs to be refactored into smaller functions."""
 from __future__ import with_statement
 import time
 import datetime
+import multiprocessing
 import syslog
 import os.path
 
@@ -56,6 +57,47 @@ class ImageGenerator(weewx.reportengine.ReportGenerator):
         t1 = time.time()
         ngen = 0
 
+        # The plots are rendered in a pool of worker processes, if so asked
+        pool = self._getPool()
+        results = []
+
+        try:
+            self._genPlots(gen_ts, pool, results)
+            for result in results:
+                if pool is not None:
+                    result = result.get()
+                (img_file, elapsed, error) = result
+                if error is None:
+                    ngen += 1
+                    syslog.syslog(syslog.LOG_DEBUG, "imagegenerator: Rendered '%s' in %.2f seconds" % (img_file, elapsed))
+                else:
+                    syslog.syslog(syslog.LOG_CRIT, "imagegenerator: Unable to save to file '%s' %s:" % (img_file, error))
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+        t2 = time.time()
+
+        if self.log_success:
+            syslog.syslog(syslog.LOG_INFO, "imagegenerator: Generated %d images for %s in %.2f seconds" % (ngen, self.skin_dict['REPORT_NAME'], t2 - t1))
+
+    def _getPool(self):
+        """Return a pool of worker processes in which to render the plots, or
+        None if they are to be rendered in this process."""
+        image_workers = to_int(self.image_dict.get('image_workers', 1))
+        if image_workers <= 1:
+            return None
+        if multiprocessing.current_process().daemon:
+            # Workers of the report engine cannot have workers of their own
+            syslog.syslog(syslog.LOG_DEBUG, "imagegenerator: Running in a report worker. Rendering images in it.")
+            return None
+        return multiprocessing.Pool(image_workers)
+
+    def _genPlots(self, gen_ts, pool, results):
+        """Fetch the data of each plot, then render it, or hand it to the pool
+        to be rendered. The results of render_plot() are appended to
+        'results', as instances of AsyncResult if a pool is given."""
+
         # Loop over each time span class (day, week, month, etc.):
         for timespan in self.image_dict.sections :
             
@@ -144,9 +186,15 @@ class ImageGenerator(weewx.reportengine.ReportGenerator):
                     # Now its time to find and hit the database:
                     binding = line_options['data_binding']
                     archive = self.db_binder.get_manager(binding)
-                    (start_vec_t, stop_vec_t, data_vec_t) = \
-                            archive.getSqlVectors((minstamp, maxstamp), var_type, aggregate_type=aggregate_type,
-                                                  aggregate_interval=aggregate_interval)
+                    if self.vector_cache is not None:
+                        (start_vec_t, stop_vec_t, data_vec_t) = \
+                                self.vector_cache.get_vectors(archive, (minstamp, maxstamp), var_type,
+                                                              aggregate_type=aggregate_type,
+                                                              aggregate_interval=aggregate_interval)
+                    else:
+                        (start_vec_t, stop_vec_t, data_vec_t) = \
+                                archive.getSqlVectors((minstamp, maxstamp), var_type, aggregate_type=aggregate_type,
+                                                      aggregate_interval=aggregate_interval)
 
                     if weewx.debug:
                         assert(len(start_vec_t) == len(stop_vec_t))
@@ -232,18 +280,27 @@ class ImageGenerator(weewx.reportengine.ReportGenerator):
                         gap_fraction  = gap_fraction))
 
                 # OK, the plot is ready. Render it onto an image
-                image = plot.render()
-                
-                try:
-                    # Now save the image
-                    image.save(img_file)
-                    ngen += 1
-                except IOError, e:
-                    syslog.syslog(syslog.LOG_CRIT, "imagegenerator: Unable to save to file '%s' %s:" % (img_file, e))
-        t2 = time.time()
+                if pool is not None:
+                    # The plot, with its data, is sent to a worker. Meanwhile,
+                    # the data for the next plot is fetched.
+                    results.append(pool.apply_async(render_plot, (plot, img_file)))
+                else:
+                    results.append(render_plot(plot, img_file))
 
-        if self.log_success:
-            syslog.syslog(syslog.LOG_INFO, "imagegenerator: Generated %d images for %s in %.2f seconds" % (ngen, self.skin_dict['REPORT_NAME'], t2 - t1))
+def render_plot(plot, img_file):
+    """Render a plot and save it to a file. When images are rendered in worker
+    processes, this is what a worker runs.
+
+    Returns: A tuple (img_file, elapsed time in seconds, error message). The
+    error message is None if the image was saved."""
+    t1 = time.time()
+    image = plot.render()
+    try:
+        # Now save the image
+        image.save(img_file)
+    except IOError, e:
+        return (img_file, time.time() - t1, str(e))
+    return (img_file, time.time() - t1, None)
 
 def skipThisPlot(time_ts, aggregate_interval, img_file):
     """A plot can be skipped if it was generated recently and has not changed.
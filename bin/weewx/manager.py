@@ -5,12 +5,21 @@
 #
 """Classes and functions for interfacing with a weewx archive."""
 from __future__ import with_statement
+import bisect
 import math
+import multiprocessing
 import syslog
 import sys
 import datetime
 import time
 
+# If the user has installed numpy, use it to aggregate wind vectors. Otherwise,
+# fall back to pure Python:
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 import weewx.accum
 from weewx.units import ValueTuple
 import weewx.units
@@ -66,6 +75,10 @@ class Manager(object):
 
         self.connection = connection
         self.table_name = table_name
+        # The database dictionary, if known. It is set by open() and open_with_create().
+        self.database_dict = None
+        # Cache of SQL INSERT statements, keyed by the set of keys in a record
+        self._insert_cache = {}
 
         # Now get the SQL types. 
         try:
@@ -102,6 +115,7 @@ class Manager(object):
 
         # Create an instance of the right class and return it:
         dbmanager = cls(connection, table_name)
+        dbmanager.database_dict = database_dict
         return dbmanager
     
     @classmethod
@@ -138,6 +152,7 @@ class Manager(object):
 
         # Create an instance of the right class and return it:
         dbmanager = cls(connection, table_name=table_name, schema=schema)
+        dbmanager.database_dict = database_dict
         return dbmanager
     
     @property
@@ -223,12 +238,22 @@ class Manager(object):
         database.
         
         log_level: What syslog level to use for any logging. Default is syslog.LOG_NOTICE.
+        
+        A collection of records is added in batches of batch_size records. Within
+        a batch, records with the same set of keys are inserted with a single
+        executemany(). Instead of a log entry for every record, a single summary
+        entry is made.
         """
         
         # Determine if record_obj is just a single dictionary instance
-        # (in which case it will have method 'keys'). If so, wrap it in
-        # something iterable (a list):
-        record_list = [record_obj] if hasattr(record_obj, 'keys') else record_obj
+        # (in which case it will have method 'keys'). If not, it is a
+        # collection of records. Add them in bulk.
+        if not hasattr(record_obj, 'keys'):
+            self._addBulk(record_obj, log_level)
+            return
+        
+        # Wrap the single record in something iterable (a list):
+        record_list = [record_obj]
         
         min_ts = None
         max_ts = 0
@@ -269,15 +294,119 @@ class Manager(object):
         # system as the records already in the database:
         self._check_unit_system(record['usUnits'])
 
+        (key_list, sql_insert_stmt) = self._getInsertStatement(frozenset(record))
+        # Get the values in the same order as the keys:
+        value_list = [record[k] for k in key_list]
+        cursor.execute(sql_insert_stmt, value_list)
+        syslog.syslog(log_level, "manager: Added record %s to database '%s'" % 
+                      (weeutil.weeutil.timestamp_to_string(record['dateTime']),
+                       self.database_name))
+
+    def _addBulk(self, record_iterable, log_level):
+        """Internal function for adding a collection of records to the database.
+        All records are added in a single transaction."""
+        
+        min_ts = None
+        max_ts = 0
+        nrecs = 0
+        with weedb.Transaction(self.connection) as cursor:
+            for batch in _genBatches(record_iterable, self.batch_size):
+                for record in self._addRecordBatch(batch, cursor):
+                    min_ts = min(min_ts, record['dateTime']) if min_ts is not None else record['dateTime']
+                    max_ts = max(max_ts, record['dateTime'])
+                    nrecs += 1
+
+        if nrecs:
+            # Update the cached timestamps. This has to sit outside the
+            # transaction context, in case an exception occurs.
+            self.first_timestamp = min(min_ts, self.first_timestamp) if self.first_timestamp is not None else min_ts
+            self.last_timestamp  = max(max_ts, self.last_timestamp)
+            syslog.syslog(log_level, "manager: Added %d records (%s to %s) to database '%s'" % 
+                          (nrecs, weeutil.weeutil.timestamp_to_string(min_ts),
+                           weeutil.weeutil.timestamp_to_string(max_ts), self.database_name))
+
+    def _addRecordBatch(self, record_list, cursor):
+        """Internal function for adding a batch of records to the database.
+        
+        Records that share the same set of keys are inserted with a single
+        executemany().
+        
+        returns: A list of the records that were added, in their original order."""
+        
+        for record in record_list:
+            if record['dateTime'] is None:
+                syslog.syslog(syslog.LOG_ERR,
+                              "manager: Archive record with null time encountered")
+                raise weewx.ViolatedPrecondition("Manager record with null time encountered.")
+            # Check to make sure the incoming record is in the same unit
+            # system as the records already in the database:
+            self._check_unit_system(record['usUnits'])
+
+        # A single duplicate would cause the whole executemany() to fail, so
+        # weed out records whose timestamp is already in use.
+        used_ts = self._getTimestampSet(record_list, cursor)
+        candidate_list = []
+        for record in record_list:
+            if record['dateTime'] in used_ts:
+                syslog.syslog(syslog.LOG_ERR, "manager: "
+                              "Unable to add record %s to database '%s': %s" %
+                              (weeutil.weeutil.timestamp_to_string(record['dateTime']),
+                               self.database_name, "duplicate timestamp"))
+            else:
+                used_ts.add(record['dateTime'])
+                candidate_list.append(record)
+
+        # Group the records by the set of keys they carry
+        group_dict = {}
+        for record in candidate_list:
+            group_dict.setdefault(frozenset(record), []).append(record)
+
+        failed_ts = set()
+        for key_set in group_dict:
+            (key_list, sql_insert_stmt) = self._getInsertStatement(key_set)
+            group = group_dict[key_set]
+            try:
+                cursor.executemany(sql_insert_stmt, [[record[k] for k in key_list] for record in group])
+            except (weedb.IntegrityError, weedb.OperationalError), e:
+                # Something went wrong part way through. Figure out which records
+                # made it in, then try the rest one at a time.
+                syslog.syslog(syslog.LOG_DEBUG, "manager: "
+                              "Bulk insert into database '%s' failed: %s. Adding records one at a time." %
+                              (self.database_name, e))
+                added_ts = self._getTimestampSet(group, cursor)
+                for record in group:
+                    if record['dateTime'] in added_ts:
+                        continue
+                    try:
+                        cursor.execute(sql_insert_stmt, [record[k] for k in key_list])
+                    except (weedb.IntegrityError, weedb.OperationalError), e:
+                        failed_ts.add(record['dateTime'])
+                        syslog.syslog(syslog.LOG_ERR, "manager: "
+                                      "Unable to add record %s to database '%s': %s" %
+                                      (weeutil.weeutil.timestamp_to_string(record['dateTime']), 
+                                       self.database_name, e))
+
+        return [record for record in candidate_list if record['dateTime'] not in failed_ts]
+
+    def _getInsertStatement(self, record_key_set):
+        """Return the list of keys to be inserted and the SQL INSERT statement
+        for a record with a given set of keys. Results are cached.
+        
+        record_key_set: A frozenset of the keys in a record.
+        
+        returns: A 2-way tuple (key_list, sql_insert_stmt)"""
+        
+        try:
+            return self._insert_cache[record_key_set]
+        except KeyError:
+            pass
+
         # Only data types that appear in the database schema can be
         # inserted. To find them, form the intersection between the
         # set of all record keys and the set of all sql keys
-        record_key_set = set(record.keys())
         insert_key_set = record_key_set.intersection(self.sqlkeys)
         # Convert to an ordered list:
         key_list = list(insert_key_set)
-        # Get the values in the same order:
-        value_list = [record[k] for k in key_list]
         
         # This will a string of sql types, separated by commas. Because
         # some of the weewx sql keys (notably 'interval') are reserved
@@ -288,15 +417,22 @@ class Manager(object):
         q_str = ','.join('?' * len(key_list))
         # Form the SQL insert statement:
         sql_insert_stmt = "INSERT INTO %s (%s) VALUES (%s)" % (self.table_name, k_str, q_str) 
-        cursor.execute(sql_insert_stmt, value_list)
-        syslog.syslog(log_level, "manager: Added record %s to database '%s'" % 
-                      (weeutil.weeutil.timestamp_to_string(record['dateTime']),
-                       self.database_name))
+        self._insert_cache[record_key_set] = (key_list, sql_insert_stmt)
+        return (key_list, sql_insert_stmt)
+
+    def _getTimestampSet(self, record_list, cursor):
+        """Return the set of timestamps already in the database that fall
+        within the range of timestamps of a list of records."""
+        min_ts = min(record['dateTime'] for record in record_list)
+        max_ts = max(record['dateTime'] for record in record_list)
+        cursor.execute("SELECT dateTime FROM %s WHERE dateTime >= ? AND dateTime <= ?" % self.table_name,
+                       (min_ts, max_ts))
+        return set(_row[0] for _row in cursor)
 
     def _updateHiLo(self, accumulator, cursor):
         pass
 
-    def genBatchRows(self, startstamp=None, stopstamp=None):
+    def genBatchRows(self, startstamp=None, stopstamp=None, columns=None):
         """Generator function that yields raw rows from the archive database
         with timestamps within an interval.
         
@@ -306,34 +442,44 @@ class Manager(object):
         stopstamp: Inclusive end of the interval in epoch time. If 'None', then
         end at last archive record.
         
+        columns: A list of the columns to be read. The first should be 'dateTime'.
+        [Optional. If not given, all columns are read.]
+        
         yields: A list with the data records"""
 
+        _columns = ', '.join(columns) if columns else '*'
         _cursor = self.connection.cursor()
         try:
             if startstamp is None:
                 if stopstamp is None:
-                    _gen = _cursor.execute("SELECT * FROM %s ORDER BY dateTime ASC" % self.table_name)
+                    _cursor.execute("SELECT %s FROM %s ORDER BY dateTime ASC" % (_columns, self.table_name))
                 else:
-                    _gen = _cursor.execute("SELECT * FROM %s WHERE dateTime <= ? ORDER BY dateTime ASC" % self.table_name, (stopstamp,))
+                    _cursor.execute("SELECT %s FROM %s WHERE dateTime <= ? ORDER BY dateTime ASC" % (_columns, self.table_name), 
+                                    (stopstamp,))
             else:
                 if stopstamp is None:
-                    _gen = _cursor.execute("SELECT * FROM %s WHERE dateTime > ? ORDER BY dateTime ASC" % self.table_name, (startstamp,))
+                    _cursor.execute("SELECT %s FROM %s WHERE dateTime > ? ORDER BY dateTime ASC" % (_columns, self.table_name), 
+                                    (startstamp,))
                 else:
-                    _gen = _cursor.execute("SELECT * FROM %s WHERE dateTime > ? AND dateTime <= ? ORDER BY dateTime ASC" % self.table_name,
-                                            (startstamp, stopstamp))
+                    _cursor.execute("SELECT %s FROM %s WHERE dateTime > ? AND dateTime <= ? ORDER BY dateTime ASC" % (_columns, self.table_name),
+                                    (startstamp, stopstamp))
                
             _last_time = 0
-            for _row in _gen:
-                # The following is to get around a bug in sqlite when all the
-                # tables are in one file:
-                if _row[0] <= _last_time:
-                    continue
-                _last_time = _row[0]
-                yield _row
+            while True:
+                _rows = _cursor.fetchmany(Manager.batch_size)
+                if not _rows:
+                    break
+                for _row in _rows:
+                    # The following is to get around a bug in sqlite when all the
+                    # tables are in one file:
+                    if _row[0] <= _last_time:
+                        continue
+                    _last_time = _row[0]
+                    yield _row
         finally:
             _cursor.close()
 
-    def genBatchRecords(self, startstamp=None, stopstamp=None):
+    def genBatchRecords(self, startstamp=None, stopstamp=None, obs_types=None):
         """Generator function that yields records with timestamps within an
         interval.
         
@@ -343,11 +489,20 @@ class Manager(object):
         stopstamp: Inclusive end of the interval in epoch time. If 'None', then
         end at last archive record.
         
+        obs_types: A list of the observation types to be included in the records.
+        Only those in the database are read, along with 'dateTime', 'usUnits' and
+        'interval'. [Optional. If not given, all types are read.]
+        
         yields: A dictionary where key is the observation type (eg, 'outTemp')
         and the value is the observation value"""
         
-        for _row in self.genBatchRows(startstamp, stopstamp):
-            yield dict(zip(self.sqlkeys, _row)) if _row else None
+        if obs_types is None:
+            _keys = self.sqlkeys
+        else:
+            _keys = ['dateTime', 'usUnits', 'interval'] + \
+                [_key for _key in self.sqlkeys if _key in obs_types and _key not in ('dateTime', 'usUnits', 'interval')]
+        for _row in self.genBatchRows(startstamp, stopstamp, None if obs_types is None else _keys):
+            yield dict(zip(_keys, _row)) if _row else None
         
     def getRecord(self, timestamp, max_delta=None):
         """Get a single archive record with a given epoch time stamp.
@@ -422,6 +577,19 @@ class Manager(object):
                 'lasttime': "SELECT MAX(dateTime) FROM %(table_name)s "\
                               "WHERE dateTime > %(start)s AND dateTime <= %(stop)s  AND %(obs_type)s IS NOT NULL"}
                             
+    # Aggregation types that _getSqlVectors can calculate for all aggregation
+    # intervals at once, using a GROUP BY query
+    group_by_types = ['sum', 'count', 'avg', 'max', 'min']
+
+    # Set to False to run a separate query for each aggregation interval
+    group_by_aggregation = True
+
+    # The number of records in each batch when adding a collection of records
+    batch_size = 1000
+
+    # Aggregation types that getAggregates can calculate together
+    batch_aggregates = ['sum', 'count', 'avg', 'max', 'min', 'mintime', 'maxtime']
+
     simple_sql = "SELECT %(aggregate_type)s(%(obs_type)s) FROM %(table_name)s "\
                    "WHERE dateTime > %(start)s AND dateTime <= %(stop)s AND %(obs_type)s IS NOT NULL"
                    
@@ -463,7 +631,139 @@ class Manager(object):
         (t, g) = weewx.units.getStandardUnitType(self.std_unit_system, obs_type, aggregate_type)
         # Form the value tuple and return it:
         return weewx.units.ValueTuple(_result, t, g)
-    
+
+    def getAggregates(self, timespan, obs_type, aggregate_types, **option_dict):
+        """Returns several aggregations of the same type over the same time period.
+        Those in batch_aggregates are calculated together, with one query for the
+        aggregates and another for the times of the extremes. Any others are left
+        to getAggregate().
+
+        aggregate_types: A list of the aggregation types to be done.
+
+        Other arguments are as for getAggregate().
+
+        returns: A dictionary of value tuples, keyed by aggregation type."""
+
+        _batch_list = [_agg for _agg in aggregate_types if _agg in Manager.batch_aggregates]
+        _results = {}
+        if _batch_list:
+            _value_dict = self._calc_aggregates(timespan, obs_type, _batch_list)
+            for _agg in _batch_list:
+                (t, g) = weewx.units.getStandardUnitType(self.std_unit_system, obs_type, _agg)
+                _results[_agg] = weewx.units.ValueTuple(_value_dict[_agg], t, g)
+        for _agg in aggregate_types:
+            if _agg not in _results:
+                _results[_agg] = self.getAggregate(timespan, obs_type, _agg, **option_dict)
+        return _results
+
+    def _calc_aggregates(self, timespan, obs_type, aggregate_types):
+        """Calculate a list of aggregation types out of batch_aggregates from the
+        archive table. The results are the same as from getAggregate().
+
+        returns: A dictionary of the aggregate values, keyed by aggregation type."""
+
+        # The times of the extremes need the extremes themselves:
+        _func_list = [_agg for _agg in ['sum', 'count', 'avg', 'max', 'min']
+                      if _agg in aggregate_types or _agg + 'time' in aggregate_types]
+        _interDict = {'obs_type'   : obs_type,
+                      'table_name' : self.table_name}
+        _value_dict = {}
+        if _func_list:
+            _row = self.getSql("SELECT %s FROM %%(table_name)s WHERE dateTime > ? AND dateTime <= ? "
+                               "AND %%(obs_type)s IS NOT NULL" % ', '.join("%s(%%(obs_type)s)" % _agg.upper()
+                                                                          for _agg in _func_list) % _interDict,
+                               timespan)
+            _value_dict = dict(zip(_func_list, _row if _row else len(_func_list) * (None,)))
+
+        # The time of the first record with each extreme:
+        _time_list = [_agg for _agg in ['mintime', 'maxtime']
+                      if _agg in aggregate_types and _value_dict[_agg[:3]] is not None]
+        if _time_list:
+            _row = self.getSql("SELECT %s FROM %%(table_name)s WHERE dateTime > ? AND dateTime <= ?"
+                               % ', '.join(len(_time_list) * ["MIN(CASE WHEN %(obs_type)s = ? THEN dateTime END)"])
+                               % _interDict,
+                               tuple(_value_dict[_agg[:3]] for _agg in _time_list) + tuple(timespan))
+            _value_dict.update(zip(_time_list, _row))
+        for _agg in ['mintime', 'maxtime']:
+            _value_dict.setdefault(_agg, None)
+        return _value_dict
+
+    def getSpanAggregates(self, span_list, obs_type, aggregate_types, **option_dict):
+        """Returns several aggregations of the same type over each of a list of time
+        periods, such as the days of a month. Those in batch_aggregates are calculated
+        for all the periods together, using GROUP BY queries. Any others are left to
+        getAggregate().
+
+        span_list: A list of instances of weeutil.Timespan, in order.
+
+        Other arguments are as for getAggregates().
+
+        returns: A list with a dictionary of value tuples for each period, keyed by
+        aggregation type."""
+
+        if not self.group_by_aggregation or not span_list:
+            return [self.getAggregates(_span, obs_type, aggregate_types, **option_dict)
+                    for _span in span_list]
+
+        _batch_list = [_agg for _agg in aggregate_types if _agg in Manager.batch_aggregates]
+        _value_list = self._calc_span_aggregates(span_list, obs_type, _batch_list) \
+            if _batch_list else len(span_list) * [{}]
+        _results = []
+        for (_span, _value_dict) in zip(span_list, _value_list):
+            _agg_dict = {}
+            for _agg in aggregate_types:
+                if _agg in _value_dict:
+                    (t, g) = weewx.units.getStandardUnitType(self.std_unit_system, obs_type, _agg)
+                    _agg_dict[_agg] = weewx.units.ValueTuple(_value_dict[_agg], t, g)
+                else:
+                    _agg_dict[_agg] = self.getAggregate(_span, obs_type, _agg, **option_dict)
+            _results.append(_agg_dict)
+        return _results
+
+    def _calc_span_aggregates(self, span_list, obs_type, aggregate_types):
+        """Calculate a list of aggregation types out of batch_aggregates from the
+        archive table, for each of a list of time periods. There is one GROUP BY
+        query for the aggregates and another for the times of the extremes. The
+        results are the same as from getAggregate().
+
+        returns: A list with a dictionary of the aggregate values for each period,
+        keyed by aggregation type."""
+
+        _func_list = [_agg for _agg in ['sum', 'count', 'avg', 'max', 'min']
+                      if _agg in aggregate_types or _agg + 'time' in aggregate_types]
+        _time_list = [_agg for _agg in ['mintime', 'maxtime'] if _agg in aggregate_types]
+        _interDict = {'obs_type'   : obs_type,
+                      'table_name' : self.table_name,
+                      'bucket'     : self._bucket_expression(span_list)}
+        _where_str = "WHERE dateTime > ? AND dateTime <= ? AND %(obs_type)s IS NOT NULL" % _interDict
+        _timespan = (span_list[0].start, span_list[-1].stop)
+
+        # Each period is keyed by its start. Periods without any records do not show
+        # up in the results.
+        _results = dict()
+        if _func_list:
+            for _row in self.genSql("SELECT %%(bucket)s AS bucket, %s FROM %%(table_name)s %s GROUP BY bucket"
+                                    % (', '.join("%s(%%(obs_type)s)" % _agg.upper() for _agg in _func_list), _where_str)
+                                    % _interDict, _timespan):
+                if _row[0] is not None:
+                    _results[int(_row[0])] = dict(zip(_func_list, _row[1:]))
+        if _time_list:
+            # Join the records to the extremes of their periods, and take the time of the
+            # first to equal each:
+            _sql_str = "SELECT a.bucket, %s FROM "\
+                "(SELECT %%(bucket)s AS bucket, dateTime, %%(obs_type)s AS obs FROM %%(table_name)s %s) AS a "\
+                "JOIN (SELECT %%(bucket)s AS bucket, MIN(%%(obs_type)s) AS ext_min, MAX(%%(obs_type)s) AS ext_max "\
+                "FROM %%(table_name)s %s GROUP BY bucket) AS e ON a.bucket = e.bucket GROUP BY a.bucket" \
+                % (', '.join("MIN(CASE WHEN a.obs = e.ext_%s THEN a.dateTime END)" % _agg[:3] for _agg in _time_list),
+                   _where_str, _where_str) % _interDict
+            for _row in self.genSql(_sql_str, _timespan + _timespan):
+                if _row[0] is not None:
+                    _results[int(_row[0])].update(zip(_time_list, _row[1:]))
+
+        # Supply what an aggregation over an empty period returns:
+        _empty = dict((_agg, 0 if _agg == 'count' else None) for _agg in _func_list + _time_list)
+        return [_results.get(int(_span.start), _empty) for _span in span_list]
+
     def getSqlVectors(self, timespan, obs_type, 
                       aggregate_type=None,
                       aggregate_interval=None): 
@@ -539,89 +839,23 @@ class Manager(object):
                 if aggregate_type not in ['sum', 'count', 'avg', 'max', 'min', 'last']:
                     raise weewx.ViolatedPrecondition("Invalid aggregation type '%s'" % aggregate_type)
                 
-                # Special select statement for 'last'
-                if aggregate_type == 'last':
-                    sql_str = "SELECT dateTime, %s, usUnits FROM %s WHERE dateTime = "\
-                        "(SELECT MAX(dateTime) FROM %s WHERE "\
-                        "dateTime > ? AND dateTime <= ?)" % (windvec_types[obs_type], self.table_name, 
-                                                             self.table_name)
+                span_list = list(weeutil.weeutil.intervalgen(timespan[0], timespan[1], aggregate_interval))
+
+                # Fetch all the wind data in the time span with a single query,
+                # then sort the records into the aggregation intervals.
+                sql_str = 'SELECT dateTime, %s, usUnits FROM %s WHERE dateTime > ? AND dateTime <= ? '\
+                    'ORDER BY dateTime ASC' % (windvec_types[obs_type], self.table_name)
+                _rows = list(_cursor.execute(sql_str, (timespan[0], timespan[1])))
+
+                if numpy is not None:
+                    (_results, std_unit_system) = _aggregate_wind_numpy(span_list, _rows, aggregate_type)
                 else:
-                    sql_str = 'SELECT dateTime, %s, usUnits FROM %s WHERE dateTime > ? AND dateTime <= ?' % \
-                        (windvec_types[obs_type], self.table_name)
+                    (_results, std_unit_system) = _aggregate_wind(span_list, _rows, aggregate_type)
 
-                # Go through each aggregation interval, calculating the aggregation.
-                for stamp in weeutil.weeutil.intervalgen(timespan[0], timespan[1], aggregate_interval):
-    
-                    _mag_extreme = _dir_at_extreme = None
-                    _xsum = _ysum = 0.0
-                    _count = 0
-    
-                    for _rec in _cursor.execute(sql_str, stamp):
-                        (_mag, _dir) = _rec[1:3]
-    
-                        if _mag is None:
-                            continue
-    
-                        # A good direction is necessary unless the mag is zero:
-                        if _mag == 0.0  or _dir is not None:
-                            _count += 1
-                            if std_unit_system:
-                                if std_unit_system != _rec[3]:
-                                    raise weewx.UnsupportedFeature("Unit type cannot change "\
-                                                                   "within a time interval.")
-                            else:
-                                std_unit_system = _rec[3]
-                            
-                            # Pick the kind of aggregation:
-                            if aggregate_type == 'min':
-                                if _mag_extreme is None or _mag < _mag_extreme:
-                                    _mag_extreme = _mag
-                                    _dir_at_extreme = _dir
-                            elif aggregate_type == 'max':
-                                if _mag_extreme is None or _mag > _mag_extreme:
-                                    _mag_extreme = _mag
-                                    _dir_at_extreme = _dir
-                            else:
-                                # An undefined direction is OK (and expected) if the magnitude
-                                # is zero. But, in that case, it doesn't contribute to the sums either.
-                                if _dir is None:
-                                    # Sanity check
-                                    if weewx.debug:
-                                        assert(_mag == 0.0)
-                                    _xvec = _yvec = 0.0
-                                else:
-                                    _xvec = _mag * math.cos(math.radians(90.0 - _dir))
-                                    _yvec = _mag * math.sin(math.radians(90.0 - _dir))
-                                    _xsum += _xvec
-                                    _ysum += _yvec
-                    # We've gone through the whole interval. Were there any
-                    # good data?
-                    if _count:
-                        # Record the time of the last good data point:
-                        start_vec.append(stamp.start)
-                        stop_vec.append(stamp.stop)
-                        # Form the requested aggregation:
-                        if aggregate_type in ('min', 'max'):
-                            if _dir_at_extreme is None:
-                                # The only way direction can be zero with a
-                                # non-zero count is if all wind velocities
-                                # were zero
-                                if weewx.debug:
-                                    assert(_mag_extreme <= 1.0e-6)
-                                x_extreme = y_extreme = 0.0
-                            else:
-                                x_extreme = _mag_extreme * math.cos(math.radians(90.0 - _dir_at_extreme))
-                                y_extreme = _mag_extreme * math.sin(math.radians(90.0 - _dir_at_extreme))
-                            data_vec.append(complex(x_extreme, y_extreme))
-                        elif aggregate_type == 'sum':
-                            data_vec.append(complex(_xsum, _ysum))
-                        elif aggregate_type == 'count':
-                            data_vec.append(_count)
-                        elif aggregate_type == 'last':
-                            data_vec.append(complex(_xvec, _yvec))
-                        else:
-                            # Must be 'avg'
-                            data_vec.append(complex(_xsum/_count, _ysum/_count))
+                for (stamp, _value) in _results:
+                    start_vec.append(stamp.start)
+                    stop_vec.append(stamp.stop)
+                    data_vec.append(_value)
             else:
                 # No aggregation desired. It's a lot simpler. Go get the
                 # data in the requested time period
@@ -743,18 +977,9 @@ class Manager(object):
                 if not aggregate_interval:
                     raise weewx.ViolatedPrecondition("Aggregation interval missing")
 
-                if aggregate_type == 'last':
-                    sql_str = "SELECT %s, usUnits, usUnits FROM %s WHERE dateTime = "\
-                        "(SELECT MAX(dateTime) FROM %s WHERE "\
-                        "dateTime > ? AND dateTime <= ?)" % (sql_type, self.table_name, 
-                                                             self.table_name)
-                else:
-                    sql_str = "SELECT %s(%s), MIN(usUnits), MAX(usUnits) FROM %s "\
-                        "WHERE dateTime > ? AND dateTime <= ?" % (aggregate_type, sql_type, self.table_name)
+                span_list = list(weeutil.weeutil.intervalgen(startstamp, stopstamp, aggregate_interval))
 
-                for stamp in weeutil.weeutil.intervalgen(startstamp, stopstamp, aggregate_interval):
-                    _cursor.execute(sql_str, stamp)
-                    _rec = _cursor.fetchone()
+                for (stamp, _rec) in self._genAggregates(span_list, sql_type, aggregate_type, _cursor):
                     # Don't accumulate any results where there wasn't a record
                     # (signified by a null result)
                     if _rec and _rec[0] is not None:
@@ -791,6 +1016,386 @@ class Manager(object):
                 ValueTuple(stop_vec, time_type, time_group), 
                 ValueTuple(data_vec, data_type, data_group))
 
+    def _genAggregates(self, span_list, sql_type, aggregate_type, cursor):
+        """Returns a generator yielding the aggregate of a type for every aggregation
+        interval in span_list, as 2-way tuples (span, row). The row holds the
+        aggregate, and the smallest and largest unit systems of the records."""
+        if self.group_by_aggregation and aggregate_type in Manager.group_by_types:
+            # All the intervals can be calculated with a single query
+            return self._genGroupedAggregates(span_list, sql_type, aggregate_type, cursor)
+        
+        if aggregate_type == 'last':
+            sql_str = "SELECT %s, usUnits, usUnits FROM %s WHERE dateTime = "\
+                "(SELECT MAX(dateTime) FROM %s WHERE "\
+                "dateTime > ? AND dateTime <= ?)" % (sql_type, self.table_name, 
+                                                     self.table_name)
+        else:
+            sql_str = "SELECT %s(%s), MIN(usUnits), MAX(usUnits) FROM %s "\
+                "WHERE dateTime > ? AND dateTime <= ?" % (aggregate_type, sql_type, self.table_name)
+        return self._genIntervalAggregates(span_list, sql_str, cursor)
+
+    def _genIntervalAggregates(self, span_list, sql_str, cursor):
+        """Generator function that runs an aggregation query once for each
+        aggregation interval.
+        
+        yields: 2-way tuples (span, row)."""
+        for stamp in span_list:
+            cursor.execute(sql_str, stamp)
+            yield (stamp, cursor.fetchone())
+
+    def _genGroupedAggregates(self, span_list, sql_type, aggregate_type, cursor):
+        """Generator function that calculates an aggregate for every aggregation
+        interval using a single GROUP BY query.
+        
+        span_list: A list of contiguous TimeSpans, such as returned by
+        weeutil.weeutil.intervalgen().
+        
+        yields: 2-way tuples (span, row). The row is the same as what a query
+        over the single span would have returned, that is,
+        (aggregate, min(usUnits), max(usUnits))."""
+        if not span_list:
+            return
+
+        sql_str = "SELECT %s AS bucket, %s(%s), MIN(usUnits), MAX(usUnits) FROM %s "\
+            "WHERE dateTime > ? AND dateTime <= ? GROUP BY bucket" % \
+            (self._bucket_expression(span_list), aggregate_type, sql_type, self.table_name)
+        _results = dict()
+        for _row in cursor.execute(sql_str, (span_list[0].start, span_list[-1].stop)):
+            _results[_row[0]] = _row[1:]
+
+        # An interval without any records does not show up in the GROUP BY
+        # results. Supply what an aggregation over an empty interval returns.
+        _empty = (0, None, None) if aggregate_type == 'count' else (None, None, None)
+        for stamp in span_list:
+            yield (stamp, _results.get(int(stamp.start), _empty))
+
+    def _bucket_expression(self, span_list, time_expr='dateTime'):
+        """Returns a SQL expression that maps a timestamp to the start of the
+        span in span_list that includes it. The timestamp is given by the SQL
+        expression time_expr. [Optional. Default is 'dateTime']
+        
+        Contiguous spans of equal length are collapsed into a run, within
+        which the start of a span can be found by integer arithmetic. Spans
+        whose length differs from their neighbors (because of a DST change,
+        a calendar month, or a truncated last span) end up in a run of their
+        own. Because there are only a few of these, the resulting CASE
+        expression stays short, even for hundreds of spans."""
+        
+        # Integer division is spelled differently by the two databases
+        int_div = 'DIV' if self.connection.dbtype == 'mysql' else '/'
+
+        when_list = []
+        for (run_start, run_stop, length) in _genSpanRuns(span_list):
+            if run_stop - run_start == length:
+                when_list.append("WHEN %s > %d AND %s <= %d THEN %d" % 
+                                 (time_expr, run_start, time_expr, run_stop, run_start))
+            else:
+                when_list.append("WHEN %s > %d AND %s <= %d THEN %d + %d * ((%s - %d - 1) %s %d)" % 
+                                 (time_expr, run_start, time_expr, run_stop, run_start, length, 
+                                  time_expr, run_start, int_div, length))
+        return "CASE %s END" % ' '.join(when_list)
+
+
+# The manager used by a backfill worker process. See DaySummaryManager._genParallelDaySummaries()
+_backfill_manager = None
+
+def _init_backfill_worker(manager_cls, database_dict, table_name):
+    """Open a manager of its own for a backfill worker process."""
+    global _backfill_manager
+    _backfill_manager = manager_cls.open(database_dict, table_name)
+
+def _calc_backfill_chunk(args):
+    """Calculate the daily summaries for the days in an interval, in a backfill
+    worker process.
+    
+    args: A 3-way tuple (start_ts, stop_ts, fast).
+    
+    returns: A list of 5-way tuples (sod_ts, unit_system, stats_dict, nrecs, last_ts), 
+    where stats_dict holds the stats tuple of each type. Unlike accumulators, these
+    can be pickled."""
+    (start_ts, stop_ts, fast) = args
+    if fast:
+        _day_list = _backfill_manager._calc_sql_day_summaries(start_ts, stop_ts)
+    else:
+        _day_list = _backfill_manager._calc_day_summaries(start_ts, stop_ts)
+    return [(day_accum.timespan.start, day_accum.unit_system, 
+             dict((obs_type, day_accum[obs_type].getStatsTuple()) for obs_type in day_accum),
+             nrecs, last_ts) for (day_accum, nrecs, last_ts) in _day_list]
+
+def _stats_equal(stats_tuple1, stats_tuple2, rel_tol=1e-9):
+    """Compare two stats tuples, allowing for rounding in the sums."""
+    if stats_tuple1 is None or stats_tuple2 is None:
+        return stats_tuple1 is stats_tuple2
+    if len(stats_tuple1) != len(stats_tuple2):
+        return False
+    for (x1, x2) in zip(stats_tuple1, stats_tuple2):
+        if x1 is None or x2 is None:
+            if x1 is not x2:
+                return False
+        elif abs(x1 - x2) > rel_tol * max(abs(x1), abs(x2)):
+            return False
+    return True
+
+def _genBatches(iterable, batch_size):
+    """Generator function that breaks an iterable up into lists of
+    no more than batch_size elements."""
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def _genSpanRuns(span_list):
+    """Generator function that collapses a list of contiguous TimeSpans into
+    runs of spans of equal length.
+    
+    yields: 3-way tuples (run_start, run_stop, length)"""
+    run_start = run_stop = length = None
+    for span in span_list:
+        start, stop = int(span.start), int(span.stop)
+        if start == run_stop and stop - start == length:
+            # This span extends the current run
+            run_stop = stop
+        else:
+            if run_start is not None:
+                yield (run_start, run_stop, length)
+            run_start, run_stop, length = start, stop, stop - start
+    if run_start is not None:
+        yield (run_start, run_stop, length)
+
+# For each aggregation type calculated by _aggregate_day_stats(), the function to
+# apply, and the position in stats_schema of the statistic it is applied to:
+_day_stats_funcs = {'min'     : (min, 0),
+                    'max'     : (max, 2),
+                    'maxmin'  : (max, 0),
+                    'minmax'  : (min, 2),
+                    'maxsum'  : (max, 4),
+                    'meanmin' : ('mean', 0),
+                    'meanmax' : ('mean', 2),
+                    'sum'     : (sum, 4),
+                    'count'   : (sum, 5)}
+# For the times of the extremes, the extreme, and the positions of the statistic
+# that has to equal it and of the time:
+_day_stats_times = {'mintime'    : ('min',    0, 1),
+                    'maxtime'    : ('max',    2, 3),
+                    'maxmintime' : ('maxmin', 0, 1),
+                    'minmaxtime' : ('minmax', 2, 3),
+                    'maxsumtime' : ('maxsum', 4, 3)}
+
+def _aggregate_day_stats(stats_rows, aggregate_type):
+    """Calculate an aggregate from the statistics of a run of days, the same way as
+    the queries in DaySummaryManager.sqlDict.
+
+    stats_rows: A list with the statistics of each day, in order. Each is a tuple
+    in the order of DaySummaryManager.stats_schema.
+
+    aggregate_type: One of DaySummaryManager.day_stats_aggregates.
+
+    returns: The aggregate value, or None if it could not be calculated."""
+
+    if aggregate_type in _day_stats_times:
+        (_extreme_type, _i, _i_time) = _day_stats_times[aggregate_type]
+        _extreme = _aggregate_day_stats(stats_rows, _extreme_type)
+        if _extreme is not None:
+            # The time of the first day with the extreme:
+            for _stats in stats_rows:
+                if _stats[_i] == _extreme and _stats[_i_time] is not None:
+                    return int(_stats[_i_time])
+        return None
+
+    if aggregate_type == 'avg':
+        _wsum_list = [_stats[6] for _stats in stats_rows if _stats[6] is not None]
+        _sumtime_list = [_stats[7] for _stats in stats_rows if _stats[7] is not None]
+        if not _wsum_list or not _sumtime_list or not sum(_sumtime_list):
+            return None
+        return sum(_wsum_list) / sum(_sumtime_list)
+
+    (_func, _i) = _day_stats_funcs[aggregate_type]
+    # Like SQL, ignore nulls, and return null if there is nothing else:
+    _value_list = [_stats[_i] for _stats in stats_rows if _stats[_i] is not None]
+    if not _value_list:
+        return None
+    if _func == 'mean':
+        return float(sum(_value_list)) / len(_value_list)
+    if aggregate_type == 'count':
+        return int(sum(_value_list))
+    return _func(_value_list)
+
+def _aggregate_wind(span_list, rows, aggregate_type):
+    """Aggregate the x- and y-components of wind over a list of time spans.
+    
+    span_list: A list of TimeSpans, in time order.
+    
+    rows: A list of rows (dateTime, magnitude, direction, usUnits), in time order.
+    
+    aggregate_type: One of 'sum', 'count', 'avg', 'max', 'min', or 'last'.
+    
+    returns: A 2-way tuple (results, std_unit_system). The first element is a
+    list of (span, value) tuples, one for each span with good data. For
+    aggregate type 'count' the value is an integer, otherwise a complex number.
+    The second element is the unit system of the data."""
+
+    results = []
+    std_unit_system = None
+    n_rows = len(rows)
+    i_row = 0
+
+    for stamp in span_list:
+        # Skip any records that fall before the start of this span:
+        while i_row < n_rows and rows[i_row][0] <= stamp.start:
+            i_row += 1
+        i_first = i_row
+        while i_row < n_rows and rows[i_row][0] <= stamp.stop:
+            i_row += 1
+        # Only the last record in the span matters for aggregate type 'last'
+        i_first = max(i_first, i_row - 1) if aggregate_type == 'last' else i_first
+
+        _mag_extreme = _dir_at_extreme = None
+        _xsum = _ysum = 0.0
+        _count = 0
+
+        for _rec in rows[i_first:i_row]:
+            (_mag, _dir) = _rec[1:3]
+
+            if _mag is None:
+                continue
+
+            # A good direction is necessary unless the mag is zero:
+            if _mag == 0.0  or _dir is not None:
+                _count += 1
+                if std_unit_system:
+                    if std_unit_system != _rec[3]:
+                        raise weewx.UnsupportedFeature("Unit type cannot change "\
+                                                       "within a time interval.")
+                else:
+                    std_unit_system = _rec[3]
+
+                # Pick the kind of aggregation:
+                if aggregate_type == 'min':
+                    if _mag_extreme is None or _mag < _mag_extreme:
+                        _mag_extreme = _mag
+                        _dir_at_extreme = _dir
+                elif aggregate_type == 'max':
+                    if _mag_extreme is None or _mag > _mag_extreme:
+                        _mag_extreme = _mag
+                        _dir_at_extreme = _dir
+                else:
+                    # An undefined direction is OK (and expected) if the magnitude
+                    # is zero. But, in that case, it doesn't contribute to the sums either.
+                    if _dir is None:
+                        # Sanity check
+                        if weewx.debug:
+                            assert(_mag == 0.0)
+                        _xvec = _yvec = 0.0
+                    else:
+                        _xvec = _mag * math.cos(math.radians(90.0 - _dir))
+                        _yvec = _mag * math.sin(math.radians(90.0 - _dir))
+                        _xsum += _xvec
+                        _ysum += _yvec
+        # We've gone through the whole interval. Were there any
+        # good data?
+        if _count:
+            # Form the requested aggregation:
+            if aggregate_type in ('min', 'max'):
+                if _dir_at_extreme is None:
+                    # The only way direction can be zero with a
+                    # non-zero count is if all wind velocities
+                    # were zero
+                    if weewx.debug:
+                        assert(_mag_extreme <= 1.0e-6)
+                    x_extreme = y_extreme = 0.0
+                else:
+                    x_extreme = _mag_extreme * math.cos(math.radians(90.0 - _dir_at_extreme))
+                    y_extreme = _mag_extreme * math.sin(math.radians(90.0 - _dir_at_extreme))
+                results.append((stamp, complex(x_extreme, y_extreme)))
+            elif aggregate_type == 'sum':
+                results.append((stamp, complex(_xsum, _ysum)))
+            elif aggregate_type == 'count':
+                results.append((stamp, _count))
+            elif aggregate_type == 'last':
+                results.append((stamp, complex(_xvec, _yvec)))
+            else:
+                # Must be 'avg'
+                results.append((stamp, complex(_xsum/_count, _ysum/_count)))
+
+    return (results, std_unit_system)
+
+def _aggregate_wind_numpy(span_list, rows, aggregate_type):
+    """Same as _aggregate_wind(), except the work is done with numpy arrays."""
+
+    if not span_list or not rows:
+        return ([], None)
+
+    # Missing values become NaN:
+    (t, mag, dirN, units) = numpy.array(rows, dtype=float).T
+    starts = numpy.array([stamp.start for stamp in span_list], dtype=float)
+    stops  = numpy.array([stamp.stop  for stamp in span_list], dtype=float)
+
+    # Find the span each record belongs to, then discard records that fall
+    # outside of all spans:
+    idx = numpy.searchsorted(stops, t, side='left')
+    inspan = idx < len(span_list)
+    inspan[inspan] = t[inspan] > starts[idx[inspan]]
+    (t, mag, dirN, units, idx) = (t[inspan], mag[inspan], dirN[inspan], units[inspan], idx[inspan])
+
+    # A good direction is necessary unless the mag is zero:
+    good = ~numpy.isnan(mag) & ((mag == 0.0) | ~numpy.isnan(dirN))
+    if aggregate_type == 'last':
+        # Only the last record in each span matters. Because the records are in
+        # time order, it is the one just before the span index changes.
+        is_last = numpy.ones(len(idx), dtype=bool)
+        is_last[:-1] = idx[:-1] != idx[1:]
+        good &= is_last
+    (mag, dirN, units, idx) = (mag[good], dirN[good], units[good], idx[good])
+
+    if not len(idx):
+        return ([], None)
+    std_unit_system = int(units[0])
+    if (units != units[0]).any():
+        raise weewx.UnsupportedFeature("Unit type cannot change within a time interval.")
+
+    count = numpy.bincount(idx, minlength=len(span_list))
+
+    if aggregate_type in ('min', 'max'):
+        # Sort by span, then by magnitude, then by time, and take the first
+        # record of each span. This gives the earliest extreme, same as
+        # scanning the records in order.
+        order = numpy.lexsort((numpy.arange(len(idx)), mag if aggregate_type == 'min' else -mag, idx))
+        first = numpy.ones(len(order), dtype=bool)
+        first[1:] = idx[order][1:] != idx[order][:-1]
+        order = order[first]
+        (mag, dirN, idx) = (mag[order], dirN[order], idx[order])
+
+    # Break the mag and dir down into x- and y-components. An undefined
+    # direction contributes nothing.
+    with numpy.errstate(invalid='ignore'):
+        x = numpy.where(numpy.isnan(dirN), 0.0, mag * numpy.cos(numpy.radians(90.0 - dirN)))
+        y = numpy.where(numpy.isnan(dirN), 0.0, mag * numpy.sin(numpy.radians(90.0 - dirN)))
+
+    if aggregate_type in ('min', 'max', 'last'):
+        # There is exactly one record per span left
+        xagg = numpy.zeros(len(span_list))
+        yagg = numpy.zeros(len(span_list))
+        xagg[idx] = x
+        yagg[idx] = y
+    else:
+        xagg = numpy.bincount(idx, weights=x, minlength=len(span_list))
+        yagg = numpy.bincount(idx, weights=y, minlength=len(span_list))
+        if aggregate_type == 'avg':
+            with numpy.errstate(invalid='ignore', divide='ignore'):
+                xagg /= count
+                yagg /= count
+
+    results = []
+    for i in numpy.flatnonzero(count):
+        if aggregate_type == 'count':
+            results.append((span_list[i], int(count[i])))
+        else:
+            results.append((span_list[i], complex(float(xagg[i]), float(yagg[i]))))
+    return (results, std_unit_system)
 
 def reconfig(old_db_dict, new_db_dict, new_unit_system=None, new_schema=None):
     """Copy over an old archive to a new one, using a provided schema."""
@@ -808,6 +1413,84 @@ def reconfig(old_db_dict, new_db_dict, new_unit_system=None, new_schema=None):
             # context:
             new_archive.addRecord(record_generator)
 
+#===============================================================================
+#                    Class VectorCache
+#===============================================================================
+
+class VectorCache(object):
+    """Memoizes the results of getSqlVectors.
+
+    Like weewx.tags.AggregateCache, a single instance is meant to be shared by
+    all the generators of one report run, then thrown away. The vectors over a
+    timespan that lies within one already fetched are sliced out of the
+    fetched vectors, rather than queried again.
+    """
+
+    def __init__(self):
+        self.cache  = {}
+        self.hits   = 0
+        self.misses = 0
+
+    def get_vectors(self, db_manager, timespan, obs_type, aggregate_type=None, aggregate_interval=None):
+        """Return the vectors, querying the database only if they cannot be
+        had from those already fetched.
+
+        Arguments are as for getSqlVectors, plus the database manager to use."""
+        if aggregate_type:
+            aggregate_type = aggregate_type.lower()
+        else:
+            aggregate_type = aggregate_interval = None
+        key = (db_manager.connection.database_name, db_manager.table_name,
+               obs_type, aggregate_type, aggregate_interval)
+        entry_list = self.cache.setdefault(key, [])
+        for entry in entry_list:
+            vectors = VectorCache._slice(entry, timespan, aggregate_interval)
+            if vectors is not None:
+                self.hits += 1
+                return vectors
+        vectors = db_manager.getSqlVectors(timespan, obs_type, aggregate_type, aggregate_interval)
+        if aggregate_interval:
+            # Remember the intervals, including those without any data
+            intervals = set((span.start, span.stop) for span in
+                            weeutil.weeutil.intervalgen(timespan[0], timespan[1], aggregate_interval))
+        else:
+            intervals = None
+        entry_list.append((tuple(timespan), intervals, vectors))
+        self.misses += 1
+        return vectors
+
+    @staticmethod
+    def _slice(entry, timespan, aggregate_interval):
+        """Return the vectors over a timespan, sliced from the vectors of a
+        cache entry, or None if they cannot be."""
+        (entry_span, entry_intervals, vectors) = entry
+        if tuple(timespan) == entry_span:
+            return vectors
+        if not entry_span[0] <= timespan[0] <= timespan[1] <= entry_span[1]:
+            return None
+        (start_vec, stop_vec, _) = vectors
+        if aggregate_interval:
+            # The intervals must be the same as some of those fetched
+            interval_list = [(span.start, span.stop) for span in
+                             weeutil.weeutil.intervalgen(timespan[0], timespan[1], aggregate_interval)]
+            if not entry_intervals.issuperset(interval_list):
+                return None
+            interval_set = set(interval_list)
+            index_list = [i for (i, interval) in enumerate(zip(start_vec[0], stop_vec[0]))
+                          if interval in interval_set]
+        else:
+            # Records are included if they are timestamped within the timespan,
+            # ends included
+            index_list = [i for (i, ts) in enumerate(stop_vec[0]) if timespan[0] <= ts <= timespan[1]]
+        if not index_list:
+            # Without any data the units are unknown. Leave that to the database.
+            return None
+        return tuple(ValueTuple([vec_t[0][i] for i in index_list], vec_t[1], vec_t[2])
+                     for vec_t in vectors)
+
+    def clear(self):
+        self.cache = {}
+
 #===============================================================================
 #                    Class DBBinder
 #===============================================================================
@@ -1060,7 +1743,19 @@ def show_progress(nrec, last_time):
     print >>sys.stdout, "Records processed: %d; Last date: %s\r" % \
         (nrec, weeutil.weeutil.timestamp_to_string(last_time)),
     sys.stdout.flush()
-        
+
+def _archive_hour_span(time_ts, grace=1):
+    """Returns a TimeSpan for the hour that includes the archive time time_ts,
+    in the same manner as weeutil.weeutil.archiveDaySpan().
+
+    The start of the hour is found from the minutes and seconds of the local
+    time, rather than with time.mktime(), so the repeated hour at the end of
+    daylight saving time comes out as two separate hours."""
+    time_ts = int(time_ts - grace)
+    _tt = time.localtime(time_ts)
+    _start_ts = time_ts - _tt.tm_min * 60 - _tt.tm_sec
+    return weeutil.weeutil.TimeSpan(_start_ts, _start_ts + 3600)
+
 class DaySummaryManager(Manager):
     """Manage a daily statistical summary. 
     
@@ -1078,10 +1773,39 @@ class DaySummaryManager(Manager):
     sumtime is the sum of the archive intervals.
         
     In addition to all the tables for each type, there is one additional table called
-    'archive_day__metadata', which currently holds the time of the last update. """
+    'archive_day__metadata', which currently holds the time of the last update. 
+    
+    Aggregates over periods that are over and done with, such as last month, are kept
+    in table 'archive_day__aggregates', so they need not be calculated again. Entries
+    are removed whenever the daily summary of a day in their period gets rewritten.
+    
+    Alternatively, the daily summaries can be kept in a single "wide" table,
+    'archive_day', with one row per day and a group of columns for each type. For
+    example, 'outTemp_min', 'outTemp_mintime', etc. This allows all the statistics
+    for a day to be read or written with a single statement. The layout in use is
+    held in the metadata as 'Layout'. It can be changed with set_day_layout(). It
+    is kept when the daily summaries are dropped, so they get rebuilt in it.
+
+    Optionally, the same statistics can also be kept by the hour, month or year, in
+    tables 'archive_hour', 'archive_month' and 'archive_year', laid out like the wide
+    table. The monthly and yearly ones are the daily summaries rolled up, and are
+    used to calculate aggregates over whole months and years. The hourly ones come
+    from the archive records alone, and are used for spans that do not start and
+    end on midnight. They are created and filled by rebuild_rollups(), and kept up
+    to date as records are added."""
     
     version = "2.0"
 
+    # The statistics kept for each type, in the order of its stats tuple, with their SQL types:
+    stats_schema = [('min', 'REAL'), ('mintime', 'INTEGER'), ('max', 'REAL'), ('maxtime', 'INTEGER'),
+                    ('sum', 'REAL'), ('count', 'INTEGER'), ('wsum', 'REAL'), ('sumtime', 'INTEGER')]
+    # Vector types keep some additional statistics:
+    vecstats_schema = stats_schema + [('max_dir', 'REAL'), ('xsum', 'REAL'), ('ysum', 'REAL'),
+                                      ('dirsumtime', 'INTEGER'), ('squaresum', 'REAL'), ('wsquaresum', 'REAL')]
+    
+    # The storage layouts for the daily summaries
+    layouts = ['table', 'wide']
+
     # The SQL statements used in the daily summary parts of the database
     
     sql_create_str = "CREATE TABLE %s_day_%s (dateTime INTEGER NOT NULL UNIQUE PRIMARY KEY, "\
@@ -1092,37 +1816,102 @@ class DaySummaryManager(Manager):
     meta_replace_str  = """REPLACE INTO %s_day__metadata VALUES(?, ?)"""
     meta_select_str   = """SELECT value FROM %s_day__metadata WHERE name=?"""
     
+    agg_create_str    = """CREATE TABLE %s_day__aggregates (start INTEGER NOT NULL, stop INTEGER NOT NULL, """\
+                        """obs_type VARCHAR(64) NOT NULL, aggregate_type VARCHAR(16) NOT NULL, value REAL, """\
+                        """PRIMARY KEY (start, stop, obs_type, aggregate_type));"""
+    agg_replace_str   = """REPLACE INTO %s_day__aggregates VALUES(?, ?, ?, ?, ?)"""
+    agg_select_str    = """SELECT value FROM %s_day__aggregates WHERE start=? AND stop=? AND obs_type=? AND aggregate_type=?"""
+    agg_select_all_str= """SELECT aggregate_type, value FROM %s_day__aggregates WHERE start=? AND stop=? AND obs_type=?"""
+    agg_delete_str    = """DELETE FROM %s_day__aggregates WHERE start < ? AND stop > ?"""
+    
+    # Aggregation types whose results are always integers:
+    int_aggregates = ['mintime', 'maxmintime', 'maxtime', 'minmaxtime', 'maxsumtime',
+                      'count', 'max_ge', 'max_le', 'min_ge', 'min_le', 'sum_ge']
+    
+    # Aggregation types that can be calculated for spans that do not start and end on
+    # midnight, by using the daily summaries for the whole days in the middle
+    hybrid_aggregates = ['sum', 'count', 'avg', 'min', 'max', 'mintime', 'maxtime']
+    
+    # Set to False to always use the archive table for such spans
+    hybrid_aggregation = True
+
+    # The periods that the daily summaries can be rolled up to, with a function
+    # returning the span of the period that includes an archive time:
+    rollup_levels = ['hour', 'month', 'year']
+    rollup_spans = {'hour'  : _archive_hour_span,
+                    'day'   : weeutil.weeutil.archiveDaySpan,
+                    'month' : weeutil.weeutil.archiveMonthSpan,
+                    'year'  : weeutil.weeutil.archiveYearSpan}
+
+    # Aggregation types that come out the same whether calculated from the days of
+    # a span, or from the months or years that make it up:
+    rollup_aggregates = ['min', 'max', 'mintime', 'maxtime', 'gustdir', 'sum', 'count',
+                         'avg', 'rms', 'vecavg', 'vecdir']
+
+    # Aggregation types of getSqlVectors() that can be calculated from the daily summaries
+    # or the rollups, when the aggregation intervals are made up of whole periods. Set
+    # summary_vectors to False to always use the archive table.
+    summary_vector_aggregates = ['sum', 'count', 'avg']
+    summary_vectors = True
+
+    # Aggregation types that getAggregates can calculate together from the daily
+    # summaries, with the SQL expressions each needs:
+    day_batch_sql = {'min'     : ["MIN(%(min)s)"],
+                     'max'     : ["MAX(%(max)s)"],
+                     'maxmin'  : ["MAX(%(min)s)"],
+                     'minmax'  : ["MIN(%(max)s)"],
+                     'meanmin' : ["AVG(%(min)s)"],
+                     'meanmax' : ["AVG(%(max)s)"],
+                     'maxsum'  : ["MAX(%(sum)s)"],
+                     'sum'     : ["SUM(%(sum)s)"],
+                     'count'   : ["SUM(%(count)s)"],
+                     'avg'     : ["SUM(%(wsum)s)", "SUM(%(sumtime)s)"],
+                     'rms'     : ["SUM(%(wsquaresum)s)", "SUM(%(sumtime)s)"]}
+    # The times of the extremes. For each, the extreme, the statistic that has to
+    # equal it, and the statistic holding the time:
+    day_batch_times = {'mintime'    : ('min',    'min', 'mintime'),
+                       'maxtime'    : ('max',    'max', 'maxtime'),
+                       'maxmintime' : ('maxmin', 'min', 'mintime'),
+                       'minmaxtime' : ('minmax', 'max', 'maxtime'),
+                       'maxsumtime' : ('maxsum', 'sum', 'maxtime')}
+    day_batch_aggregates = day_batch_sql.keys() + day_batch_times.keys()
+
+    # Aggregation types that getSpanAggregates can calculate from the statistics of
+    # the days. See _aggregate_day_stats().
+    day_stats_aggregates = ['min', 'max', 'maxmin', 'minmax', 'meanmin', 'meanmax', 'maxsum', 'sum',
+                            'count', 'avg', 'mintime', 'maxtime', 'maxmintime', 'minmaxtime', 'maxsumtime']
+
     # Set of SQL statements to be used for calculating aggregate statistics. Key is the aggregation type.
-    sqlDict = {'min'        : "SELECT MIN(min) FROM %(table_name)s_day_%(obs_key)s WHERE dateTime >= %(start)s AND dateTime < %(stop)s",
-               'minmax'     : "SELECT MIN(max) FROM %(table_name)s_day_%(obs_key)s WHERE dateTime >= %(start)s AND dateTime < %(stop)s",
-               'max'        : "SELECT MAX(max) FROM %(table_name)s_day_%(obs_key)s WHERE dateTime >= %(start)s AND dateTime < %(stop)s",
-               'maxmin'     : "SELECT MAX(min) FROM %(table_name)s_day_%(obs_key)s WHERE dateTime >= %(start)s AND dateTime < %(stop)s",
-               'meanmin'    : "SELECT AVG(min) FROM %(table_name)s_day_%(obs_key)s WHERE dateTime >= %(start)s AND dateTime < %(stop)s",
-               'meanmax'    : "SELECT AVG(max) FROM %(table_name)s_day_%(obs_key)s WHERE dateTime >= %(start)s AND dateTime < %(stop)s",
-               'maxsum'     : "SELECT MAX(sum) FROM %(table_name)s_day_%(obs_key)s WHERE dateTime >= %(start)s AND dateTime < %(stop)s",
-               'mintime'    : "SELECT mintime FROM %(table_name)s_day_%(obs_key)s  WHERE dateTime >= %(start)s AND dateTime < %(stop)s AND " \
-                              "min = (SELECT MIN(min) FROM %(table_name)s_day_%(obs_key)s WHERE dateTime >= %(start)s AND dateTime <%(stop)s)",
-               'maxmintime' : "SELECT mintime FROM %(table_name)s_day_%(obs_key)s  WHERE dateTime >= %(start)s AND dateTime < %(stop)s AND " \
-                              "min = (SELECT MAX(min) FROM %(table_name)s_day_%(obs_key)s WHERE dateTime >= %(start)s AND dateTime <%(stop)s)",
-               'maxtime'    : "SELECT maxtime FROM %(table_name)s_day_%(obs_key)s  WHERE dateTime >= %(start)s AND dateTime < %(stop)s AND " \
-                              "max = (SELECT MAX(max) FROM %(table_name)s_day_%(obs_key)s WHERE dateTime >= %(start)s AND dateTime <%(stop)s)",
-               'minmaxtime' : "SELECT maxtime FROM %(table_name)s_day_%(obs_key)s  WHERE dateTime >= %(start)s AND dateTime < %(stop)s AND " \
-                              "max = (SELECT MIN(max) FROM %(table_name)s_day_%(obs_key)s WHERE dateTime >= %(start)s AND dateTime <%(stop)s)",
-               'maxsumtime' : "SELECT maxtime FROM %(table_name)s_day_%(obs_key)s  WHERE dateTime >= %(start)s AND dateTime < %(stop)s AND " \
-                              "sum = (SELECT MAX(sum) FROM %(table_name)s_day_%(obs_key)s WHERE dateTime >= %(start)s AND dateTime <%(stop)s)",
-               'gustdir'    : "SELECT max_dir FROM %(table_name)s_day_%(obs_key)s  WHERE dateTime >= %(start)s AND dateTime < %(stop)s AND " \
-                              "max = (SELECT MAX(max) FROM %(table_name)s_day_%(obs_key)s WHERE dateTime >= %(start)s AND dateTime < %(stop)s)",
-               'sum'        : "SELECT SUM(sum) FROM %(table_name)s_day_%(obs_key)s WHERE dateTime >= %(start)s AND dateTime < %(stop)s",
-               'count'      : "SELECT SUM(count) FROM %(table_name)s_day_%(obs_key)s WHERE dateTime >= %(start)s AND dateTime < %(stop)s",
-               'avg'        : "SELECT SUM(wsum),SUM(sumtime) FROM %(table_name)s_day_%(obs_key)s WHERE dateTime >= %(start)s AND dateTime < %(stop)s",
-               'rms'        : "SELECT SUM(wsquaresum),SUM(sumtime) FROM %(table_name)s_day_%(obs_key)s WHERE dateTime >= %(start)s AND dateTime < %(stop)s",
-               'vecavg'     : "SELECT SUM(xsum),SUM(ysum),SUM(dirsumtime)  FROM %(table_name)s_day_%(obs_key)s WHERE dateTime >= %(start)s AND dateTime < %(stop)s",
-               'vecdir'     : "SELECT SUM(xsum),SUM(ysum) FROM %(table_name)s_day_%(obs_key)s WHERE dateTime >= %(start)s AND dateTime < %(stop)s",
-               'max_ge'     : "SELECT SUM(max >= %(val)s) FROM %(table_name)s_day_%(obs_key)s WHERE dateTime >= %(start)s AND dateTime < %(stop)s",
-               'max_le'     : "SELECT SUM(max <= %(val)s) FROM %(table_name)s_day_%(obs_key)s WHERE dateTime >= %(start)s AND dateTime < %(stop)s",
-               'min_ge'     : "SELECT SUM(min >= %(val)s) FROM %(table_name)s_day_%(obs_key)s WHERE dateTime >= %(start)s AND dateTime < %(stop)s",
-               'min_le'     : "SELECT SUM(min <= %(val)s) FROM %(table_name)s_day_%(obs_key)s WHERE dateTime >= %(start)s AND dateTime < %(stop)s",
-               'sum_ge'     : "SELECT SUM(sum >= %(val)s) FROM %(table_name)s_day_%(obs_key)s WHERE dateTime >= %(start)s AND dateTime < %(stop)s"}
+    sqlDict = {'min'        : "SELECT MIN(%(min)s) FROM %(day_table)s WHERE dateTime >= %(start)s AND dateTime < %(stop)s",
+               'minmax'     : "SELECT MIN(%(max)s) FROM %(day_table)s WHERE dateTime >= %(start)s AND dateTime < %(stop)s",
+               'max'        : "SELECT MAX(%(max)s) FROM %(day_table)s WHERE dateTime >= %(start)s AND dateTime < %(stop)s",
+               'maxmin'     : "SELECT MAX(%(min)s) FROM %(day_table)s WHERE dateTime >= %(start)s AND dateTime < %(stop)s",
+               'meanmin'    : "SELECT AVG(%(min)s) FROM %(day_table)s WHERE dateTime >= %(start)s AND dateTime < %(stop)s",
+               'meanmax'    : "SELECT AVG(%(max)s) FROM %(day_table)s WHERE dateTime >= %(start)s AND dateTime < %(stop)s",
+               'maxsum'     : "SELECT MAX(%(sum)s) FROM %(day_table)s WHERE dateTime >= %(start)s AND dateTime < %(stop)s",
+               'mintime'    : "SELECT %(mintime)s FROM %(day_table)s  WHERE dateTime >= %(start)s AND dateTime < %(stop)s AND " \
+                              "%(min)s = (SELECT MIN(%(min)s) FROM %(day_table)s WHERE dateTime >= %(start)s AND dateTime <%(stop)s)",
+               'maxmintime' : "SELECT %(mintime)s FROM %(day_table)s  WHERE dateTime >= %(start)s AND dateTime < %(stop)s AND " \
+                              "%(min)s = (SELECT MAX(%(min)s) FROM %(day_table)s WHERE dateTime >= %(start)s AND dateTime <%(stop)s)",
+               'maxtime'    : "SELECT %(maxtime)s FROM %(day_table)s  WHERE dateTime >= %(start)s AND dateTime < %(stop)s AND " \
+                              "%(max)s = (SELECT MAX(%(max)s) FROM %(day_table)s WHERE dateTime >= %(start)s AND dateTime <%(stop)s)",
+               'minmaxtime' : "SELECT %(maxtime)s FROM %(day_table)s  WHERE dateTime >= %(start)s AND dateTime < %(stop)s AND " \
+                              "%(max)s = (SELECT MIN(%(max)s) FROM %(day_table)s WHERE dateTime >= %(start)s AND dateTime <%(stop)s)",
+               'maxsumtime' : "SELECT %(maxtime)s FROM %(day_table)s  WHERE dateTime >= %(start)s AND dateTime < %(stop)s AND " \
+                              "%(sum)s = (SELECT MAX(%(sum)s) FROM %(day_table)s WHERE dateTime >= %(start)s AND dateTime <%(stop)s)",
+               'gustdir'    : "SELECT %(max_dir)s FROM %(day_table)s  WHERE dateTime >= %(start)s AND dateTime < %(stop)s AND " \
+                              "%(max)s = (SELECT MAX(%(max)s) FROM %(day_table)s WHERE dateTime >= %(start)s AND dateTime < %(stop)s)",
+               'sum'        : "SELECT SUM(%(sum)s) FROM %(day_table)s WHERE dateTime >= %(start)s AND dateTime < %(stop)s",
+               'count'      : "SELECT SUM(%(count)s) FROM %(day_table)s WHERE dateTime >= %(start)s AND dateTime < %(stop)s",
+               'avg'        : "SELECT SUM(%(wsum)s),SUM(%(sumtime)s) FROM %(day_table)s WHERE dateTime >= %(start)s AND dateTime < %(stop)s",
+               'rms'        : "SELECT SUM(%(wsquaresum)s),SUM(%(sumtime)s) FROM %(day_table)s WHERE dateTime >= %(start)s AND dateTime < %(stop)s",
+               'vecavg'     : "SELECT SUM(%(xsum)s),SUM(%(ysum)s),SUM(%(dirsumtime)s)  FROM %(day_table)s WHERE dateTime >= %(start)s AND dateTime < %(stop)s",
+               'vecdir'     : "SELECT SUM(%(xsum)s),SUM(%(ysum)s) FROM %(day_table)s WHERE dateTime >= %(start)s AND dateTime < %(stop)s",
+               'max_ge'     : "SELECT SUM(%(max)s >= %(val)s) FROM %(day_table)s WHERE dateTime >= %(start)s AND dateTime < %(stop)s",
+               'max_le'     : "SELECT SUM(%(max)s <= %(val)s) FROM %(day_table)s WHERE dateTime >= %(start)s AND dateTime < %(stop)s",
+               'min_ge'     : "SELECT SUM(%(min)s >= %(val)s) FROM %(day_table)s WHERE dateTime >= %(start)s AND dateTime < %(stop)s",
+               'min_le'     : "SELECT SUM(%(min)s <= %(val)s) FROM %(day_table)s WHERE dateTime >= %(start)s AND dateTime < %(stop)s",
+               'sum_ge'     : "SELECT SUM(%(sum)s >= %(val)s) FROM %(day_table)s WHERE dateTime >= %(start)s AND dateTime < %(stop)s"}
     
     def __init__(self, connection, table_name='archive', schema=None):
         """Initialize an instance of DaySummaryManager
@@ -1140,31 +1929,51 @@ class DaySummaryManager(Manager):
         # Initialize my superclass:
         super(DaySummaryManager, self).__init__(connection, table_name, schema)
         
+        # The accumulator of the last day summary written, and the value of
+        # metadata 'lastUpdate' at the time it was written:
+        self._day_cache = None
+        # Cache of SQL REPLACE statements, keyed by daily summary type:
+        self._replace_cache = {}
+        
+        # If the daily summaries were dropped by drop_daily(), the metadata may hold
+        # nothing but their layout.
+        _meta_table = '%s_day__metadata' % self.table_name
+        _kept_layout = None
+        if _meta_table in self.connection.tables() and self._read_metadata('Version') is None:
+            _kept_layout = self._read_metadata('Layout')
+        
         # If the database has not been initialized with the daily summaries, then create the
         # necessary tables, but only if a schema has been given.
-        if '%s_day__metadata' % self.table_name not in self.connection.tables():
+        if _meta_table not in self.connection.tables() or _kept_layout is not None:
             # Database has not been initialized with the summaries. Is there a schema?
             if schema is None:
                 # Uninitialized, but no schema was supplied. Raise an exception
                 raise weedb.OperationalError("No day summary schema for table '%s' in database '%s'" % (self.table_name, connection.database_name))
             # There is a schema. Create all the daily summary tables as one transaction:
             with weedb.Transaction(self.connection) as _cursor:
+                if _kept_layout is not None:
+                    _cursor.execute("DROP TABLE %s" % _meta_table)
                 self._initialize_day_tables(schema, _cursor)
             syslog.syslog(syslog.LOG_NOTICE,
                           "manager: Created daily summary tables")
+        # Daily summaries created by earlier versions will not have a table of aggregates:
+        if '%s_day__aggregates' % self.table_name not in self.connection.tables():
+            self.connection.execute(DaySummaryManager.agg_create_str % self.table_name)
         
         # Get a list of all the observation types which have daily summaries
-        all_tables = self.connection.tables()
-        prefix = "%s_day_" % self.table_name
-        Nprefix = len(prefix)
-        meta_name = '%s_day__metadata' % self.table_name
-        self.daykeys = [x[Nprefix:] for x in all_tables if (x.startswith(prefix) and x != meta_name)]
+        self.day_layout = self._read_metadata('Layout') or 'table'
+        self._sync_daykeys()
+        self._sync_rollups()
+        # The new tables are empty, so this is quick:
+        if _kept_layout is not None:
+            self.set_day_layout(_kept_layout)
         self.version = self._read_metadata('Version')
         syslog.syslog(syslog.LOG_DEBUG,
                       'manager: Daily summary version is %s' % self.version)
     
     def close(self):
         del self.version
+        self._day_cache = None
         # There will be no daykeys if the daily summaries have been dropped.
         try:
             del self.daykeys
@@ -1172,6 +1981,79 @@ class DaySummaryManager(Manager):
             pass
         super(DaySummaryManager, self).close()
 
+    def _sync_daykeys(self):
+        """Resynch the list of types with daily summaries, and where their
+        statistics are kept."""
+        if self.day_layout == 'wide':
+            (self.daykeys, self._wide_stats) = self._get_wide_columns('%s_day' % self.table_name)
+            (self._wide_select_str, self._wide_replace_str) = \
+                self._get_wide_statements('%s_day' % self.table_name, self.daykeys, self._wide_stats)
+        else:
+            all_tables = self.connection.tables()
+            prefix = "%s_day_" % self.table_name
+            Nprefix = len(prefix)
+            # Names with a double underscore, such as 'archive_day__metadata', are not types.
+            self.daykeys = [x[Nprefix:] for x in all_tables if (x.startswith(prefix) and not x.startswith(prefix + '_'))]
+        self._replace_cache = {}
+        self._hybrid_types = None
+
+    def _sync_rollups(self):
+        """Resynch the rollups in use. For each level with a table, keep the
+        table name, its types and their statistics, and the statements to read
+        and write a row."""
+        self._rollups = {}
+        _all_tables = self.connection.tables()
+        for _level in DaySummaryManager.rollup_levels:
+            _table = '%s_%s' % (self.table_name, _level)
+            if _table in _all_tables:
+                (_keys, _stats_dict) = self._get_wide_columns(_table)
+                self._rollups[_level] = (_table, _keys, _stats_dict) + \
+                    self._get_wide_statements(_table, _keys, _stats_dict)
+
+    def _get_wide_columns(self, table):
+        """Work out the types and statistics held in a table laid out like the wide
+        daily summaries. Each column is named after its type and statistic.
+        
+        returns: A 2-way tuple (keys, stats_dict). The first is a list of the types,
+        in the order of their columns. The second is a dictionary holding the names
+        of the statistics of each type, again in order."""
+        _stats_names = sorted([x[0] for x in DaySummaryManager.vecstats_schema], key=len, reverse=True)
+        _keys = []
+        _stats_dict = {}
+        for _column in self.connection.columnsOf(table)[1:]:
+            for _stats_name in _stats_names:
+                if _column.endswith('_' + _stats_name):
+                    _key = _column[:-len(_stats_name) - 1]
+                    if _key not in _stats_dict:
+                        _keys.append(_key)
+                        _stats_dict[_key] = []
+                    _stats_dict[_key].append(_stats_name)
+                    break
+        return (_keys, _stats_dict)
+
+    @staticmethod
+    def _get_wide_statements(table, keys, stats_dict):
+        """Returns a 2-way tuple with the SQL statements to select and replace a
+        single row of a table laid out like the wide daily summaries."""
+        _column_list = ['%s_%s' % (_key, _stats_name) for _key in keys for _stats_name in stats_dict[_key]]
+        _select_str = "SELECT %s FROM %s WHERE dateTime = ?" % (', '.join(_column_list), table)
+        _replace_str = "REPLACE INTO %s (dateTime, %s) VALUES (%s)" % \
+            (table, ', '.join(_column_list), ','.join((len(_column_list) + 1) * '?'))
+        return (_select_str, _replace_str)
+
+    def _day_table(self, obs_type):
+        """Return the name of the table holding the daily summaries of a type."""
+        if self.day_layout == 'wide':
+            return '%s_day' % self.table_name
+        return '%s_day_%s' % (self.table_name, obs_type)
+    
+    def _day_column(self, obs_type, stats_name):
+        """Return the name of the column holding a daily statistic of a type,
+        such as 'min'."""
+        if self.day_layout == 'wide':
+            return '%s_%s' % (obs_type, stats_name)
+        return stats_name
+
     def _initialize_day_tables(self, archiveSchema, cursor):  # @UnusedVariable
         """Initialize the tables needed for the daily summary."""
         # Create the tables needed for the daily summaries.
@@ -1182,6 +2064,16 @@ class DaySummaryManager(Manager):
         # Put the version number in it:
         self._write_metadata('Version', DaySummaryManager.version, cursor)
 
+    def addRecord(self, record_obj, log_level=syslog.LOG_NOTICE, accumulator=None):
+        """Specialized version that discards the in-memory day summary should
+        anything go wrong. The transaction will have been rolled back, so it may
+        no longer match what is in the database."""
+        try:
+            super(DaySummaryManager, self).addRecord(record_obj, log_level, accumulator)
+        except Exception:
+            self._day_cache = None
+            raise
+
     def _addSingleRecord(self, record, cursor, log_level):
         """Specialized version that updates the daily summaries, as well as the 
         main archive table."""
@@ -1199,10 +2091,37 @@ class DaySummaryManager(Manager):
         _day_summary = self._get_day_summary(_sod_ts, cursor)
         _day_summary.addRecord(record, weight=_weight)
         self._set_day_summary(_day_summary, record['dateTime'], cursor)
+        # And to the rollups, if there are any:
+        self._add_to_rollups([record], cursor)
         syslog.syslog(log_level, "manager: Added record %s to daily summary in '%s'" % 
                       (weeutil.weeutil.timestamp_to_string(record['dateTime']), 
                        self.database_name))
         
+    def _addRecordBatch(self, record_list, cursor):
+        """Specialized version that updates the daily summaries, as well as the 
+        main archive table. Records that fall on the same day share a single read
+        and write of the day's summary."""
+        
+        # First let my superclass add the records to the main archive table:
+        added_list = super(DaySummaryManager, self)._addRecordBatch(record_list, cursor)
+        
+        _day_summary = None
+        for record in added_list:
+            # Get the start of day for the record:        
+            _sod_ts = weeutil.weeutil.startOfArchiveDay(record['dateTime'])
+            # If the record falls on a different day, save the old day summary and fetch the new one
+            if _day_summary is None or _day_summary.timespan.start != _sod_ts:
+                if _day_summary is not None:
+                    self._set_day_summary(_day_summary, None, cursor)
+                _day_summary = self._get_day_summary(_sod_ts, cursor)
+            _day_summary.addRecord(record, weight=self._calc_weight(record))
+        
+        if _day_summary is not None:
+            self._set_day_summary(_day_summary, added_list[-1]['dateTime'], cursor)
+        self._add_to_rollups(added_list, cursor)
+        
+        return added_list
+        
     def _updateHiLo(self, accumulator, cursor):
         """Use the contents of an accumulator to update the daily hi/lows."""
         
@@ -1216,6 +2135,14 @@ class DaySummaryManager(Manager):
         # Then save the results:
         self._set_day_summary(_stats_dict, accumulator.timespan.stop, cursor)
         
+        # The months and years get the same hi/lows. The hours are kept from the
+        # archive records alone.
+        for _level in ['month', 'year']:
+            if _level in self._rollups:
+                _accum = self._get_rollup(_level, DaySummaryManager.rollup_spans[_level](accumulator.timespan.stop), cursor)
+                _accum.updateHiLo(accumulator)
+                self._set_rollup(_level, _accum, cursor)
+        
     def getAggregate(self, timespan, obs_type, aggregate_type, **option_dict):
         """Returns an aggregation of a statistical type for a given time period.
         It will use the daily summaries if possible, otherwise the archive table.
@@ -1238,13 +2165,17 @@ class DaySummaryManager(Manager):
         # We can use the day summary optimizations if the starting and ending times of
         # the aggregation interval sit on midnight boundaries, or are the first or last
         # records in the database.
-        if aggregate_type in ['last', 'lasttime'] or not (isMidnight(timespan.start) or \
-                                                          timespan.start == self.first_timestamp) \
-                                                  or not (isMidnight(timespan.stop)  or \
-                                                          timespan.stop  == self.last_timestamp):
-            
-            # Cannot use the day summaries. We'll have to calculate the aggregate
-            # using the regular archive table:
+        if aggregate_type in ['last', 'lasttime'] or not self._is_summary_span(timespan):
+
+            # Cannot use the day summaries alone. If the span includes some whole days, or whole
+            # hours with rollups, use the summaries for those, and the archive table for the rest:
+            if DaySummaryManager.hybrid_aggregation and aggregate_type in DaySummaryManager.hybrid_aggregates \
+                    and obs_type in self._get_hybrid_types():
+                _part_list = self._get_hybrid_parts(timespan, obs_type)
+                if any(_level for (_span, _level) in _part_list):
+                    return self._get_hybrid_aggregate(_part_list, obs_type, aggregate_type)
+
+            # Otherwise, we'll have to calculate the aggregate using the regular archive table:
             return Manager.getAggregate(self, timespan, obs_type, aggregate_type, 
                                           **option_dict)
 
@@ -1275,13 +2206,331 @@ class DaySummaryManager(Manager):
         # convert to lower-case:
         aggregate_type = aggregate_type.lower()
 
-        # Form the interpolation dictionary        
-        interDict = {'start'         : weeutil.weeutil.startOfDay(timespan.start),
+        # Aggregates over periods that are over and done with will not change. Look for one
+        # calculated earlier, and otherwise save it for the next time:
+        _memoize = target_val is None and self._is_closed(timespan)
+        if _memoize:
+            _lastUpdate = self._read_metadata('lastUpdate')
+            _row = self.getSql(DaySummaryManager.agg_select_str % self.table_name,
+                               (timespan.start, timespan.stop, obs_type, aggregate_type))
+        else:
+            _row = None
+        if _row:
+            _result = _row[0]
+            if _result is not None and aggregate_type in DaySummaryManager.int_aggregates:
+                _result = int(_result)
+        else:
+            _result = self._calc_day_aggregate(timespan, obs_type, aggregate_type, target_val)
+            if _memoize:
+                self._save_aggregates(timespan, obs_type, {aggregate_type: _result}, _lastUpdate)
+
+        # Look up the unit type and group of this combination of stats type and aggregation:
+        (t, g) = weewx.units.getStandardUnitType(self.std_unit_system, obs_type, aggregate_type)
+        # Form the value tuple and return it:
+        return weewx.units.ValueTuple(_result, t, g)
+
+    def getAggregates(self, timespan, obs_type, aggregate_types, **option_dict):
+        """Specialized version that calculates those aggregates in day_batch_aggregates
+        from the daily summaries together, if the span allows it. Any saved aggregates
+        of a closed period are read with a single query.
+
+        Arguments are as for Manager.getAggregates()."""
+
+        if obs_type not in self.daykeys or option_dict.get('val') is not None:
+            # Heating and cooling degree days, and aggregates with a value, one at a time:
+            return dict((_agg, self.getAggregate(timespan, obs_type, _agg, **option_dict))
+                        for _agg in aggregate_types)
+
+        if not self._is_summary_span(timespan):
+            if DaySummaryManager.hybrid_aggregation and obs_type in self._get_hybrid_types() and \
+                    any(_level for (_span, _level) in self._get_hybrid_parts(timespan, obs_type)):
+                # The daily summaries, or rollups, are of use for some of the span. That
+                # beats a single pass over the archive records of all of it.
+                return dict((_agg, self.getAggregate(timespan, obs_type, _agg, **option_dict))
+                            for _agg in aggregate_types)
+            return Manager.getAggregates(self, timespan, obs_type, aggregate_types, **option_dict)
+
+        _value_dict = {}
+        _memoize = self._is_closed(timespan)
+        if _memoize:
+            _lastUpdate = self._read_metadata('lastUpdate')
+            for (_agg, _value) in self.genSql(DaySummaryManager.agg_select_all_str % self.table_name,
+                                              (timespan.start, timespan.stop, obs_type)):
+                if _value is not None and _agg in DaySummaryManager.int_aggregates:
+                    _value = int(_value)
+                _value_dict[_agg] = _value
+
+        _batch_list = [_agg for _agg in aggregate_types
+                       if _agg in DaySummaryManager.day_batch_aggregates and _agg not in _value_dict]
+        if _batch_list:
+            _calc_dict = self._calc_day_aggregates(timespan, obs_type, _batch_list)
+            if _memoize:
+                self._save_aggregates(timespan, obs_type, _calc_dict, _lastUpdate)
+            _value_dict.update(_calc_dict)
+
+        _results = {}
+        for _agg in aggregate_types:
+            if _agg in _value_dict:
+                (t, g) = weewx.units.getStandardUnitType(self.std_unit_system, obs_type, _agg)
+                _results[_agg] = weewx.units.ValueTuple(_value_dict[_agg], t, g)
+            else:
+                _results[_agg] = self.getAggregate(timespan, obs_type, _agg, **option_dict)
+        return _results
+
+    def getSpanAggregates(self, span_list, obs_type, aggregate_types, **option_dict):
+        """Specialized version for periods made up of whole days. The daily summaries
+        of all the periods are read with a single query, and the aggregates in
+        day_stats_aggregates are calculated from them. Any others are left to
+        getAggregate().
+
+        Arguments are as for Manager.getSpanAggregates()."""
+
+        if not span_list or obs_type not in self.daykeys or option_dict.get('val') is not None:
+            return [self.getAggregates(_span, obs_type, aggregate_types, **option_dict)
+                    for _span in span_list]
+
+        if not all(isMidnight(_span.start) and isMidnight(_span.stop) for _span in span_list):
+            # Periods that can use the daily summaries by themselves, such as one starting
+            # with the first record, get them. The rest come from the archive table.
+            _archive_list = [_span for _span in span_list if not self._is_summary_span(_span)]
+            _archive_dict = dict(zip(_archive_list, Manager.getSpanAggregates(self, _archive_list, obs_type,
+                                                                              aggregate_types, **option_dict)))
+            return [_archive_dict[_span] if _span in _archive_dict else
+                    self.getAggregates(_span, obs_type, aggregate_types, **option_dict)
+                    for _span in span_list]
+
+        _interDict = self._get_summary_columns('day', obs_type)
+        _stats_list = [_stats_name for (_stats_name, _) in DaySummaryManager.stats_schema]
+        _row_list = list(self.genSql("SELECT dateTime, %s FROM %%(day_table)s WHERE dateTime >= ? AND dateTime < ? "
+                                     "ORDER BY dateTime" % ', '.join("%%(%s)s" % _stats_name for _stats_name in _stats_list)
+                                     % _interDict, (span_list[0].start, span_list[-1].stop)))
+        _ts_list = [_row[0] for _row in _row_list]
+
+        _results = []
+        for _span in span_list:
+            # The days of this period:
+            _stats_rows = [_row[1:] for _row in _row_list[bisect.bisect_left(_ts_list, _span.start):
+                                                          bisect.bisect_left(_ts_list, _span.stop)]]
+            _agg_dict = {}
+            for _agg in aggregate_types:
+                if _agg in DaySummaryManager.day_stats_aggregates:
+                    (t, g) = weewx.units.getStandardUnitType(self.std_unit_system, obs_type, _agg)
+                    _agg_dict[_agg] = weewx.units.ValueTuple(_aggregate_day_stats(_stats_rows, _agg), t, g)
+                else:
+                    _agg_dict[_agg] = self.getAggregate(_span, obs_type, _agg, **option_dict)
+            _results.append(_agg_dict)
+        return _results
+
+    def _is_summary_span(self, timespan):
+        """Whether a timespan starts and ends on midnight, or with the first or last
+        records in the database, so that it is made up of whole daily summaries."""
+        return (isMidnight(timespan.start) or timespan.start == self.first_timestamp) and \
+            (isMidnight(timespan.stop) or timespan.stop == self.last_timestamp)
+
+    def _get_whole_periods(self, level, timespan):
+        """Return the span of the whole periods of a level, such as 'day', within
+        a timespan, or None if there are none."""
+        _span_fn = DaySummaryManager.rollup_spans[level]
+        _start_span = _span_fn(timespan.start + 1)
+        _start = timespan.start if _start_span.start == timespan.start else _start_span.stop
+        _stop = _span_fn(timespan.stop + 1).start
+        return weeutil.weeutil.TimeSpan(_start, _stop) if _start < _stop else None
+
+    @staticmethod
+    def _is_boundary(level, time_ts):
+        """Whether a time is the boundary between two periods of a level."""
+        return DaySummaryManager.rollup_spans[level](time_ts + 1).start == time_ts
+
+    def _get_summary_columns(self, level, obs_type):
+        """Returns an interpolation dictionary with the table holding the statistics
+        of a type for a level, as 'day_table', and the column holding each statistic.
+        The level is 'day' for the daily summaries, otherwise a rollup in use."""
+        if level == 'day':
+            _interDict = {'day_table' : self._day_table(obs_type)}
+            for _stats_name, _ in DaySummaryManager.vecstats_schema:
+                _interDict[_stats_name] = self._day_column(obs_type, _stats_name)
+        else:
+            _interDict = {'day_table' : self._rollups[level][0]}
+            for _stats_name, _ in DaySummaryManager.vecstats_schema:
+                _interDict[_stats_name] = '%s_%s' % (obs_type, _stats_name)
+        return _interDict
+
+    def _get_hybrid_types(self):
+        """Return the types whose daily summaries hold exactly the sums, counts and
+        extremes of the archive records, save for any extremes from LOOP data."""
+        if self._hybrid_types is None:
+            self._hybrid_types = self._get_sql_backfill_types()[0]
+        return self._hybrid_types
+
+    def _get_hybrid_parts(self, timespan, obs_type):
+        """Split a timespan into the whole days in the middle, and what is left over
+        at either end. If there are hourly rollups of the type, a part left over
+        that is made up of whole hours is taken from those.
+        
+        returns: A list of 2-way tuples (span, level), in order. The level is 'day'
+        or 'hour' for parts made up of whole periods, or None for parts that have
+        to be taken from the archive table."""
+        _whole_span = self._get_whole_periods('day', timespan)
+        if _whole_span:
+            _part_list = [_part for _part in ((weeutil.weeutil.TimeSpan(timespan.start, _whole_span.start), None),
+                                              (_whole_span, 'day'),
+                                              (weeutil.weeutil.TimeSpan(_whole_span.stop, timespan.stop), None))
+                          if _part[0].start < _part[0].stop]
+        else:
+            _part_list = [(timespan, None)]
+        if 'hour' in self._rollups and obs_type in self._rollups['hour'][1]:
+            _part_list = [(_span, 'hour' if _level is None and self._is_boundary('hour', _span.start) 
+                                            and self._is_boundary('hour', _span.stop) else _level)
+                          for (_span, _level) in _part_list]
+        return _part_list
+
+    def _get_hybrid_aggregate(self, part_list, obs_type, aggregate_type):
+        """Calculate an aggregate using the daily summaries, or the hourly rollups,
+        for the parts of a timespan made up of whole days or hours, and the archive
+        table for the rest. The results are the same as from the archive table alone.
+        
+        part_list: The parts of the timespan. See _get_hybrid_parts().
+        
+        Other arguments are as for getAggregate().
+        
+        returns: A value tuple."""
+        
+        _archive_dict = {'table_name' : self.table_name,
+                         'obs_type'   : obs_type}
+        
+        if aggregate_type in ['sum', 'count', 'avg']:
+            # Add up the parts. Like the archive table, there is no sum or average without any data.
+            _sum = 0.0
+            _count = 0
+            for (_span, _level) in part_list:
+                if _level is None:
+                    _row = self.getSql("SELECT SUM(%(obs_type)s), COUNT(%(obs_type)s) FROM %(table_name)s "
+                                       "WHERE dateTime > ? AND dateTime <= ?" % _archive_dict, _span)
+                else:
+                    _row = self.getSql("SELECT SUM(%(sum)s), SUM(%(count)s) FROM %(day_table)s "
+                                       "WHERE dateTime >= ? AND dateTime < ?" % self._get_summary_columns(_level, obs_type), _span)
+                if _row[1]:
+                    _sum += float(_row[0])
+                    _count += int(_row[1])
+            if aggregate_type == 'count':
+                _result = _count
+            elif not _count:
+                _result = None
+            elif aggregate_type == 'sum':
+                _result = _sum
+            else:
+                _result = _sum / _count
+        else:
+            _result = self._get_hybrid_extreme(part_list, aggregate_type, _archive_dict)
+
+        (t, g) = weewx.units.getStandardUnitType(self.std_unit_system, obs_type, aggregate_type)
+        return weewx.units.ValueTuple(_result, t, g)
+
+    def _get_hybrid_extreme(self, part_list, aggregate_type, interDict):
+        """Find the minimum or maximum of the archive records, or the time of the
+        first record to have it, using the daily summaries and hourly rollups to
+        narrow the search.
+        
+        The extremes in the daily summaries may come from LOOP packets, and so be
+        beyond anything in the archive table. They are used as a bound: the archive
+        records of a day are looked at only if its extreme could beat the best
+        found so far. The same goes for the hours."""
+        
+        _func = 'MIN' if aggregate_type.startswith('min') else 'MAX'
+        _stats_name = _func.lower()
+        if _func == 'MIN':
+            _beats = lambda x, y: y is None or x < y
+        else:
+            _beats = lambda x, y: y is None or x > y
+        _archive_sql = "SELECT %s(%%(obs_type)s) FROM %%(table_name)s WHERE dateTime > ? AND dateTime <= ?" % _func
+        
+        _best = None
+        # The extremes of the days and hours, with the start and level of each:
+        _unit_list = []
+        for (_span, _level) in part_list:
+            if _level is None:
+                _value = self.getSql(_archive_sql % interDict, _span)[0]
+                if _value is not None and _beats(_value, _best):
+                    _best = _value
+            else:
+                _unit_list.extend((_unit_value, _start_ts, _level) for (_start_ts, _unit_value) in 
+                                  self.genSql("SELECT dateTime, %%(%s)s FROM %%(day_table)s WHERE dateTime >= ? "
+                                              "AND dateTime < ? AND %%(%s)s IS NOT NULL" % (_stats_name, _stats_name)
+                                              % self._get_summary_columns(_level, interDict['obs_type']), _span))
+        # Look at the most extreme first:
+        _unit_list.sort(reverse=(_func == 'MAX'))
+        for (_unit_value, _start_ts, _level) in _unit_list:
+            if not _beats(_unit_value, _best):
+                break
+            _value = self.getSql(_archive_sql % interDict, DaySummaryManager.rollup_spans[_level](_start_ts + 1))[0]
+            if _value is not None and _beats(_value, _best):
+                _best = _value
+        
+        if aggregate_type in ['min', 'max'] or _best is None:
+            return _best
+        
+        # The time of the first record with the extreme. Look in the parts, in order, that could have it:
+        _span_list = [DaySummaryManager.rollup_spans[_level](_start_ts + 1) 
+                      for (_unit_value, _start_ts, _level) in _unit_list if not _beats(_best, _unit_value)] + \
+                     [_span for (_span, _level) in part_list if _level is None]
+        _span_list.sort()
+        for _span in _span_list:
+            _time = self.getSql("SELECT MIN(dateTime) FROM %(table_name)s WHERE dateTime > ? AND dateTime <= ? "
+                                "AND %(obs_type)s = ?" % interDict, _span + (_best,))[0]
+            if _time is not None:
+                return _time
+        return None
+
+    def _save_aggregates(self, timespan, obs_type, value_dict, lastUpdate):
+        """Save aggregates of a closed period in the table of aggregates.
+        
+        They are saved only if metadata 'lastUpdate' still has the value it had
+        before they were calculated. Otherwise, a late record may have changed the
+        period since, and removed its saved aggregates. The check and the save are
+        done in a single transaction, so no record can get in between.
+
+        value_dict: A dictionary with the value of each aggregate type.
+
+        lastUpdate: The value of metadata 'lastUpdate' read before the aggregates
+        were calculated."""
+        try:
+            with weedb.Transaction(self.connection) as _cursor:
+                if self._read_metadata('lastUpdate', _cursor) != lastUpdate:
+                    return
+                for (_agg, _value) in value_dict.iteritems():
+                    _cursor.execute(DaySummaryManager.agg_replace_str % self.table_name,
+                                    (timespan.start, timespan.stop, obs_type, _agg, _value))
+        except weedb.OperationalError, e:
+            # Not fatal. They will be calculated again next time.
+            syslog.syslog(syslog.LOG_INFO, "manager: Unable to save aggregates of '%s': %s"
+                          % (obs_type, e))
+
+    def _is_closed(self, timespan):
+        """Whether a timespan of more than one day lies wholly before the current day,
+        and so its aggregates can be kept in the table of aggregates. The aggregates
+        of single days are just as easily read from the daily summaries."""
+        return self.last_timestamp is not None and \
+            timespan.stop <= weeutil.weeutil.startOfArchiveDay(self.last_timestamp) and \
+            weeutil.weeutil.startOfArchiveDay(timespan.stop) > timespan.start
+
+    def _calc_day_aggregate(self, timespan, obs_type, aggregate_type, target_val):
+        """Calculate an aggregate from the daily summaries. Arguments are as for
+        getAggregate, except that the value 'target_val' has already been converted
+        to the unit system of the database.
+        
+        returns: The aggregate value, or None if it could not be calculated."""
+
+        (_level, _start) = self._get_summary_level(timespan, obs_type, [aggregate_type])
+
+        # Form the interpolation dictionary
+        interDict = {'start'         : _start,
                      'stop'          : timespan.stop,
                      'obs_key'       : obs_type,
                      'aggregate_type': aggregate_type,
                      'val'           : target_val,
                      'table_name'    : self.table_name}
+        # Add the table, and the names of the columns holding each statistic:
+        interDict.update(self._get_summary_columns(_level, obs_type))
             
         # Run the query against the database:
         _row = self.getSql(DaySummaryManager.sqlDict[aggregate_type] % interDict)
@@ -1302,8 +2551,7 @@ class DaySummaryManager(Manager):
             # These aggregates are passed through 'as is'.
             _result = _row[0]
         
-        elif aggregate_type in ['mintime', 'maxmintime', 'maxtime', 'minmaxtime', 'maxsumtime',
-                               'count', 'max_ge', 'max_le', 'min_ge', 'min_le', 'sum_ge']:
+        elif aggregate_type in DaySummaryManager.int_aggregates:
             # These aggregates are always integers:
             _result = int(_row[0])
 
@@ -1325,11 +2573,158 @@ class DaySummaryManager(Manager):
             # Unknown aggregation. Return None
             _result = None
 
-        # Look up the unit type and group of this combination of stats type and aggregation:
-        (t, g) = weewx.units.getStandardUnitType(self.std_unit_system, obs_type, aggregate_type)
-        # Form the value tuple and return it:
-        return weewx.units.ValueTuple(_result, t, g)
+        return _result
+
+    def _calc_day_aggregates(self, timespan, obs_type, aggregate_types):
+        """Calculate a list of aggregation types out of day_batch_aggregates from the
+        daily summaries, with one query for the aggregates and another for the times
+        of the extremes. The results are the same as from _calc_day_aggregate().
+
+        returns: A dictionary of the aggregate values, keyed by aggregation type."""
+
+        (_level, _start) = self._get_summary_level(timespan, obs_type, aggregate_types)
+        _interDict = self._get_summary_columns(_level, obs_type)
+
+        # The times of the extremes need the extremes themselves:
+        _agg_list = [_agg for _agg in DaySummaryManager.day_batch_sql
+                     if _agg in aggregate_types or
+                     any(DaySummaryManager.day_batch_times[_time_agg][0] == _agg
+                         for _time_agg in aggregate_types if _time_agg in DaySummaryManager.day_batch_times)]
+        _expr_list = [_expr for _agg in _agg_list for _expr in DaySummaryManager.day_batch_sql[_agg]]
+        _row = self.getSql("SELECT %s FROM %%(day_table)s WHERE dateTime >= ? AND dateTime < ?"
+                           % ', '.join(_expr_list) % _interDict, (_start, timespan.stop))
+
+        _value_dict = {}
+        _offset = 0
+        for _agg in _agg_list:
+            _N = len(DaySummaryManager.day_batch_sql[_agg])
+            _values = _row[_offset:_offset + _N] if _row else _N * (None,)
+            _offset += _N
+            # As for a single aggregate, any nulls mean it could not be calculated:
+            if None in _values:
+                _value_dict[_agg] = None
+            elif _agg == 'count':
+                _value_dict[_agg] = int(_values[0])
+            elif _agg == 'avg':
+                _value_dict[_agg] = _values[0] / _values[1] if _values[1] else None
+            elif _agg == 'rms':
+                _value_dict[_agg] = math.sqrt(_values[0] / _values[1]) if _values[1] else None
+            else:
+                _value_dict[_agg] = _values[0]
+
+        # The time of the first day with each extreme:
+        _time_list = [_agg for _agg in aggregate_types if _agg in DaySummaryManager.day_batch_times
+                      and _value_dict[DaySummaryManager.day_batch_times[_agg][0]] is not None]
+        if _time_list:
+            _row = self.getSql("SELECT %s FROM %%(day_table)s WHERE dateTime >= ? AND dateTime < ?"
+                               % ', '.join("MIN(CASE WHEN %%(%s)s = ? THEN %%(%s)s END)"
+                                           % DaySummaryManager.day_batch_times[_agg][1:] for _agg in _time_list)
+                               % _interDict,
+                               tuple(_value_dict[DaySummaryManager.day_batch_times[_agg][0]]
+                                     for _agg in _time_list) + (_start, timespan.stop))
+            for (_agg, _value) in zip(_time_list, _row):
+                _value_dict[_agg] = int(_value) if _value is not None else None
+
+        return dict((_agg, _value_dict.get(_agg)) for _agg in aggregate_types)
+
+    def _get_summary_level(self, timespan, obs_type, aggregate_types):
+        """Return the level, and the start of the first period, of the summaries
+        from which a list of aggregation types can be calculated over a span made up
+        of whole days. If the span is made up of whole months or years with rollups,
+        those are used rather than the days.
+
+        returns: A 2-way tuple (level, start)."""
+        _level_list = [self._get_rollup_level(timespan, obs_type, _agg) for _agg in aggregate_types]
+        _level = _level_list[0] if _level_list and all(_level == _level_list[0] for _level in _level_list) else None
+        if _level:
+            return (_level, DaySummaryManager.rollup_spans[_level](timespan.start + 1).start)
+        return ('day', weeutil.weeutil.startOfDay(timespan.start))
+
+    def _get_rollup_level(self, timespan, obs_type, aggregate_type):
+        """Return the longest period with rollups, 'year' or 'month', that a span
+        is made up of, or None if there is none. Like the daily summaries, the span
+        may also start with the first record in the database and end with the last."""
+        if aggregate_type not in DaySummaryManager.rollup_aggregates:
+            return None
+        for _level in ['year', 'month']:
+            if _level in self._rollups and obs_type in self._rollups[_level][1] and \
+                    (timespan.start == self.first_timestamp or self._is_boundary(_level, timespan.start)) and \
+                    (timespan.stop  == self.last_timestamp  or self._is_boundary(_level, timespan.stop)):
+                return _level
+        return None
+
+    def _genAggregates(self, span_list, sql_type, aggregate_type, cursor):
+        """Specialized version that uses the daily summaries, or the rollups, for
+        aggregation intervals made up of whole periods. The results are the same
+        as from the archive table."""
+        if DaySummaryManager.summary_vectors and aggregate_type in DaySummaryManager.summary_vector_aggregates \
+                and sql_type in self._get_hybrid_types():
+            _level = self._get_vector_level(span_list, sql_type)
+            if _level:
+                return self._genSummaryAggregates(span_list, sql_type, aggregate_type, _level, cursor)
+        return super(DaySummaryManager, self)._genAggregates(span_list, sql_type, aggregate_type, cursor)
+
+    def _get_vector_level(self, span_list, sql_type):
+        """Return the longest period, out of the days and the rollups in use, such
+        that all the aggregation intervals in span_list, except perhaps the first
+        and the last, are made up of whole periods. Returns None if there is none."""
+        for _level in ['year', 'month', 'day', 'hour']:
+            if _level != 'day' and (_level not in self._rollups or sql_type not in self._rollups[_level][1]):
+                continue
+            if all(self._is_boundary(_level, _span.stop) for _span in span_list[:-1]) and \
+                    (self._is_boundary(_level, span_list[0].start) or self._is_boundary(_level, span_list[-1].stop) 
+                     or len(span_list) > 2):
+                return _level
+        return None
+
+    def _genSummaryAggregates(self, span_list, sql_type, aggregate_type, level, cursor):
+        """Generator function that calculates the sum, count or average of a type for
+        every aggregation interval. The intervals made up of whole periods of a level
+        are calculated from the daily summaries or the rollups, using a single GROUP BY
+        query, and any others by getAggregate() for their parts.
+        
+        yields: 2-way tuples (span, row), as does _genGroupedAggregates()."""
+        
+        _whole_list = [_span for _span in span_list 
+                       if self._is_boundary(level, _span.start) and self._is_boundary(level, _span.stop)]
+        # For looking up the intervals, of which there can be thousands. They are
+        # told apart by their starts, which hash better than the spans themselves:
+        _whole_starts = set(int(_span.start) for _span in _whole_list)
+        _results = dict()
+        if _whole_list:
+            # The row of a period is keyed by its start, so move it inside the period:
+            _interDict = self._get_summary_columns(level, sql_type)
+            _interDict['bucket'] = self._bucket_expression(_whole_list, 'dateTime + 1')
+            _sql_str = "SELECT %(bucket)s AS bucket, SUM(%(sum)s), SUM(%(count)s) FROM %(day_table)s "\
+                "WHERE dateTime >= ? AND dateTime < ? GROUP BY bucket" % _interDict
+            for _row in cursor.execute(_sql_str, (_whole_list[0].start, _whole_list[-1].stop)):
+                _results[int(_row[0])] = _row[1:]
+        
+        for stamp in span_list:
+            if int(stamp.start) in _whole_starts:
+                (_sum, _count) = _results.get(int(stamp.start), (None, None))
+                _count = int(_count or 0)
+                if aggregate_type == 'count':
+                    _result = _count
+                elif not _count:
+                    _result = None
+                elif aggregate_type == 'sum':
+                    _result = float(_sum)
+                else:
+                    _result = float(_sum) / _count
+            else:
+                _result = self._get_hybrid_aggregate(self._get_hybrid_parts(stamp, sql_type),
+                                                     sql_type, aggregate_type)[0]
+            yield (stamp, (_result, self.std_unit_system, self.std_unit_system))
+
+    def updateValue(self, timestamp, obs_type, new_value):
+        """Specialized version that also removes any saved aggregates that
+        include the timestamp."""
         
+        super(DaySummaryManager, self).updateValue(timestamp, obs_type, new_value)
+        _day_span = weeutil.weeutil.archiveDaySpan(timestamp)
+        self._invalidate_aggregates(_day_span.start, _day_span.stop)
+
     def exists(self, obs_type):
         """Checks whether the observation type exists in the database."""
 
@@ -1342,7 +2737,7 @@ class DaySummaryManager(Manager):
         return self.exists(obs_type) and self.getAggregate(timespan, obs_type, 'count')[0] != 0
 
     def backfill_day_summary(self, start_d=None, stop_d=None,
-                             progress_fn=show_progress, trans_days=5):
+                             progress_fn=show_progress, trans_days=5, fast=False, jobs=1):
         
         """Fill the daily summaries from an archive database.
           
@@ -1366,6 +2761,17 @@ class DaySummaryManager(Manager):
           
         trans_day: Number of days of archive data to be used for each daily
         summaries database transaction. [Optional. Default is 5.] 
+        
+        fast: If True, calculate the summaries of scalar types with set-based SQL,
+        rather than by running every record through an accumulator. Progress is
+        then reported once per transaction. See _calc_sql_day_summaries().
+        [Optional. Default is False.]
+        
+        jobs: The number of worker processes used to calculate the summaries. Each
+        calculates the days of a whole transaction, while this process writes the
+        results, in order, as before. This requires that the manager was opened
+        with open() or open_with_create(). [Optional. Default is 1, that is, no
+        worker processes.]
           
         returns: A 2-way tuple (nrecs, ndays) where 
           nrecs is the number of records backfilled;
@@ -1429,6 +2835,16 @@ class DaySummaryManager(Manager):
     
         nrecs = 0
         ndays = 0
+        # The time rebuilt, for the rollups:
+        start_rebuild = time.mktime(start_d.timetuple())
+        stop_rebuild  = time.mktime((stop_d + datetime.timedelta(days=1)).timetuple())
+        
+        if jobs > 1 and self.database_dict is None:
+            syslog.syslog(syslog.LOG_INFO, "manager: No database dictionary. Backfilling without worker processes")
+            jobs = 1
+        if jobs > 1:
+            # The worker processes calculate the summaries for each transaction, in the same order
+            _chunk_gen = self._genParallelDaySummaries(start_d, stop_d, trans_days, fast, jobs)
          
         while start_d <= stop_d:
             # Calculate the last date included in this transaction
@@ -1436,42 +2852,56 @@ class DaySummaryManager(Manager):
             day_accum = None
 
             with weedb.Transaction(self.connection) as cursor:
-                # Go through all the archive records in the time span, adding them to the
-                # daily summaries
                 start_batch = time.mktime(start_d.timetuple())
                 stop_batch  = time.mktime((stop_transaction + datetime.timedelta(days=1)).timetuple())
-                for rec in self.genBatchRecords(start_batch, stop_batch):
-                    # If this is the very first record, fetch a new accumulator
-                    if not day_accum:
-                        # Get a TimeSpan that include's the record's timestamp:
-                        timespan = weeutil.weeutil.archiveDaySpan(rec['dateTime'])
-                        # Get an empty day accumulator:
-                        day_accum = weewx.accum.Accum(timespan)
-                    weight = self._calc_weight(rec)
-                    # Try updating. If the time is out of the accumulator's time span, an
-                    # exception will get raised.
-                    try:
-                        day_accum.addRecord(rec, weight=weight)
-                    except weewx.accum.OutOfSpan:
-                        # The record is out of the time span.
-                        # Save the old accumulator:
+                if jobs > 1 or fast:
+                    # Calculate the summaries for all the days in the transaction at once:
+                    if jobs > 1:
+                        day_list = _chunk_gen.next()
+                    else:
+                        day_list = self._calc_sql_day_summaries(start_batch, stop_batch, cursor)
+                    for (day_accum, day_nrecs, day_last) in day_list:
                         self._set_day_summary(day_accum, None, cursor)
                         ndays += 1
-                        # Get a new accumulator:
-                        timespan = weeutil.weeutil.archiveDaySpan(rec['dateTime'])
-                        day_accum = weewx.accum.Accum(timespan)
-                        # try again
-                        day_accum.addRecord(rec, weight=weight)
+                        nrecs += day_nrecs
+                        lastUpdate = max(lastUpdate, day_last) if lastUpdate else day_last
+                    if progress_fn and lastUpdate:
+                        progress_fn(nrecs, lastUpdate)
+                else:
+                    # Go through all the archive records in the time span, adding them to the
+                    # daily summaries
+                    for rec in self.genBatchRecords(start_batch, stop_batch):
+                        # If this is the very first record, fetch a new accumulator
+                        if not day_accum:
+                            # Get a TimeSpan that include's the record's timestamp:
+                            timespan = weeutil.weeutil.archiveDaySpan(rec['dateTime'])
+                            # Get an empty day accumulator:
+                            day_accum = weewx.accum.Accum(timespan)
+                        weight = self._calc_weight(rec)
+                        # Try updating. If the time is out of the accumulator's time span, an
+                        # exception will get raised.
+                        try:
+                            day_accum.addRecord(rec, weight=weight)
+                        except weewx.accum.OutOfSpan:
+                            # The record is out of the time span.
+                            # Save the old accumulator:
+                            self._set_day_summary(day_accum, None, cursor)
+                            ndays += 1
+                            # Get a new accumulator:
+                            timespan = weeutil.weeutil.archiveDaySpan(rec['dateTime'])
+                            day_accum = weewx.accum.Accum(timespan)
+                            # try again
+                            day_accum.addRecord(rec, weight=weight)
                       
-                    lastUpdate = max(lastUpdate, rec['dateTime']) if lastUpdate else rec['dateTime']
-                    nrecs += 1
-                    if progress_fn and nrecs % 1000 == 0:
-                        progress_fn(nrecs, rec['dateTime'])
+                        lastUpdate = max(lastUpdate, rec['dateTime']) if lastUpdate else rec['dateTime']
+                        nrecs += 1
+                        if progress_fn and nrecs % 1000 == 0:
+                            progress_fn(nrecs, rec['dateTime'])
          
-                # We're done with this transaction. Record the daily summary for the last day unless it is empty
-                if day_accum and not day_accum.isEmpty:
-                    self._set_day_summary(day_accum, None, cursor)
-                    ndays += 1
+                    # We're done with this transaction. Record the daily summary for the last day unless it is empty
+                    if day_accum and not day_accum.isEmpty:
+                        self._set_day_summary(day_accum, None, cursor)
+                        ndays += 1
                 # Patch lastUpdate:
                 if lastUpdate:
                     self._write_metadata('lastUpdate', str(int(lastUpdate)), cursor)
@@ -1479,6 +2909,10 @@ class DaySummaryManager(Manager):
             # Advance
             start_d += datetime.timedelta(days=trans_days)
 
+        # The rollups of the days rebuilt have to be rebuilt as well:
+        if nrecs and self._rollups:
+            self._fill_rollups(start_rebuild, stop_rebuild)
+
         tdiff = time.time() - t1             
         if nrecs:
             syslog.syslog(syslog.LOG_INFO, 
@@ -1489,12 +2923,248 @@ class DaySummaryManager(Manager):
         
         return (nrecs, ndays)
 
+    def check_sql_day_summaries(self, start_d=None, stop_d=None, trans_days=5):
+        """Check that the daily summaries calculated with set-based SQL (see
+        backfill_day_summary() with fast=True) agree with those calculated by 
+        running every record through an accumulator. Nothing is written.
+        
+        start_d, stop_d: The first and last days to be checked, specified as 
+        datetime.date objects. [Optional. Default is the whole archive.]
+        
+        trans_days: Number of days to be calculated at a time. [Optional. Default is 5.]
+        
+        returns: A list of 4-way tuples (sod_ts, obs_type, stats_tuple, sql_stats_tuple), 
+        one for every type of every day where the two disagree."""
+        
+        if self.first_timestamp is None:
+            return []
+        if start_d is None:
+            start_d = datetime.date.fromtimestamp(self.first_timestamp)
+        if stop_d is None:
+            stop_d = datetime.date.fromtimestamp(self.last_timestamp)
+        
+        _diff_list = []
+        while start_d <= stop_d:
+            stop_batch_d = min(stop_d, start_d + datetime.timedelta(days=(trans_days-1)))
+            start_batch = time.mktime(start_d.timetuple())
+            stop_batch  = time.mktime((stop_batch_d + datetime.timedelta(days=1)).timetuple())
+            
+            _sql_dict = dict((day_accum.timespan.start, day_accum) for (day_accum, _, _) in
+                             self._calc_sql_day_summaries(start_batch, stop_batch))
+            _accum_dict = dict((day_accum.timespan.start, day_accum) for (day_accum, _, _) in
+                               self._calc_day_summaries(start_batch, stop_batch))
+            
+            for _sod_ts in sorted(set(_accum_dict) | set(_sql_dict)):
+                for _day_key in self.daykeys:
+                    _stats_tuple     = _accum_dict[_sod_ts][_day_key].getStatsTuple() \
+                        if _sod_ts in _accum_dict and _day_key in _accum_dict[_sod_ts] else None
+                    _sql_stats_tuple = _sql_dict[_sod_ts][_day_key].getStatsTuple() \
+                        if _sod_ts in _sql_dict and _day_key in _sql_dict[_sod_ts] else None
+                    if not _stats_equal(_stats_tuple, _sql_stats_tuple):
+                        _diff_list.append((_sod_ts, _day_key, _stats_tuple, _sql_stats_tuple))
+            
+            start_d = stop_batch_d + datetime.timedelta(days=1)
+        
+        return _diff_list
+
+    def _genParallelDaySummaries(self, start_d, stop_d, trans_days, fast, jobs):
+        """Generator function that calculates the daily summaries using a pool of
+        worker processes, each with its own connection to the database.
+        
+        The days from start_d through stop_d are divided into chunks of trans_days
+        days, the same as backfill_day_summary() does for its transactions.
+        
+        yields: For each chunk, in order, a list of 3-way tuples (day_accum, nrecs,
+        last_ts), as returned by _calc_day_summaries()."""
+        
+        _chunk_list = []
+        while start_d <= stop_d:
+            stop_chunk = min(stop_d, start_d + datetime.timedelta(days=(trans_days-1)))
+            _chunk_list.append((time.mktime(start_d.timetuple()),
+                                time.mktime((stop_chunk + datetime.timedelta(days=1)).timetuple()),
+                                fast))
+            start_d += datetime.timedelta(days=trans_days)
+        
+        _pool = multiprocessing.Pool(jobs, _init_backfill_worker, 
+                                     (self.__class__, self.database_dict, self.table_name))
+        try:
+            for _chunk in _pool.imap(_calc_backfill_chunk, _chunk_list):
+                # Rebuild the accumulators from their stats tuples:
+                _day_list = []
+                for (_sod_ts, _unit_system, _stats_dict, _nrecs, _last_ts) in _chunk:
+                    _day_accum = weewx.accum.Accum(weeutil.weeutil.archiveDaySpan(_sod_ts, 0))
+                    _day_accum.unit_system = _unit_system
+                    for _obs_type in _stats_dict:
+                        _day_accum.set_stats(_obs_type, _stats_dict[_obs_type])
+                        # These have yet to be stored
+                        _day_accum[_obs_type].dirty = True
+                    _day_list.append((_day_accum, _nrecs, _last_ts))
+                yield _day_list
+            _pool.close()
+        finally:
+            # Does nothing if the pool has already been closed and all its work is done
+            _pool.terminate()
+            _pool.join()
+
+    def _calc_day_summaries(self, start_ts, stop_ts):
+        """Calculate the daily summaries for the days in an interval by running
+        every archive record through an accumulator.
+        
+        start_ts, stop_ts: The interval. Both should be on day boundaries.
+        
+        returns: A list of 3-way tuples (day_accum, nrecs, last_ts), one for each 
+        day with records in it."""
+        
+        _day_list = []
+        for rec in self.genBatchRecords(start_ts, stop_ts):
+            if not _day_list or not _day_list[-1][0].timespan.includesArchiveTime(rec['dateTime']):
+                _day_list.append([weewx.accum.Accum(weeutil.weeutil.archiveDaySpan(rec['dateTime'])), 0, None])
+            _day_list[-1][0].addRecord(rec, weight=self._calc_weight(rec))
+            _day_list[-1][1] += 1
+            _day_list[-1][2] = rec['dateTime']
+        return [tuple(x) for x in _day_list]
+
+    def _calc_sql_day_summaries(self, start_ts, stop_ts, cursor=None):
+        """Calculate the daily summaries for the days in an interval, mostly in SQL.
+        
+        The summaries of scalar types that use the regular adder are calculated by
+        a single GROUP BY query over the whole interval, then one query per day 
+        finds the times of the highs and lows. Only the remaining types, such as
+        'wind', go through an accumulator, and for them only the columns they 
+        need are read from the archive.
+        
+        start_ts, stop_ts: The interval. Both should be on day boundaries.
+        
+        returns: A list of 3-way tuples (day_accum, nrecs, last_ts), one for each 
+        day with records in it. The statistics in day_accum are all marked as
+        changed."""
+        
+        span_list = [span for span in weeutil.weeutil.genDaySpans(start_ts, stop_ts) if span.start < stop_ts]
+        if not span_list:
+            return []
+        
+        (sql_types, column_list) = self._get_sql_backfill_types()
+        weight_str = "(60 * `interval`)" if self.version >= '2.0' else "1"
+        
+        _cursor = cursor or self.connection.cursor()
+        try:
+            # First, the statistics of the scalar types, plus what is needed to check the records:
+            _select_list = ["COUNT(*)", "MIN(usUnits)", "MAX(usUnits)", "MAX(dateTime)",
+                            "SUM(CASE WHEN `interval` IS NULL OR `interval` <= 0 THEN 1 ELSE 0 END)"]
+            for _obs_type in sql_types:
+                _select_list.extend(["MIN(`%s`)" % _obs_type, "MAX(`%s`)" % _obs_type,
+                                     "SUM(`%s`)" % _obs_type, "COUNT(`%s`)" % _obs_type,
+                                     "SUM(`%s` * %s)" % (_obs_type, weight_str),
+                                     "SUM(CASE WHEN `%s` IS NOT NULL THEN %s ELSE 0 END)" % (_obs_type, weight_str)])
+            _sql_str = "SELECT %s AS bucket, %s FROM %s WHERE dateTime > ? AND dateTime <= ? GROUP BY bucket" % \
+                (self._bucket_expression(span_list), ', '.join(_select_list), self.table_name)
+            _results = dict()
+            for _row in _cursor.execute(_sql_str, (span_list[0].start, span_list[-1].stop)):
+                _results[int(_row[0])] = _row[1:]
+            
+            # Then, any types that need an accumulator:
+            _accum_dict = {}
+            if column_list:
+                _sql_str = "SELECT dateTime, usUnits, `interval`, %s FROM %s WHERE dateTime > ? AND dateTime <= ? ORDER BY dateTime ASC" % \
+                    (', '.join(["`%s`" % _obs_type for _obs_type in column_list]), self.table_name)
+                _keys = ['dateTime', 'usUnits', 'interval'] + column_list
+                for _row in _cursor.execute(_sql_str, (span_list[0].start, span_list[-1].stop)):
+                    _rec = dict(zip(_keys, _row))
+                    _sod_ts = weeutil.weeutil.startOfArchiveDay(_rec['dateTime'])
+                    if _sod_ts not in _accum_dict:
+                        _accum_dict[_sod_ts] = weewx.accum.Accum(weeutil.weeutil.archiveDaySpan(_sod_ts, 0))
+                    _accum_dict[_sod_ts].addRecord(_rec, weight=self._calc_weight(_rec))
+            
+            _day_list = []
+            for _span in span_list:
+                if _span.start not in _results:
+                    continue
+                _row = _results[_span.start]
+                (_nrecs, _min_units, _max_units, _last_ts, _nbad) = _row[:5]
+                if _nbad:
+                    raise ValueError("Missing or non-positive value for record field 'interval' on %s" % 
+                                     timestamp_to_string(_span.start))
+                if _min_units != _max_units:
+                    raise ValueError("Unit system mismatch %d v. %d" % (_min_units, _max_units))
+                
+                _day_accum = _accum_dict.get(_span.start) or weewx.accum.Accum(_span)
+                _day_accum.unit_system = _min_units
+                
+                # Find the times of the highs and lows with a single query:
+                _time_list = []
+                _time_args = []
+                for (i, _obs_type) in enumerate(sql_types):
+                    (_min, _max) = _row[5 + 6*i: 7 + 6*i]
+                    if _min is not None:
+                        _time_list.extend(["MIN(CASE WHEN `%s` = ? THEN dateTime END)" % _obs_type] * 2)
+                        _time_args.extend([_min, _max])
+                if _time_list:
+                    _time_row = self.getSql("SELECT %s FROM %s WHERE dateTime > ? AND dateTime <= ?" %
+                                            (', '.join(_time_list), self.table_name),
+                                            _time_args + [_span.start, _span.stop], _cursor)
+                    _time_iter = iter(_time_row)
+                
+                for (i, _obs_type) in enumerate(sql_types):
+                    (_min, _max, _sum, _count, _wsum, _sumtime) = _row[5 + 6*i: 11 + 6*i]
+                    (_mintime, _maxtime) = (_time_iter.next(), _time_iter.next()) if _min is not None else (None, None)
+                    _day_accum.set_stats(_obs_type, (_min, _mintime, _max, _maxtime, 
+                                                     float(_sum or 0.0), int(_count), float(_wsum or 0.0), int(_sumtime or 0)))
+                    _day_accum[_obs_type].dirty = True
+                
+                _day_list.append((_day_accum, int(_nrecs), int(_last_ts)))
+            
+            return _day_list
+        finally:
+            if cursor is None:
+                _cursor.close()
+
+    def _get_sql_backfill_types(self):
+        """Returns a 2-way tuple (sql_types, column_list). The first is a list of
+        the types whose daily summaries can be calculated with set-based SQL. The
+        second is a list of the archive columns needed to calculate the rest by
+        accumulator."""
+        
+        # A type can be done in SQL if it is a scalar that uses the regular
+        # adder. The wind adder also adds windSpeed as a regular scalar.
+        sql_types = []
+        column_set = set()
+        for _obs_type in self.obskeys:
+            _add_function = weewx.accum.get_add_function(_obs_type)
+            if _obs_type in self.daykeys and \
+                    isinstance(weewx.accum.new_accumulator(_obs_type), weewx.accum.ScalarStats) and \
+                    _add_function in (weewx.accum.Accum.add_value, weewx.accum.Accum.add_wind_value):
+                sql_types.append(_obs_type)
+            if _add_function not in (weewx.accum.Accum.add_value, weewx.accum.Accum.noop, 
+                                     weewx.accum.Accum.check_units):
+                column_set.add(_obs_type)
+                if _add_function == weewx.accum.Accum.add_wind_value:
+                    column_set.update(['windDir', 'windGust', 'windGustDir'])
+        
+        # If every type can be done in SQL, there is no need to read the archive at all
+        if set(self.daykeys) <= set(sql_types):
+            return (sql_types, [])
+        column_list = [_obs_type for _obs_type in self.obskeys if _obs_type in column_set or _obs_type not in sql_types]
+        return (sql_types, column_list)
+
     #--------------------------- UTILITY FUNCTIONS -----------------------------------
 
     def _get_day_summary(self, sod_ts, cursor=None):
         """Return an instance of an appropriate accumulator, initialized to a given day's statistics.
+        
+        The accumulator of the last day written by _set_day_summary() is kept
+        in memory. It is returned, rather than being rebuilt from the database,
+        as long as nobody else has updated the daily summaries since, as shown
+        by metadata 'lastUpdate'. Because the caller may change it, the
+        accumulator is removed from memory until it is written again.
 
         sod_ts: The timestamp of the start-of-day of the desired day."""
+        
+        _cache, self._day_cache = self._day_cache, None
+        if _cache is not None:
+            (_day_accum, _lastUpdate) = _cache
+            if _day_accum.timespan.start == sod_ts and \
+                    self._read_metadata('lastUpdate', cursor) == _lastUpdate:
+                return _day_accum
                 
         # Get the TimeSpan for the day starting with sod_ts:
         _timespan = weeutil.weeutil.archiveDaySpan(sod_ts,0)
@@ -1505,6 +3175,11 @@ class DaySummaryManager(Manager):
         _cursor = cursor or self.connection.cursor()
 
         try:
+            if self.day_layout == 'wide':
+                # All the types are in a single row
+                self._read_wide_row(_day_accum, self._wide_select_str, self.daykeys, self._wide_stats, _cursor)
+                return _day_accum
+            
             # For each observation type, execute the SQL query and hand the results on
             # to the accumulator.
             for _day_key in self.daykeys:
@@ -1531,30 +3206,138 @@ class DaySummaryManager(Manager):
         # Make sure the new data uses the same unit system as the database.
         self._check_unit_system(day_accum.unit_system)
 
+        if self.day_layout == 'wide':
+            self._write_wide_day(day_accum, cursor)
+        else:
+            self._write_day_tables(day_accum, cursor)
+        
+        # Aggregates are kept only for periods before the current day. If this is an
+        # earlier day, they may include it:
+        if self.last_timestamp is not None and \
+                day_accum.timespan.start < weeutil.weeutil.startOfArchiveDay(self.last_timestamp):
+            self._invalidate_aggregates(day_accum.timespan.start, day_accum.timespan.stop, cursor)
+
+        # If requested, update the time of the last daily summary update:
+        if lastUpdate is not None:
+            self._write_metadata('lastUpdate',  str(int(lastUpdate)), cursor)
+            # Keep the accumulator in memory for the next update:
+            self._day_cache = (day_accum, str(int(lastUpdate)))
+        else:
+            self._day_cache = None
+
+    def _write_day_tables(self, day_accum, cursor):
+        """Write the statistics for a day, one table per type."""
+
         _sod = day_accum.timespan.start
 
         # For each daily summary type...
         for _summary_type in day_accum:
-            # Don't try an update for types not in the database:
-            if _summary_type not in self.daykeys:
+            # Don't try an update for types not in the database, or whose
+            # statistics have not changed since they were last read or written:
+            if _summary_type not in self.daykeys or not day_accum[_summary_type].dirty:
                 continue
             # ... get the stats tuple to be written to the database...
             _write_tuple = (_sod,) + day_accum[_summary_type].getStatsTuple()
             # ... and an appropriate SQL command with the correct number of question marks ...
-            _qmarks = ','.join(len(_write_tuple)*'?')
-            _sql_replace_str = "REPLACE INTO %s_day_%s VALUES(%s)" % (self.table_name, _summary_type, _qmarks)
+            _sql_replace_str = self._replace_cache.get(_summary_type)
+            if _sql_replace_str is None:
+                _qmarks = ','.join(len(_write_tuple)*'?')
+                _sql_replace_str = "REPLACE INTO %s_day_%s VALUES(%s)" % (self.table_name, _summary_type, _qmarks)
+                self._replace_cache[_summary_type] = _sql_replace_str
             # ... and write to the database. In case the type doesn't appear in the database,
             # be prepared to catch an exception:
             try:
                 cursor.execute(_sql_replace_str, _write_tuple)
+                day_accum[_summary_type].dirty = False
             except weedb.OperationalError, e:
                 syslog.syslog(syslog.LOG_ERR, "manager: "
                               "Replace failed for database %s: %s"
                               % (self.database_name, e))
 
-        # If requested, update the time of the last daily summary update:
-        if lastUpdate is not None:
-            self._write_metadata('lastUpdate',  str(int(lastUpdate)), cursor)
+    def _write_wide_day(self, day_accum, cursor):
+        """Write the statistics for a day as a single row of the wide table."""
+        self._write_wide_row(day_accum, self._wide_replace_str, self.daykeys, self._wide_stats, cursor)
+
+    def _read_wide_row(self, accum, select_str, keys, stats_dict, cursor):
+        """Initialize an accumulator with the statistics in the row of a wide table
+        for the start of its timespan. Types without a row get empty statistics.
+        
+        select_str, keys, stats_dict: The statement to select the row, and the types
+        and statistics in it. See _get_wide_columns() and _get_wide_statements()."""
+        cursor.execute(select_str, (accum.timespan.start,))
+        _row = cursor.fetchone()
+        # Hand each type its own columns:
+        _offset = 0
+        for _key in keys:
+            _N = len(stats_dict[_key])
+            _stats_tuple = _row[_offset:_offset + _N] if _row is not None else None
+            # A type added to the row after it was written has no count:
+            if _stats_tuple and _stats_tuple[5] is None:
+                _stats_tuple = None
+            accum.set_stats(_key, _stats_tuple)
+            _offset += _N
+
+    def _write_wide_row(self, accum, replace_str, keys, stats_dict, cursor):
+        """Write the statistics in an accumulator as the row of a wide table for the
+        start of its timespan. Nothing is written unless some have changed.
+        
+        replace_str, keys, stats_dict: The statement to replace the row, and the types
+        and statistics in it. See _get_wide_columns() and _get_wide_statements()."""
+        
+        _keys = [_key for _key in keys if _key in accum]
+        # Nothing to do if none of the statistics have changed:
+        if not any(accum[_key].dirty for _key in _keys):
+            return
+
+        _write_list = [accum.timespan.start]
+        for _key in keys:
+            if _key in accum:
+                _write_list.extend(accum[_key].getStatsTuple())
+            else:
+                # Types missing from the accumulator get an empty summary
+                _write_list.extend(weewx.accum.VecStats.default_init 
+                                   if len(stats_dict[_key]) > len(DaySummaryManager.stats_schema) 
+                                   else weewx.accum.ScalarStats.default_init)
+        try:
+            cursor.execute(replace_str, _write_list)
+        except weedb.OperationalError, e:
+            syslog.syslog(syslog.LOG_ERR, "manager: "
+                          "Replace failed for database %s: %s"
+                          % (self.database_name, e))
+        else:
+            for _key in _keys:
+                accum[_key].dirty = False
+
+    def _get_rollup(self, level, timespan, cursor):
+        """Return an accumulator initialized to the rollup of a period.
+        
+        level: One of the levels in use, such as 'month'.
+        
+        timespan: The period, as returned by the function in rollup_spans."""
+        (_table, _keys, _stats_dict, _select_str, _) = self._rollups[level]
+        _accum = weewx.accum.Accum(timespan)
+        self._read_wide_row(_accum, _select_str, _keys, _stats_dict, cursor)
+        return _accum
+
+    def _set_rollup(self, level, accum, cursor):
+        """Write the rollup of a period."""
+        (_table, _keys, _stats_dict, _, _replace_str) = self._rollups[level]
+        self._write_wide_row(accum, _replace_str, _keys, _stats_dict, cursor)
+
+    def _add_to_rollups(self, record_list, cursor):
+        """Add a list of archive records, in order, to the rollups in use.
+        Records in the same period share a single read and write of its row."""
+        for _level in self._rollups:
+            _accum = None
+            for _record in record_list:
+                _span = DaySummaryManager.rollup_spans[_level](_record['dateTime'])
+                if _accum is None or _accum.timespan != _span:
+                    if _accum is not None:
+                        self._set_rollup(_level, _accum, cursor)
+                    _accum = self._get_rollup(_level, _span, cursor)
+                _accum.addRecord(_record, weight=self._calc_weight(_record))
+            if _accum is not None:
+                self._set_rollup(_level, _accum, cursor)
 
     def _calc_weight(self, record):
         if 'interval' not in record:
@@ -1564,6 +3347,14 @@ class DaySummaryManager(Manager):
         weight = 60.0 * record['interval'] if self.version >= '2.0' else 1.0
         return weight
 
+    def _invalidate_aggregates(self, start_ts, stop_ts, cursor=None):
+        """Remove the saved aggregates of all periods that overlap the time
+        from start_ts to stop_ts."""
+        if cursor:
+            cursor.execute(DaySummaryManager.agg_delete_str % self.table_name, (stop_ts, start_ts))
+        else:
+            self.connection.execute(DaySummaryManager.agg_delete_str % self.table_name, (stop_ts, start_ts))
+
     def _read_metadata(self, key, cursor=None):
         """Obtain a value from the daily summary metadata table.
 
@@ -1589,8 +3380,189 @@ class DaySummaryManager(Manager):
             if cursor is None:
                 _cursor.close()
 
+    def set_day_layout(self, layout):
+        """Convert the daily summaries to another storage layout.
+        
+        layout: 'table' for a table per type, or 'wide' for a single table
+        holding all types.
+        
+        returns: The number of days converted, or None if the daily summaries
+        were already in the requested layout."""
+        
+        if layout not in DaySummaryManager.layouts:
+            raise ValueError("Unknown daily summary layout '%s'" % layout)
+        if layout == self.day_layout:
+            return None
+        
+        _stats_dict = self._get_day_stats()
+        _sql_types = dict(DaySummaryManager.vecstats_schema)
+        _wide_table = '%s_day' % self.table_name
+
+        t1 = time.time()
+        with weedb.Transaction(self.connection) as _cursor:
+            if layout == 'wide':
+                # Create the wide table, with a row for every day found in any of the type tables...
+                _columns = ', '.join(["`%s_%s` %s" % (_day_key, _stats_name, _sql_types[_stats_name])
+                                      for _day_key in self.daykeys for _stats_name in _stats_dict[_day_key]])
+                _cursor.execute("CREATE TABLE %s (dateTime INTEGER NOT NULL UNIQUE PRIMARY KEY, %s);" 
+                                % (_wide_table, _columns))
+                _cursor.execute("INSERT INTO %s (dateTime) %s" % 
+                                (_wide_table, ' UNION '.join(["SELECT dateTime FROM %s_day_%s" % (self.table_name, _day_key)
+                                                              for _day_key in self.daykeys])))
+                _ndays = self.getSql("SELECT COUNT(*) FROM %s" % _wide_table, cursor=_cursor)[0]
+                # ... then fill in the columns of each type from its own table, and drop it:
+                for _day_key in self.daykeys:
+                    _day_table = '%s_day_%s' % (self.table_name, _day_key)
+                    _sets = ', '.join(["%s_%s = (SELECT %s FROM %s WHERE %s.dateTime = %s.dateTime)" % 
+                                       (_day_key, _stats_name, _stats_name, _day_table, _day_table, _wide_table)
+                                       for _stats_name in _stats_dict[_day_key]])
+                    _cursor.execute("UPDATE %s SET %s" % (_wide_table, _sets))
+                    _cursor.execute("DROP TABLE %s" % _day_table)
+            else:
+                _ndays = self.getSql("SELECT COUNT(*) FROM %s" % _wide_table, cursor=_cursor)[0]
+                # Create a table for each type from its columns in the wide table, then drop it:
+                for _day_key in self.daykeys:
+                    _columns = ', '.join(["`%s` %s" % (_stats_name, _sql_types[_stats_name]) 
+                                          for _stats_name in _stats_dict[_day_key]])
+                    _cursor.execute("CREATE TABLE %s_day_%s (dateTime INTEGER NOT NULL UNIQUE PRIMARY KEY, %s);" 
+                                    % (self.table_name, _day_key, _columns))
+                    _cursor.execute("INSERT INTO %s_day_%s SELECT dateTime, %s FROM %s WHERE %s_count IS NOT NULL" % 
+                                    (self.table_name, _day_key, 
+                                     ', '.join(["%s_%s" % (_day_key, _stats_name) for _stats_name in _stats_dict[_day_key]]),
+                                     _wide_table, _day_key))
+                _cursor.execute("DROP TABLE %s" % _wide_table)
+            self._write_metadata('Layout', layout, _cursor)
+        
+        self.day_layout = layout
+        self._day_cache = None
+        self._sync_daykeys()
+        syslog.syslog(syslog.LOG_INFO, "manager: Converted %d daily summaries in database '%s' to layout '%s' in %.2f seconds" 
+                      % (_ndays, self.database_name, layout, time.time() - t1))
+        return _ndays
+
+    def _get_day_stats(self):
+        """Returns a dictionary with the names of the statistics kept for each
+        type with a daily summary, in order."""
+        if self.day_layout == 'wide':
+            return self._wide_stats
+        return dict((_day_key, self.connection.columnsOf(self._day_table(_day_key))[1:]) 
+                    for _day_key in self.daykeys)
+
+    def rebuild_rollups(self, levels, progress_fn=None):
+        """Create the rollups of the daily summaries to some periods, and fill them.
+        Any rollups already in the database are dropped first.
+        
+        levels: A list of the periods to be rolled up to. Each should be one of
+        rollup_levels. An empty list just drops the rollups.
+        
+        progress_fn: This function will be called with the number of rows written
+        and the start of the last period, after every 100 rows. [Optional]
+        
+        returns: The number of rows written."""
+        
+        for _level in levels:
+            if _level not in DaySummaryManager.rollup_levels:
+                raise ValueError("Unknown rollup level '%s'" % _level)
+
+        _stats_dict = self._get_day_stats()
+        _sql_types = dict(DaySummaryManager.vecstats_schema)
+        _columns = ', '.join(["`%s_%s` %s" % (_day_key, _stats_name, _sql_types[_stats_name])
+                              for _day_key in self.daykeys for _stats_name in _stats_dict[_day_key]])
+
+        t1 = time.time()
+        with weedb.Transaction(self.connection) as _cursor:
+            for _level in self._rollups:
+                _cursor.execute("DROP TABLE %s" % self._rollups[_level][0])
+            for _level in DaySummaryManager.rollup_levels:
+                if _level in levels:
+                    _cursor.execute("CREATE TABLE %s_%s (dateTime INTEGER NOT NULL UNIQUE PRIMARY KEY, %s);" 
+                                    % (self.table_name, _level, _columns))
+        self._sync_rollups()
+        
+        _nrows = 0
+        if self._rollups and self.first_timestamp is not None:
+            _nrows = self._fill_rollups(self.first_timestamp - 1, self.last_timestamp, progress_fn)
+        syslog.syslog(syslog.LOG_INFO, "manager: Rebuilt rollups %s in database '%s' with %d rows in %.2f seconds" 
+                      % (levels, self.database_name, _nrows, time.time() - t1))
+        return _nrows
+
+    def _fill_rollups(self, start_ts, stop_ts, progress_fn=None):
+        """Rewrite the rows of the rollups in use for all periods that overlap the
+        time from start_ts (exclusive) to stop_ts (inclusive).
+        
+        The hours are calculated from the archive records, one transaction per
+        month. The months are calculated from the daily summaries, and the years
+        from the months, if those are in use, otherwise from the daily summaries.
+        
+        returns: The number of rows written."""
+        
+        _nrows = 0
+        for _level in DaySummaryManager.rollup_levels:
+            if _level not in self._rollups:
+                continue
+            _table = self._rollups[_level][0]
+            _span_fn = DaySummaryManager.rollup_spans[_level]
+            _start_ts = _span_fn(start_ts + 1).start
+            _stop_ts = _span_fn(stop_ts).stop
+            
+            if _level == 'hour':
+                while _start_ts < _stop_ts:
+                    _chunk_stop_ts = min(weeutil.weeutil.archiveMonthSpan(_start_ts + 1).stop, _stop_ts)
+                    with weedb.Transaction(self.connection) as _cursor:
+                        _cursor.execute("DELETE FROM %s WHERE dateTime >= ? AND dateTime < ?" % _table,
+                                        (_start_ts, _chunk_stop_ts))
+                        _accum = None
+                        for _rec in self.genBatchRecords(_start_ts, _chunk_stop_ts):
+                            if _accum is None or not _accum.timespan.includesArchiveTime(_rec['dateTime']):
+                                if _accum is not None:
+                                    self._set_rollup(_level, _accum, _cursor)
+                                    _nrows += 1
+                                    if progress_fn and _nrows % 100 == 0:
+                                        progress_fn(_nrows, _accum.timespan.start)
+                                _accum = weewx.accum.Accum(_span_fn(_rec['dateTime']))
+                            _accum.addRecord(_rec, weight=self._calc_weight(_rec))
+                        if _accum is not None:
+                            self._set_rollup(_level, _accum, _cursor)
+                            _nrows += 1
+                    _start_ts = _chunk_stop_ts
+            else:
+                # The shorter periods that make up this one:
+                _source = 'month' if _level == 'year' and 'month' in self._rollups else 'day'
+                _source_fn = DaySummaryManager.rollup_spans[_source]
+                with weedb.Transaction(self.connection) as _cursor:
+                    _cursor.execute("DELETE FROM %s WHERE dateTime >= ? AND dateTime < ?" % _table,
+                                    (_start_ts, _stop_ts))
+                    _span = _span_fn(_start_ts + 1)
+                    while _span.start < _stop_ts:
+                        _accum = weewx.accum.Accum(_span)
+                        _source_span = _source_fn(_span.start + 1)
+                        while _source_span.start < _span.stop:
+                            if _source == 'day':
+                                _source_accum = self._get_day_summary(_source_span.start, _cursor)
+                            else:
+                                _source_accum = self._get_rollup(_source, _source_span, _cursor)
+                            DaySummaryManager._merge_accum(_accum, _source_accum)
+                            _source_span = _source_fn(_source_span.stop + 1)
+                        self._set_rollup(_level, _accum, _cursor)
+                        _nrows += 1
+                        if progress_fn and _nrows % 100 == 0:
+                            progress_fn(_nrows, _span.start)
+                        _span = _span_fn(_span.stop + 1)
+        return _nrows
+
+    @staticmethod
+    def _merge_accum(accum, x_accum):
+        """Merge all the statistics in the accumulator of a shorter period into
+        the accumulator of a longer one."""
+        for _obs_type in x_accum:
+            if _obs_type not in accum:
+                accum[_obs_type] = weewx.accum.new_accumulator(_obs_type)
+            accum[_obs_type].mergeHiLo(x_accum[_obs_type])
+            accum[_obs_type].mergeSum(x_accum[_obs_type])
+
     def drop_daily(self):
-        """Drop the daily summaries."""
+        """Drop the daily summaries. Their layout is kept, so that they get
+        rebuilt in it."""
         
         syslog.syslog(syslog.LOG_INFO, 
                       "manager: Dropping daily summary tables from '%s' ..." % self.connection.database_name)
@@ -1598,10 +3570,18 @@ class DaySummaryManager(Manager):
             _all_tables = self.connection.tables()
             with weedb.Transaction(self.connection) as _cursor:
                 for _table_name in _all_tables:
-                    if _table_name.startswith('%s_day_' % self.table_name):
+                    if _table_name.startswith('%s_day_' % self.table_name) or \
+                            _table_name == '%s_day' % self.table_name:
                         _cursor.execute("DROP TABLE %s" % _table_name)
+                # Leave a metadata table behind that holds only the layout. There
+                # is nothing to keep for the default layout.
+                if self.day_layout != 'table':
+                    _cursor.execute(DaySummaryManager.meta_create_str % self.table_name)
+                    self._write_metadata('Layout', self.day_layout, _cursor)
 
             del self.daykeys
+            del self.day_layout
+            self._day_cache = None
         except weedb.OperationalError, e:
             syslog.syslog(syslog.LOG_ERR, "manager: "
                           "Drop summaries failed for database '%s': %s"
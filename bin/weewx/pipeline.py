@@ -0,0 +1,275 @@
+#
+#    Copyright (c) 2009-2016 Tom Keffer <tkeffer@gmail.com>
+#
+#    See the file LICENSE.txt for your full rights.
+#
+"""Fuse the services that filter LOOP packets into a single callback.
+
+Every LOOP packet goes through StdConvert, StdCalibrate, StdQC and
+StdWXCalculate in turn. Each of them works out afresh, for every key in the
+packet, what to do with it: which unit it is in and how to convert it, whether
+there are limits to check, and so on. A PacketPipeline does the work of a run
+of these services with one callback. What to do with each key is worked out
+once for each set of keys, then reused for every packet with the same keys.
+The results are the same as those of the services themselves."""
+
+# Python imports
+import syslog
+
+# weewx imports
+import weewx
+import weewx.engine
+import weewx.qc
+import weewx.units
+
+# The types of value that can be converted with a conversion function directly
+_scalar_types = (float, int, long)
+
+#==============================================================================
+#                    Class PacketPipeline
+#==============================================================================
+
+class PacketPipeline(object):
+    """Does the work of a run of services on a LOOP packet."""
+
+    def __init__(self, stages):
+        """Initialize an instance of PacketPipeline.
+
+        stages: A list of stages, one for each service, in the order the
+        services would have been called."""
+        self.stages = stages
+
+    def new_loop_packet(self, event):
+        packet = event.packet
+        try:
+            keys = frozenset(packet)
+            for stage in self.stages:
+                (packet, keys) = stage.run(packet, keys)
+        finally:
+            # Even if a stage fails, the event holds the packet as it was then,
+            # as it would with the services
+            event.packet = packet
+
+def fuse_callbacks(callbacks):
+    """Replace each run of callbacks of services that can be fused with the
+    callback of a PacketPipeline.
+
+    callbacks: A list of the callbacks bound to NEW_LOOP_PACKET, in order.
+
+    returns: A new list of callbacks."""
+    fused = []
+    stages = []
+    names = []
+    for callback in callbacks + [None]:
+        stage = _get_stage(callback) if callback is not None else None
+        if stage is not None:
+            stages.append(stage)
+            names.append(callback.im_self.__class__.__name__)
+            continue
+        if len(stages) > 1:
+            fused.append(PacketPipeline(stages).new_loop_packet)
+            syslog.syslog(syslog.LOG_INFO, "pipeline: Fused LOOP packet services %s" % ', '.join(names))
+        elif stages:
+            # Nothing to gain by fusing a single service. Keep its callback.
+            fused.append(stages[0].callback)
+        stages = []
+        names = []
+        if callback is not None:
+            fused.append(callback)
+    return fused
+
+def _get_stage(callback):
+    """Return a stage that does the work of a callback, or None if the callback
+    cannot be fused. Only the unmodified callbacks of the standard services can
+    be fused."""
+    # Delay the import until the engine is running. Module weewx.wxservices
+    # cannot be imported while weewx.engine is.
+    import weewx.wxservices
+    func = getattr(callback, 'im_func', None)
+    if func is None:
+        return None
+    service = callback.im_self
+    if func is weewx.engine.StdConvert.new_loop_packet.im_func:
+        stage = ConvertStage(service.converter, service.target_unit)
+    elif func is weewx.engine.StdCalibrate.new_loop_packet.im_func:
+        stage = CalibrateStage(service.corrections)
+    elif func is weewx.engine.StdQC.new_loop_packet.im_func:
+        # QC has no limits if they are missing from the configuration file
+        if type(service.qc) is not weewx.qc.QC or not hasattr(service.qc, 'min_max_dict'):
+            return None
+        stage = QCStage(service.qc)
+    elif func is weewx.wxservices.StdWXCalculate.new_loop_packet.im_func:
+        if getattr(service.calc.do_calculations, 'im_func', None) \
+                is not weewx.wxservices.WXCalculate.do_calculations.im_func:
+            return None
+        stage = WXCalculateStage(service.calc)
+    else:
+        return None
+    stage.callback = callback
+    return stage
+
+#==============================================================================
+#                    The stages
+#==============================================================================
+
+# Each stage has a method run(packet, keys), which does the work of a service
+# on a packet. The argument keys is a frozenset of the keys in the packet, or
+# None if they are not known. The method returns the packet, which may be a
+# new dictionary, and its keys, or None if they are not known.
+
+class ConvertStage(object):
+    """Does the work of StdConvert."""
+
+    def __init__(self, converter, target_unit):
+        self.dict_converter = DictConverter(converter)
+        self.target_unit = target_unit
+
+    def run(self, packet, keys):
+        if packet['usUnits'] == self.target_unit:
+            return (packet, keys)
+        if keys is None:
+            keys = frozenset(packet)
+        converted_packet = self.dict_converter.convertDict(packet, keys)
+        converted_packet['usUnits'] = self.target_unit
+        return (converted_packet, keys)
+
+class CalibrateStage(object):
+    """Does the work of StdCalibrate."""
+
+    def __init__(self, corrections):
+        # The corrections in the order StdCalibrate applies them
+        self.corrections = [(obs_type, corrections[obs_type]) for obs_type in corrections
+                            if obs_type != 'foo']
+        self.obs_types = frozenset(obs_type for (obs_type, _) in self.corrections)
+        # StdCalibrate evaluates the corrections in the namespace of module
+        # weewx.engine
+        self.namespace = vars(weewx.engine)
+
+    def run(self, packet, keys):
+        namespace = self.namespace
+        for (obs_type, correction) in self.corrections:
+            try:
+                packet[obs_type] = eval(correction, namespace, packet)
+            except (TypeError, NameError):
+                pass
+            except ValueError, e:
+                syslog.syslog(syslog.LOG_ERR, "engine: StdCalibration loop error %s" % e)
+        # A correction of a type that is not in the packet may have added it
+        if keys is not None and not self.obs_types <= keys:
+            keys = None
+        return (packet, keys)
+
+class QCStage(object):
+    """Does the work of StdQC."""
+
+    def __init__(self, qc):
+        self.qc = qc
+        # Key is a set of keys, value is a list of (obs_type, min, max) to check
+        self.plans = {}
+
+    def run(self, packet, keys):
+        if keys is None:
+            keys = frozenset(packet)
+        plan = self.plans.get(keys)
+        if plan is None:
+            plan = self.plans[keys] = [(obs_type, min_max[0], min_max[1])
+                                       for (obs_type, min_max) in self.qc.min_max_dict.iteritems()
+                                       if obs_type in keys]
+        for (obs_type, minval, maxval) in plan:
+            val = packet[obs_type]
+            if val is not None and not minval <= val <= maxval:
+                # Something is out of limits. Let QC take care of it, logging
+                # included. Nothing has been changed so far.
+                self.qc.apply_qc(packet, 'LOOP')
+                break
+        return (packet, keys)
+
+class WXCalculateStage(object):
+    """Does the work of StdWXCalculate."""
+
+    def __init__(self, calc):
+        self.calc = calc
+        self.us_converter = DictConverter(weewx.units.StdUnitConverters[weewx.US])
+        self.std_converters = {}
+
+    def run(self, packet, keys):
+        calc = self.calc
+        if calc.ignore_zero_wind:
+            calc.adjust_winddir(packet)
+            # This can add a wind direction to the packet
+            if keys is not None and (('windSpeed' in keys and 'windDir' not in keys) or
+                                     ('windGust' in keys and 'windGustDir' not in keys)):
+                keys = None
+        unit_system = packet['usUnits']
+        if unit_system == weewx.US:
+            # The calculations are done on the packet itself
+            calc.calculate_US(packet, 'loop')
+            return (packet, None)
+        if keys is None:
+            keys = frozenset(packet)
+        data_us = self.us_converter.convertDict(packet, keys)
+        data_us['usUnits'] = weewx.US
+        calc.calculate_US(data_us, 'loop')
+        converter = self.std_converters.get(unit_system)
+        if converter is None:
+            converter = self.std_converters[unit_system] = \
+                DictConverter(weewx.units.StdUnitConverters[unit_system])
+        data_x = converter.convertDict(data_us, frozenset(data_us))
+        data_x['usUnits'] = unit_system
+        packet.update(data_x)
+        return (packet, None)
+
+#==============================================================================
+#                    Class DictConverter
+#==============================================================================
+
+class DictConverter(object):
+    """Converts dictionaries with the same keys and unit system in the same
+    way as the method convertDict() of a weewx.units.Converter, but works out
+    how to convert each key only once."""
+
+    def __init__(self, converter):
+        self.converter = converter
+        # Key is a tuple (unit system, set of keys), value is a list of
+        # (obs_type, conversion function)
+        self.plans = {}
+
+    def convertDict(self, obs_dict, keys):
+        """Convert an observation dictionary, which has the given set of keys.
+        As with Converter.convertDict(), the result has no key 'usUnits'."""
+        plan_key = (obs_dict['usUnits'], keys)
+        plan = self.plans.get(plan_key)
+        if plan is None:
+            plan = self.plans[plan_key] = [(obs_type, self._get_conversion(obs_dict['usUnits'], obs_type))
+                                           for obs_type in obs_dict if obs_type != 'usUnits']
+        target_dict = {}
+        for (obs_type, conversion_func) in plan:
+            val = obs_dict[obs_type]
+            if conversion_func is None:
+                target_dict[obs_type] = val
+            elif conversion_func is not _generic and (val is None or type(val) in _scalar_types):
+                target_dict[obs_type] = conversion_func(val) if val is not None else None
+            else:
+                # Sequences, and anything that cannot be worked out ahead of
+                # time, get converted the usual way
+                target_dict[obs_type] = self.converter.convert(weewx.units.as_value_tuple(obs_dict, obs_type))[0]
+        return target_dict
+
+    def _get_conversion(self, unit_system, obs_type):
+        """Return the function that converts a scalar of an observation type
+        from a standard unit system, None if no conversion is needed, or
+        _generic if it cannot be worked out ahead of time."""
+        try:
+            (unit_type, unit_group) = weewx.units.StdUnitConverters[unit_system].getTargetUnit(obs_type)
+            if unit_type is None and unit_group is None:
+                return None
+            new_unit_type = self.converter.group_unit_dict.get(unit_group, weewx.units.USUnits[unit_group])
+            if unit_type == new_unit_type:
+                return None
+            return weewx.units.conversionDict[unit_type][new_unit_type]
+        except KeyError:
+            # Let the usual conversion raise the exception
+            return _generic
+
+# Marker for a conversion that cannot be worked out ahead of time
+_generic = object()
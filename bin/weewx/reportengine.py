@@ -9,8 +9,10 @@
 import datetime
 import ftplib
 import glob
+import multiprocessing
 import os.path
 import shutil
+import signal
 import socket
 import sys
 import syslog
@@ -23,8 +25,9 @@ import configobj
 
 # Weewx imports:
 import weeutil.weeutil
-from weeutil.weeutil import to_bool
+from weeutil.weeutil import to_bool, to_int
 import weewx.manager
+import weewx.tags
 
 # spans of valid values for each CRON like field
 MINUTES = (0, 59)
@@ -80,6 +83,10 @@ class StdReportEngine(threading.Thread):
     See below for examples of generators.
     """
 
+    # Generators that upload the results of other reports:
+    upload_generators = ['weewx.reportengine.FtpGenerator',
+                         'weewx.reportengine.RsyncGenerator']
+
     def __init__(self, config_dict, stn_info, record=None, gen_ts=None, first_run=True):
         """Initializer for the report engine.
 
@@ -117,142 +124,329 @@ class StdReportEngine(threading.Thread):
             syslog.syslog(syslog.LOG_DEBUG, "reportengine: "
                           "Running reports for latest time in the database.")
 
-        # Iterate over each requested report
+        # Gather the reports to be run, with the skin dictionary of each
+        report_list = []
         for report in self.config_dict['StdReport'].sections:
-            # See if this report is disabled
-            enabled = to_bool(self.config_dict['StdReport'][report].get('enable', True))
-            if not enabled:
-                syslog.syslog(syslog.LOG_DEBUG,
-                              "reportengine: Skipping report %s" % report)
-                continue
+            skin_dict = self.get_skin_dict(report)
+            if skin_dict is not None:
+                report_list.append((report, skin_dict))
 
+        workers = to_int(self.config_dict['StdReport'].get('report_workers', 1))
+        if workers > 1 and len(report_list) > 1:
+            cache_counts = self._run_parallel(report_list, workers)
+        else:
+            # Aggregates calculated by one template are likely to be asked for
+            # again by others. Share them among all the reports in this run.
+            aggregate_cache = weewx.tags.AggregateCache()
+            # Likewise the records looked up for $current and $trend,
+            record_cache = weewx.tags.RecordCache()
+            # and the data vectors of plots.
+            vector_cache = weewx.manager.VectorCache()
+            for report, skin_dict in report_list:
+                self.run_report(report, skin_dict, aggregate_cache, record_cache, vector_cache)
+            cache_counts = _get_cache_counts(aggregate_cache, record_cache, vector_cache)
+
+        if to_bool(self.config_dict.get('log_success', True)):
+            if cache_counts[0] + cache_counts[1]:
+                syslog.syslog(syslog.LOG_INFO, "reportengine: Aggregate cache: "
+                              "%d hits, %d misses" % cache_counts[0:2])
+            if cache_counts[2] + cache_counts[3]:
+                syslog.syslog(syslog.LOG_INFO, "reportengine: Record cache: "
+                              "%d hits, %d misses" % cache_counts[2:4])
+            if cache_counts[4] + cache_counts[5]:
+                syslog.syslog(syslog.LOG_INFO, "reportengine: Vector cache: "
+                              "%d hits, %d misses" % cache_counts[4:6])
+
+    def get_skin_dict(self, report):
+        """Return the skin dictionary of a report, with all overrides applied,
+        or None if the report is not to be run this time."""
+
+        # See if this report is disabled
+        enabled = to_bool(self.config_dict['StdReport'][report].get('enable', True))
+        if not enabled:
             syslog.syslog(syslog.LOG_DEBUG,
-                          "reportengine: Running report %s" % report)
-
-            # Figure out where the configuration file is for the skin used for
-            # this report:
-            skin_config_path = os.path.join(
-                self.config_dict['WEEWX_ROOT'],
-                self.config_dict['StdReport']['SKIN_ROOT'],
-                self.config_dict['StdReport'][report].get('skin', 'Standard'),
-                'skin.conf')
-
-            # Retrieve the configuration dictionary for the skin. Wrap it in
-            # a try block in case we fail
+                          "reportengine: Skipping report %s" % report)
+            return None
+
+        # Figure out where the configuration file is for the skin used for
+        # this report:
+        skin_config_path = os.path.join(
+            self.config_dict['WEEWX_ROOT'],
+            self.config_dict['StdReport']['SKIN_ROOT'],
+            self.config_dict['StdReport'][report].get('skin', 'Standard'),
+            'skin.conf')
+
+        # Retrieve the configuration dictionary for the skin. Wrap it in
+        # a try block in case we fail
+        try:
+            skin_dict = configobj.ConfigObj(skin_config_path, file_error=True)
+            syslog.syslog(
+                syslog.LOG_DEBUG,
+                "reportengine: Found configuration file %s for report %s" %
+                (skin_config_path, report))
+        except IOError, e:
+            syslog.syslog(
+                syslog.LOG_ERR, "reportengine: "
+                "Cannot read skin configuration file %s for report %s: %s"
+                % (skin_config_path, report, e))
+            syslog.syslog(syslog.LOG_ERR, "        ****  Report ignored")
+            return None
+        except SyntaxError, e:
+            syslog.syslog(
+                syslog.LOG_ERR, "reportengine: "
+                "Failed to read skin configuration file %s for report %s: %s"
+                % (skin_config_path, report, e))
+            syslog.syslog(syslog.LOG_ERR, "        ****  Report ignored")
+            return None
+
+        # Add the default database binding:
+        skin_dict.setdefault('data_binding', 'wx_binding')
+
+        # Default to logging to whatever is specified at the root level
+        # of weewx.conf, or true if nothing specified:
+        skin_dict.setdefault('log_success',
+                             self.config_dict.get('log_success', True))
+        skin_dict.setdefault('log_failure',
+                             self.config_dict.get('log_failure', True))
+
+        # Inject any overrides the user may have specified in the
+        # weewx.conf configuration file for all reports:
+        for scalar in self.config_dict['StdReport'].scalars:
+            skin_dict[scalar] = self.config_dict['StdReport'][scalar]
+
+        # Now inject any overrides for this specific report:
+        skin_dict.merge(self.config_dict['StdReport'][report])
+
+        # Finally, add the report name:
+        skin_dict['REPORT_NAME'] = report
+
+        # Default action is to run the report. Only reason to not run it is
+        # if we have a valid report report_timing and it did not trigger.
+        if self.record is not None:
+            # StdReport called us not wee_reports so look for a report_timing
+            # entry if we have one.
+            timing_line = skin_dict.get('report_timing', None)
+            # The report_timing entry might have one or more comma separated
+            # values which ConfigObj would interpret as a list. If so then
+            # reconstruct our report_timing entry.
+            if hasattr(timing_line, '__iter__'):
+                timing_line = ','.join(timing_line)
+            if timing_line:
+                # Get a ReportTiming object.
+                timing = ReportTiming(timing_line)
+                if timing.is_valid:
+                    # Get timestamp and interval so we can check if the
+                    # report timing is triggered.
+                    _ts = self.record['dateTime']
+                    _interval = self.record['interval'] * 60
+                    # Is our report timing triggered? timing.is_triggered
+                    # returns True if triggered, False if not triggered
+                    # and None if an invalid report timing line.
+                    if timing.is_triggered(_ts, _ts - _interval) is False:
+                        # report timing was valid but not triggered so do
+                        # not run the report.
+                        syslog.syslog(syslog.LOG_DEBUG, "reportengine: Report %s skipped due to report_timing setting" %
+                                      (report, ))
+                        return None
+                else:
+                    syslog.syslog(syslog.LOG_DEBUG, "reportengine: Invalid report_timing setting for report '%s', running report anyway" % report)
+                    syslog.syslog(syslog.LOG_DEBUG, "        ****  %s" % timing.validation_error)
+
+        return skin_dict
+
+    def run_report(self, report, skin_dict, aggregate_cache=None, record_cache=None,
+                   vector_cache=None):
+        """Run the generators of a report."""
+
+        syslog.syslog(syslog.LOG_DEBUG,
+                      "reportengine: Running report %s" % report)
+
+        for generator in weeutil.weeutil.option_as_list(skin_dict['Generators'].get('generator_list')):
+
             try:
-                skin_dict = configobj.ConfigObj(skin_config_path, file_error=True)
+                # Instantiate an instance of the class.
+                obj = weeutil.weeutil._get_object(generator)(
+                    self.config_dict,
+                    skin_dict,
+                    self.gen_ts,
+                    self.first_run,
+                    self.stn_info,
+                    self.record)
+            except Exception, e:
                 syslog.syslog(
-                    syslog.LOG_DEBUG,
-                    "reportengine: Found configuration file %s for report %s" %
-                    (skin_config_path, report))
-            except IOError, e:
-                syslog.syslog(
-                    syslog.LOG_ERR, "reportengine: "
-                    "Cannot read skin configuration file %s for report %s: %s"
-                    % (skin_config_path, report, e))
-                syslog.syslog(syslog.LOG_ERR, "        ****  Report ignored")
-                continue
-            except SyntaxError, e:
-                syslog.syslog(
-                    syslog.LOG_ERR, "reportengine: "
-                    "Failed to read skin configuration file %s for report %s: %s"
-                    % (skin_config_path, report, e))
-                syslog.syslog(syslog.LOG_ERR, "        ****  Report ignored")
+                    syslog.LOG_CRIT, "reportengine: "
+                    "Unable to instantiate generator %s" % generator)
+                syslog.syslog(syslog.LOG_CRIT, "        ****  %s" % e)
+                weeutil.weeutil.log_traceback("        ****  ")
+                syslog.syslog(syslog.LOG_CRIT, "        ****  Generator ignored")
+                traceback.print_exc()
                 continue
 
-            # Add the default database binding:
-            skin_dict.setdefault('data_binding', 'wx_binding')
-
-            # Default to logging to whatever is specified at the root level
-            # of weewx.conf, or true if nothing specified:
-            skin_dict.setdefault('log_success',
-                                 self.config_dict.get('log_success', True))
-            skin_dict.setdefault('log_failure',
-                                 self.config_dict.get('log_failure', True))
-
-            # Inject any overrides the user may have specified in the
-            # weewx.conf configuration file for all reports:
-            for scalar in self.config_dict['StdReport'].scalars:
-                skin_dict[scalar] = self.config_dict['StdReport'][scalar]
-
-            # Now inject any overrides for this specific report:
-            skin_dict.merge(self.config_dict['StdReport'][report])
-
-            # Finally, add the report name:
-            skin_dict['REPORT_NAME'] = report
-
-            # Default action is to run the report. Only reason to not run it is
-            # if we have a valid report report_timing and it did not trigger.
-            if self.record is not None:
-                # StdReport called us not wee_reports so look for a report_timing
-                # entry if we have one.
-                timing_line = skin_dict.get('report_timing', None)
-                # The report_timing entry might have one or more comma separated
-                # values which ConfigObj would interpret as a list. If so then
-                # reconstruct our report_timing entry.
-                if hasattr(timing_line, '__iter__'):
-                    timing_line = ','.join(timing_line)
-                if timing_line:
-                    # Get a ReportTiming object.
-                    timing = ReportTiming(timing_line)
-                    if timing.is_valid:
-                        # Get timestamp and interval so we can check if the
-                        # report timing is triggered.
-                        _ts = self.record['dateTime']
-                        _interval = self.record['interval'] * 60
-                        # Is our report timing triggered? timing.is_triggered
-                        # returns True if triggered, False if not triggered
-                        # and None if an invalid report timing line.
-                        if timing.is_triggered(_ts, _ts - _interval) is False:
-                            # report timing was valid but not triggered so do
-                            # not run the report.
-                            syslog.syslog(syslog.LOG_DEBUG, "reportengine: Report %s skipped due to report_timing setting" %
-                                          (report, ))
-                            continue
-                    else:
-                        syslog.syslog(syslog.LOG_DEBUG, "reportengine: Invalid report_timing setting for report '%s', running report anyway" % report)
-                        syslog.syslog(syslog.LOG_DEBUG, "        ****  %s" % timing.validation_error)
+            obj.aggregate_cache = aggregate_cache
+            obj.record_cache = record_cache
+            obj.vector_cache = vector_cache
 
-            for generator in weeutil.weeutil.option_as_list(skin_dict['Generators'].get('generator_list')):
+            try:
+                # Call its start() method
+                obj.start()
 
-                try:
-                    # Instantiate an instance of the class.
-                    obj = weeutil.weeutil._get_object(generator)(
-                        self.config_dict,
-                        skin_dict,
-                        self.gen_ts,
-                        self.first_run,
-                        self.stn_info,
-                        self.record)
-                except Exception, e:
-                    syslog.syslog(
-                        syslog.LOG_CRIT, "reportengine: "
-                        "Unable to instantiate generator %s" % generator)
-                    syslog.syslog(syslog.LOG_CRIT, "        ****  %s" % e)
-                    weeutil.weeutil.log_traceback("        ****  ")
-                    syslog.syslog(syslog.LOG_CRIT, "        ****  Generator ignored")
-                    traceback.print_exc()
-                    continue
+            except Exception, e:
+                # Caught unrecoverable error. Log it, continue on to the
+                # next generator.
+                syslog.syslog(
+                    syslog.LOG_CRIT, "reportengine: "
+                    "Caught unrecoverable exception in generator %s"
+                    % generator)
+                syslog.syslog(syslog.LOG_CRIT, "        ****  %s" % str(e))
+                weeutil.weeutil.log_traceback("        ****  ")
+                syslog.syslog(syslog.LOG_CRIT, "        ****  Generator terminated")
+                traceback.print_exc()
+                continue
 
-                try:
-                    # Call its start() method
-                    obj.start()
-
-                except Exception, e:
-                    # Caught unrecoverable error. Log it, continue on to the
-                    # next generator.
-                    syslog.syslog(
-                        syslog.LOG_CRIT, "reportengine: "
-                        "Caught unrecoverable exception in generator %s"
-                        % generator)
-                    syslog.syslog(syslog.LOG_CRIT, "        ****  %s" % str(e))
-                    weeutil.weeutil.log_traceback("        ****  ")
-                    syslog.syslog(syslog.LOG_CRIT, "        ****  Generator terminated")
-                    traceback.print_exc()
+            finally:
+                obj.finalize()
+
+    def _run_parallel(self, report_list, workers):
+        """Run the reports in a pool of worker processes. A report is not
+        started until the reports it depends on have finished. Returns the
+        hits and misses of the caches of the workers."""
+
+        dependencies = self._get_dependencies(report_list)
+        # Give up on the reports that are still running after max_wait seconds:
+        max_wait = to_int(self.config_dict['StdReport'].get('max_wait', 600))
+        t_limit = time.time() + max_wait
+
+        pending = [report for (report, _) in report_list]
+        # Key is a running report, value is its AsyncResult
+        running = {}
+        finished = set()
+        cache_counts = (0, 0, 0, 0, 0, 0)
+
+        # The workers are forked from this process, so they inherit the
+        # engine and the skin dictionaries, rather than having them pickled.
+        # They also inherit the compiled templates, which would otherwise be
+        # compiled again in every run, and lost when the workers exit.
+        self._compile_templates(report_list)
+        pool = multiprocessing.Pool(min(workers, len(report_list)),
+                                    _init_worker, (self, dict(report_list)))
+        try:
+            while pending or running:
+                ready = [report for report in pending if dependencies[report] <= finished]
+                if not ready and not running:
+                    syslog.syslog(syslog.LOG_ERR, "reportengine: Circular dependencies "
+                                  "among reports %s. Running them anyway." % ', '.join(pending))
+                    ready = list(pending)
+                for report in ready:
+                    pending.remove(report)
+                    running[report] = pool.apply_async(_run_worker_report, (report,))
+                # There is no error callback in Python 2.7, so a report that
+                # fails in the pool would never call back. Poll the results
+                # instead, waiting a little on any one of them.
+                done = [report for report in running if running[report].ready()]
+                if not done:
+                    if time.time() >= t_limit:
+                        syslog.syslog(syslog.LOG_ERR, "reportengine: Reports still running after "
+                                      "%d seconds: %s" % (max_wait, ', '.join(running)))
+                        syslog.syslog(syslog.LOG_ERR, "        ****  Reports terminated")
+                        if pending:
+                            syslog.syslog(syslog.LOG_ERR, "        ****  Reports not run: %s" % ', '.join(pending))
+                        pool.terminate()
+                        break
+                    running.values()[0].wait(min(0.5, max(t_limit - time.time(), 0)))
                     continue
-
-                finally:
-                    obj.finalize()
+                for report in done:
+                    result = running.pop(report)
+                    finished.add(report)
+                    if result.successful():
+                        cache_counts = tuple(x + y for (x, y) in zip(cache_counts, result.get()))
+                    else:
+                        # Such as a result that could not be pickled. Reports
+                        # that depend on it can run nonetheless.
+                        try:
+                            result.get()
+                        except Exception, e:
+                            syslog.syslog(syslog.LOG_ERR, "reportengine: "
+                                          "Report %s failed in the worker pool: %s" % (report, e))
+            else:
+                pool.close()
+        finally:
+            pool.join()
+
+        return cache_counts
+
+    def _compile_templates(self, report_list):
+        """Compile the templates of the reports that use CheetahGenerator. They
+        are kept by this process, so they are compiled only once, or whenever
+        they change."""
+        for report, skin_dict in report_list:
+            generator_list = weeutil.weeutil.option_as_list(skin_dict['Generators'].get('generator_list')) or []
+            if 'weewx.cheetahgenerator.CheetahGenerator' not in [generator.strip() for generator in generator_list]:
+                continue
+            try:
+                import weewx.cheetahgenerator
+                weewx.cheetahgenerator.compile_templates(self.config_dict, skin_dict)
+            except Exception, e:
+                # Not fatal. The report will compile them itself.
+                syslog.syslog(syslog.LOG_ERR, "reportengine: "
+                              "Unable to compile the templates of report %s: %s" % (report, e))
+
+    def _get_dependencies(self, report_list):
+        """Return the set of reports each report must wait for. They are given
+        by option 'depends_on'. By default, reports that upload files, such as
+        FTP and RSYNC, wait for all the reports listed before them."""
+
+        report_names = [report for (report, _) in report_list]
+        dependencies = {}
+        for i, (report, skin_dict) in enumerate(report_list):
+            depends_on = weeutil.weeutil.option_as_list(skin_dict.get('depends_on'))
+            if depends_on is None:
+                generator_list = weeutil.weeutil.option_as_list(skin_dict['Generators'].get('generator_list')) or []
+                if [generator for generator in generator_list
+                    if generator.strip() in StdReportEngine.upload_generators]:
+                    depends_on = report_names[:i]
+                else:
+                    depends_on = []
+            # Reports that are disabled, or not due, are not waited for
+            dependencies[report] = set(depends_on) & set(report_names)
+        return dependencies
+
+# The state of a worker process of the report engine. Set when the process starts.
+_worker_state = {}
+
+def _init_worker(engine, skin_dicts):
+    # The signal handlers of weewxd are not wanted in a worker
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGHUP, signal.SIG_DFL)
+    _worker_state['engine'] = engine
+    _worker_state['skin_dicts'] = skin_dicts
+    # The reports run by the same worker share its caches
+    _worker_state['aggregate_cache'] = weewx.tags.AggregateCache()
+    _worker_state['record_cache'] = weewx.tags.RecordCache()
+    _worker_state['vector_cache'] = weewx.manager.VectorCache()
+
+def _run_worker_report(report):
+    """Run a report in a worker process. Returns the hits and misses of the
+    caches of the worker while it ran."""
+    aggregate_cache = _worker_state['aggregate_cache']
+    record_cache = _worker_state['record_cache']
+    vector_cache = _worker_state['vector_cache']
+    counts_before = _get_cache_counts(aggregate_cache, record_cache, vector_cache)
+    try:
+        _worker_state['engine'].run_report(report, _worker_state['skin_dicts'][report],
+                                           aggregate_cache, record_cache, vector_cache)
+    except Exception, e:
+        # Nothing may escape, or the engine would wait for the report until max_wait
+        syslog.syslog(syslog.LOG_CRIT, "reportengine: "
+                      "Caught unrecoverable exception in report %s" % report)
+        syslog.syslog(syslog.LOG_CRIT, "        ****  %s" % e)
+        weeutil.weeutil.log_traceback("        ****  ")
+    counts_after = _get_cache_counts(aggregate_cache, record_cache, vector_cache)
+    return tuple(after - before for (after, before) in zip(counts_after, counts_before))
+
+def _get_cache_counts(aggregate_cache, record_cache, vector_cache):
+    return (aggregate_cache.hits, aggregate_cache.misses,
+            record_cache.hits, record_cache.misses,
+            vector_cache.hits, vector_cache.misses)
 
 # =============================================================================
 #                    Class ReportGenerator
@@ -260,6 +454,15 @@ class StdReportEngine(threading.Thread):
 
 class ReportGenerator(object):
     """Base class for all report generators."""
+
+    # An instance of weewx.tags.AggregateCache, shared by all generators in
+    # a run of the report engine. Set by the engine.
+    aggregate_cache = None
+    # Likewise an instance of weewx.tags.RecordCache,
+    record_cache = None
+    # and an instance of weewx.manager.VectorCache.
+    vector_cache = None
+
     def __init__(self, config_dict, skin_dict, gen_ts, first_run, stn_info, record=None):
         self.config_dict = config_dict
         self.skin_dict = skin_dict
@@ -5,6 +5,8 @@
 #
 """Classes for implementing the weewx tag 'code' codes."""
 
+import collections
+
 import weeutil.weeutil
 from weeutil.weeutil import to_int
 import weewx.units
@@ -23,7 +25,8 @@ class TimeBinder(object):
     """
 
     def __init__(self, db_lookup, report_time,
-                 formatter=weewx.units.Formatter(), converter=weewx.units.Converter(), **option_dict):
+                 formatter=weewx.units.Formatter(), converter=weewx.units.Converter(),
+                 aggregate_cache=None, record_cache=None, **option_dict):
         """Initialize an instance of DatabaseBinder.
         
         db_lookup: A function with call signature db_lookup(data_binding), which
@@ -40,6 +43,14 @@ class TimeBinder(object):
         information to be used. [Optional. If not given, the default
         Converter will be used.]
 
+        aggregate_cache: An instance of AggregateCache, to be shared by all the
+        aggregations done through this binder. [Optional. If not given, every
+        aggregation goes to the database.]
+
+        record_cache: An instance of RecordCache, to be shared by the trends done
+        through this binder. [Optional. If not given, every trend goes to the
+        database.]
+
         option_dict: Other options which can be used to customize calculations.
         [Optional.]
         """
@@ -47,6 +58,8 @@ class TimeBinder(object):
         self.report_time  = report_time
         self.formatter    = formatter
         self.converter    = converter
+        self.aggregate_cache = aggregate_cache
+        self.record_cache = record_cache
         self.option_dict  = option_dict
 
     # What follows is the list of time period attributes:
@@ -58,19 +71,19 @@ class TimeBinder(object):
         if time_grace is None:
             time_grace = to_int(self.option_dict['trend'].get('time_grace', 300))
         return TrendObj(time_delta, time_grace, self.db_lookup, data_binding, self.report_time, 
-                 self.formatter, self.converter, **self.option_dict)
+                 self.formatter, self.converter, record_cache=self.record_cache, **self.option_dict)
 
     def hour(self, data_binding=None, hours_ago=0):
         return TimespanBinder(weeutil.weeutil.archiveHoursAgoSpan(self.report_time, hours_ago=hours_ago), 
                               self.db_lookup, data_binding=data_binding, 
                               context='day', formatter=self.formatter, converter=self.converter,
-                              **self.option_dict)
+                              aggregate_cache=self.aggregate_cache, **self.option_dict)
         
     def day(self, data_binding=None, days_ago=0):
         return TimespanBinder(weeutil.weeutil.archiveDaySpan(self.report_time, days_ago=days_ago), 
                               self.db_lookup, data_binding=data_binding, 
                               context='day', formatter=self.formatter, converter=self.converter,
-                              **self.option_dict)
+                              aggregate_cache=self.aggregate_cache, **self.option_dict)
     def yesterday(self, data_binding=None):
         return self.day(data_binding, days_ago=1)
     
@@ -79,29 +92,29 @@ class TimeBinder(object):
         return TimespanBinder(weeutil.weeutil.archiveWeekSpan(self.report_time, week_start, weeks_ago=weeks_ago),
                               self.db_lookup, data_binding=data_binding,
                               context='week', formatter=self.formatter, converter=self.converter,
-                              **self.option_dict)
+                              aggregate_cache=self.aggregate_cache, **self.option_dict)
     def month(self, data_binding=None, months_ago=0):
         return TimespanBinder(weeutil.weeutil.archiveMonthSpan(self.report_time, months_ago=months_ago),
                               self.db_lookup, data_binding=data_binding,
-                              context='month', formatter=self.formatter, converter=self.converter, 
-                              **self.option_dict)
+                              context='month', formatter=self.formatter, converter=self.converter,
+                              aggregate_cache=self.aggregate_cache, **self.option_dict)
     def year(self, data_binding=None, years_ago=0):
         return TimespanBinder(weeutil.weeutil.archiveYearSpan(self.report_time, years_ago=years_ago),
                               self.db_lookup, data_binding=data_binding,
                               context='year', formatter=self.formatter, converter=self.converter,
-                              **self.option_dict)
+                              aggregate_cache=self.aggregate_cache, **self.option_dict)
     def rainyear(self, data_binding=None):
         rain_year_start = to_int(self.option_dict.get('rain_year_start', 1))
         return TimespanBinder(weeutil.weeutil.archiveRainYearSpan(self.report_time, rain_year_start),
                               self.db_lookup, data_binding=data_binding,
-                              context='rainyear',  formatter=self.formatter, converter=self.converter, 
-                              **self.option_dict)
+                              context='rainyear',  formatter=self.formatter, converter=self.converter,
+                              aggregate_cache=self.aggregate_cache, **self.option_dict)
     def span(self, data_binding=None, time_delta=0, hour_delta=0, day_delta=0, week_delta=0, month_delta=0, year_delta=0):
         return TimespanBinder(weeutil.weeutil.archiveSpanSpan(self.report_time, time_delta=time_delta, 
                               hour_delta=hour_delta, day_delta=day_delta, week_delta=week_delta, month_delta=month_delta, year_delta=year_delta), 
                               self.db_lookup, data_binding=data_binding, 
                               context='day', formatter=self.formatter, converter=self.converter,
-                              **self.option_dict)
+                              aggregate_cache=self.aggregate_cache, **self.option_dict)
 
     # For backwards compatiblity
     hours_ago = hour
@@ -131,7 +144,7 @@ class TimespanBinder(object):
     """
     def __init__(self, timespan, db_lookup, data_binding=None, context='current',
                  formatter=weewx.units.Formatter(),
-                 converter=weewx.units.Converter(), **option_dict):
+                 converter=weewx.units.Converter(), aggregate_cache=None, **option_dict):
         """Initialize an instance of TimespanBinder.
 
         timespan: An instance of weeutil.Timespan with the time span
@@ -155,6 +168,9 @@ class TimespanBinder(object):
         information to be used. [Optional. If not given, the default
         Converter will be used.]
 
+        aggregate_cache: An instance of AggregateCache. [Optional. If not given,
+        every aggregation goes to the database.]
+
         option_dict: Other options which can be used to customize calculations.
         [Optional.]
         """
@@ -165,44 +181,72 @@ class TimespanBinder(object):
         self.context     = context
         self.formatter   = formatter
         self.converter   = converter
+        self.aggregate_cache = aggregate_cache
         self.option_dict = option_dict
 
     # Iterate over all records in the time period:
     def records(self, data_binding=None):
         manager = self.db_lookup(data_binding)
-        for record in manager.genBatchRecords(self.timespan.start, self.timespan.stop):
-            yield CurrentObj(self.db_lookup, None, record['dateTime'], self.formatter, 
-                             self.converter, record=record)
+        # A type missing from a record is looked up in the same database:
+        def db_lookup(binding=None):
+            return manager if binding is None else self.db_lookup(binding)
+        # Only the types used by the loop are read. Whenever a record is asked for a
+        # type that was not read, it is looked up by itself, and the rest of the
+        # records are read again, with that type as well.
+        used_types = set(['dateTime', 'usUnits', 'interval'])
+        last_ts = self.timespan.start
+        while True:
+            n_used = len(used_types)
+            record_gen = manager.genBatchRecords(last_ts, self.timespan.stop, obs_types=sorted(used_types))
+            try:
+                for record in record_gen:
+                    yield CurrentObj(db_lookup, None, record['dateTime'], self.formatter, 
+                                     self.converter, record=record, used_types=used_types)
+                    last_ts = record['dateTime']
+                    if len(used_types) > n_used:
+                        break
+                else:
+                    return
+            finally:
+                record_gen.close()
 
     # Iterate over custom span
     def spans(self, data_binding=None, context='day', interval=10800):
-        for span in weeutil.weeutil.intervalgen(self.timespan.start, self.timespan.stop, interval):
-            yield TimespanBinder(span, self.db_lookup, data_binding,
-                                 context, self.formatter, self.converter, **self.option_dict)
+        span_list = list(weeutil.weeutil.intervalgen(self.timespan.start, self.timespan.stop, interval))
+        # The aggregates of all the spans are fetched together:
+        prefetch = SpanPrefetch(self.db_lookup, span_list)
+        for span in span_list:
+            yield TimespanBinder(span, prefetch, data_binding,
+                                 context, self.formatter, self.converter,
+                                 aggregate_cache=self.aggregate_cache, **self.option_dict)
     
     # Iterate over hours in the time period:
     def hours(self, data_binding=None):
         return TimespanBinder._seqGenerator(weeutil.weeutil.genHourSpans, self.timespan,
                                             self.db_lookup, data_binding,
-                                            'hour', self.formatter, self.converter, **self.option_dict)
+                                            'hour', self.formatter, self.converter,
+                                            aggregate_cache=self.aggregate_cache, **self.option_dict)
 
     # Iterate over days in the time period:
     def days(self, data_binding=None):
-        return TimespanBinder._seqGenerator(weeutil.weeutil.genDaySpans, self.timespan,
-                                            self.db_lookup, data_binding,
-                                            'day', self.formatter, self.converter, **self.option_dict)
+        return TimespanBinder._prefetchGenerator(weeutil.weeutil.genDaySpans, self.timespan,
+                                                 self.db_lookup, data_binding,
+                                                 'day', self.formatter, self.converter,
+                                                 aggregate_cache=self.aggregate_cache, **self.option_dict)
 
     # Iterate over months in the time period:
     def months(self, data_binding=None):
-        return TimespanBinder._seqGenerator(weeutil.weeutil.genMonthSpans, self.timespan,
-                                            self.db_lookup, data_binding,
-                                            'month', self.formatter, self.converter, **self.option_dict)
+        return TimespanBinder._prefetchGenerator(weeutil.weeutil.genMonthSpans, self.timespan,
+                                                 self.db_lookup, data_binding,
+                                                 'month', self.formatter, self.converter,
+                                                 aggregate_cache=self.aggregate_cache, **self.option_dict)
 
     # Iterate over years in the time period:
     def years(self, data_binding=None):
         return TimespanBinder._seqGenerator(weeutil.weeutil.genYearSpans, self.timespan,
                                             self.db_lookup, data_binding,
-                                            'year', self.formatter, self.converter, **self.option_dict)
+                                            'year', self.formatter, self.converter,
+                                            aggregate_cache=self.aggregate_cache, **self.option_dict)
 
     # Static method used to implement the iteration:
     @staticmethod
@@ -211,6 +255,15 @@ class TimespanBinder(object):
         for span in genSpanFunc(timespan.start, timespan.stop):
             yield TimespanBinder(span, *args, **option_dict)
 
+    @staticmethod
+    def _prefetchGenerator(genSpanFunc, timespan, db_lookup, *args, **option_dict):
+        """Like _seqGenerator, except that the aggregates of an observation type over
+        all the timespans are fetched together. See class SpanPrefetch."""
+        span_list = list(genSpanFunc(timespan.start, timespan.stop))
+        prefetch = SpanPrefetch(db_lookup, span_list)
+        for span in span_list:
+            yield TimespanBinder(span, prefetch, *args, **option_dict)
+
     # Return the start time of the time period as a ValueHelper
     @property
     def start(self):
@@ -241,7 +294,8 @@ class TimespanBinder(object):
         # Return an ObservationBinder: if an attribute is
         # requested from it, an aggregation value will be returned.
         return ObservationBinder(obs_type, self.timespan, self.db_lookup, self.data_binding, self.context,
-                                 self.formatter, self.converter, **self.option_dict)
+                                 self.formatter, self.converter,
+                                 aggregate_cache=self.aggregate_cache, **self.option_dict)
 
 #===============================================================================
 #                    Class ObservationBinder
@@ -256,7 +310,8 @@ class ObservationBinder(object):
     """
 
     def __init__(self, obs_type, timespan, db_lookup, data_binding, context,
-                 formatter=weewx.units.Formatter(), converter=weewx.units.Converter(), **option_dict):
+                 formatter=weewx.units.Formatter(), converter=weewx.units.Converter(),
+                 aggregate_cache=None, **option_dict):
         """ Initialize an instance of ObservationBinder
 
         obs_type: A string with the stats type (e.g., 'outTemp') for which the query is
@@ -282,6 +337,9 @@ class ObservationBinder(object):
         information to be used. [Optional. If not given, the default
         Converter will be used.]
 
+        aggregate_cache: An instance of AggregateCache. [Optional. If not given,
+        every aggregation goes to the database.]
+
         option_dict: Other options which can be used to customize calculations.
         [Optional.]
         """
@@ -293,6 +351,7 @@ class ObservationBinder(object):
         self.context      = context
         self.formatter    = formatter
         self.converter    = converter
+        self.aggregate_cache = aggregate_cache
         self.option_dict  = option_dict
 
     def max_ge(self, val):
@@ -339,10 +398,184 @@ class ObservationBinder(object):
     def _do_query(self, aggregate_type, val=None):
         """Run a query against the databases, using the given aggregation type."""
         db_manager = self.db_lookup(self.data_binding)
-        result = db_manager.getAggregate(self.timespan, self.obs_type, aggregate_type, 
-                                         val=val, **self.option_dict)
+        if self.aggregate_cache is not None:
+            result = self.aggregate_cache.get_aggregate(db_manager, self.timespan, self.obs_type,
+                                                        aggregate_type, val=val, **self.option_dict)
+        else:
+            result = db_manager.getAggregate(self.timespan, self.obs_type, aggregate_type, 
+                                             val=val, **self.option_dict)
         return weewx.units.ValueHelper(result, self.context, self.formatter, self.converter)
         
+#===============================================================================
+#                             Class AggregateCache
+#===============================================================================
+
+class AggregateCache(object):
+    """Memoizes the results of getAggregate.
+
+    A single instance is meant to be shared by all the templates and generators of
+    one report run, then thrown away. Results are keyed by the database and table
+    that a binding resolves to, so the default binding and the same binding asked
+    for by name share their entries.
+    """
+
+    # Heating and cooling degree days depend on the base temperatures of each skin:
+    uncached_types = ['heatdeg', 'cooldeg']
+
+    # Templates usually ask for several of these for the same type and span. When
+    # one of them is first asked for, all are fetched together with getAggregates.
+    # Set to an empty list to fetch each by itself.
+    prefetch_types = ['min', 'mintime', 'max', 'maxtime', 'avg', 'sum', 'count']
+
+    def __init__(self):
+        self.cache  = {}
+        self.hits   = 0
+        self.misses = 0
+
+    def get_aggregate(self, db_manager, timespan, obs_type, aggregate_type, val=None, **option_dict):
+        """Return an aggregate, calculating it only if it has not been seen before.
+        
+        Arguments are as for getAggregate, plus the database manager to use."""
+        if obs_type in self.uncached_types:
+            return db_manager.getAggregate(timespan, obs_type, aggregate_type,
+                                           val=val, **option_dict)
+        key = (db_manager.connection.database_name, db_manager.table_name,
+               timespan.start, timespan.stop, obs_type, aggregate_type, val)
+        try:
+            result = self.cache[key]
+        except KeyError:
+            if val is None and aggregate_type in self.prefetch_types:
+                # Fetch the whole bundle, and keep the ones not asked for yet
+                result_dict = db_manager.getAggregates(timespan, obs_type, self.prefetch_types,
+                                                       **option_dict)
+                for prefetch_type in self.prefetch_types:
+                    self.cache[key[:5] + (prefetch_type, None)] = result_dict[prefetch_type]
+                result = result_dict[aggregate_type]
+            else:
+                result = db_manager.getAggregate(timespan, obs_type, aggregate_type,
+                                                 val=val, **option_dict)
+                self.cache[key] = result
+            self.misses += 1
+        except TypeError:
+            # Unhashable value of 'val'. Don't try to cache it.
+            return db_manager.getAggregate(timespan, obs_type, aggregate_type,
+                                           val=val, **option_dict)
+        else:
+            self.hits += 1
+        return result
+
+    def clear(self):
+        self.cache = {}
+
+#===============================================================================
+#                             Class RecordCache
+#===============================================================================
+
+class RecordCache(object):
+    """Memoizes the results of getRecord.
+
+    Like AggregateCache, a single instance is meant to be shared by all the
+    templates and generators of one report run. Only the most recently used
+    records are kept.
+    """
+
+    # The number of records kept:
+    max_size = 100
+
+    def __init__(self):
+        self.cache  = collections.OrderedDict()
+        self.hits   = 0
+        self.misses = 0
+
+    def get_record(self, db_manager, timestamp, max_delta=None):
+        """Return a record, fetching it only if it has not been seen recently.
+
+        Arguments are as for getRecord, plus the database manager to use."""
+        key = (db_manager.connection.database_name, db_manager.table_name, timestamp, max_delta)
+        try:
+            # Take it out, so that it goes back in as the most recently used
+            record = self.cache.pop(key)
+        except KeyError:
+            record = db_manager.getRecord(timestamp, max_delta=max_delta)
+            self.misses += 1
+            while self.cache and len(self.cache) >= self.max_size:
+                # Throw away the least recently used
+                self.cache.popitem(last=False)
+        else:
+            self.hits += 1
+        self.cache[key] = record
+        return record
+
+    def clear(self):
+        self.cache = collections.OrderedDict()
+
+#===============================================================================
+#                             Class SpanPrefetch
+#===============================================================================
+
+class SpanPrefetch(object):
+    """Stands in for the database lookup function of the TimespanBinders of a
+    series of timespans, such as the days of a month.
+
+    The database managers it returns are wrapped in a PrefetchManager, so that
+    the aggregates of an observation type over all the timespans are fetched
+    together, the first time any of them is asked for.
+    """
+
+    def __init__(self, db_lookup, span_list):
+        self.db_lookup = db_lookup
+        self.span_list = span_list
+        self.managers  = {}
+
+    def __call__(self, data_binding=None):
+        db_manager = self.db_lookup(data_binding)
+        key = (db_manager.connection.database_name, db_manager.table_name)
+        if key not in self.managers:
+            self.managers[key] = PrefetchManager(db_manager, self.span_list)
+        return self.managers[key]
+
+class PrefetchManager(object):
+    """Wraps a database manager, serving the common aggregates over a series of
+    timespans from a block fetched with getSpanAggregates. The aggregates fetched
+    are those of AggregateCache.prefetch_types. Everything else goes to the
+    database manager."""
+
+    def __init__(self, db_manager, span_list):
+        self.db_manager = db_manager
+        self.span_list  = span_list
+        self.span_index = dict(((span.start, span.stop), i) for (i, span) in enumerate(span_list))
+        self.blocks     = {}
+
+    def __getattr__(self, attr):
+        return getattr(self.db_manager, attr)
+
+    def getAggregate(self, timespan, obs_type, aggregate_type, **option_dict):
+        aggregates = self._get_aggregates(timespan, obs_type, option_dict)
+        if aggregates is None or aggregate_type not in aggregates:
+            return self.db_manager.getAggregate(timespan, obs_type, aggregate_type, **option_dict)
+        return aggregates[aggregate_type]
+
+    def getAggregates(self, timespan, obs_type, aggregate_types, **option_dict):
+        aggregates = self._get_aggregates(timespan, obs_type, option_dict) or {}
+        result_dict = dict((aggregate_type, aggregates[aggregate_type])
+                           for aggregate_type in aggregate_types if aggregate_type in aggregates)
+        missing_types = [aggregate_type for aggregate_type in aggregate_types if aggregate_type not in result_dict]
+        if missing_types:
+            result_dict.update(self.db_manager.getAggregates(timespan, obs_type, missing_types, **option_dict))
+        return result_dict
+
+    def _get_aggregates(self, timespan, obs_type, option_dict):
+        """Return the prefetched aggregates of a timespan, fetching those of the
+        whole series if need be, or None if there are none to be had."""
+        i = self.span_index.get((timespan.start, timespan.stop))
+        if i is None or option_dict.get('val') is not None or obs_type in AggregateCache.uncached_types:
+            return None
+        if obs_type not in self.blocks:
+            self.blocks[obs_type] = self.db_manager.getSpanAggregates(self.span_list, obs_type,
+                                                                      AggregateCache.prefetch_types,
+                                                                      **option_dict)
+        return self.blocks[obs_type][i]
+
 #===============================================================================
 #                             Class RecordBinder
 #===============================================================================
@@ -350,19 +583,22 @@ class ObservationBinder(object):
 class RecordBinder(object):
 
     def __init__(self, db_lookup, report_time,
-                 formatter=weewx.units.Formatter(), converter=weewx.units.Converter(), record=None):
+                 formatter=weewx.units.Formatter(), converter=weewx.units.Converter(), record=None,
+                 record_cache=None):
         self.db_lookup   = db_lookup
         self.report_time = report_time
         self.formatter   = formatter
         self.converter   = converter
         self.record      = record
+        self.record_cache = record_cache
         
     def current(self, timestamp=None, max_delta=None, data_binding=None):
         """Return a CurrentObj"""
         if timestamp is None:
             timestamp = self.report_time
         return CurrentObj(self.db_lookup, data_binding, current_time=timestamp, max_delta=max_delta,
-                          formatter=self.formatter, converter=self.converter, record=self.record)
+                          formatter=self.formatter, converter=self.converter, record=self.record,
+                          record_cache=self.record_cache)
 
     def latest(self, data_binding=None):
         """Return a CurrentObj, using the last available timestamp."""
@@ -382,7 +618,8 @@ class CurrentObj(object):
     """
         
     def __init__(self, db_lookup, data_binding, current_time, 
-                 formatter, converter, max_delta=None, record=None):
+                 formatter, converter, max_delta=None, record=None, used_types=None,
+                 record_cache=None):
         self.db_lookup    = db_lookup
         self.data_binding = data_binding
         self.current_time = current_time
@@ -390,6 +627,11 @@ class CurrentObj(object):
         self.converter    = converter
         self.max_delta    = max_delta
         self.record       = record
+        # If given, a set to which the observation types asked for are added:
+        self.used_types   = used_types
+        self.record_cache = record_cache
+        self._db_record   = None
+        self._db_fetched  = False
         
     def __getattr__(self, obs_type):
         """Return the given observation type."""
@@ -397,6 +639,9 @@ class CurrentObj(object):
         if obs_type in ['__call__', 'has_key']:
             raise AttributeError
 
+        if self.used_types is not None:
+            self.used_types.add(obs_type)
+
         # If we are not specifying a data binding, and we have a current record with the right
         # timestamp at hand, we don't have to hit the database.
         if not self.data_binding and self.record and obs_type in self.record and self.record['dateTime'] == self.current_time:
@@ -404,13 +649,11 @@ class CurrentObj(object):
         else:
             # No. We have to retrieve the record from the database
             try:
-                # Get the appropriate database manager ...
-                db_manager = self.db_lookup(self.data_binding)
+                # Get the current record ...
+                record = self._get_db_record()
             except weewx.UnknownBinding:
                 vt = weewx.units.UnknownType(self.data_binding)
             else:
-                # ... get the current record from it ...  
-                record  = db_manager.getRecord(self.current_time, max_delta=self.max_delta)
                 # ... form a ValueTuple ...
                 vt = weewx.units.as_value_tuple(record, obs_type)
             # ... and then finally, return a ValueHelper
@@ -418,6 +661,19 @@ class CurrentObj(object):
         return weewx.units.ValueHelper(vt, 'current',
                                        self.formatter,
                                        self.converter)
+
+    def _get_db_record(self):
+        """Return the record from the database. It is fetched the first time
+        only, then reused for all the other observation types."""
+        if not self._db_fetched:
+            db_manager = self.db_lookup(self.data_binding)
+            if self.record_cache is not None:
+                self._db_record = self.record_cache.get_record(db_manager, self.current_time,
+                                                               self.max_delta)
+            else:
+                self._db_record = db_manager.getRecord(self.current_time, max_delta=self.max_delta)
+            self._db_fetched = True
+        return self._db_record
         
 #===============================================================================
 #                             Class TrendObj
@@ -431,13 +687,18 @@ class TrendObj(object):
     """
 
     def __init__(self, time_delta, time_grace, db_lookup, data_binding, 
-                 nowtime, formatter, converter, **option_dict):  # @UnusedVariable
+                 nowtime, formatter, converter, record_cache=None, **option_dict):  # @UnusedVariable
         """Initialize a Trend object
         
         time_delta: The time difference over which the trend is to be calculated
         
         time_grace: A time within this amount is accepted.
+
+        record_cache: An instance of RecordCache. [Optional. If not given, the
+        two records are fetched from the database.]
         """
+        self.record_cache = record_cache
+        self._records = None
         self.time_delta_val = time_delta
         self.time_grace_val = time_grace
         self.db_lookup = db_lookup
@@ -460,10 +721,8 @@ class TrendObj(object):
         if obs_type in ['__call__', 'has_key']:
             raise AttributeError
 
-        db_manager  = self.db_lookup(self.data_binding)
-        # Get the current record, and one "time_delta" ago:        
-        now_record  = db_manager.getRecord(self.nowtime, self.time_grace_val)
-        then_record = db_manager.getRecord(self.nowtime - self.time_delta_val, self.time_grace_val)
+        # Get the current record, and one "time_delta" ago:
+        now_record, then_record = self._get_records()
 
         # Do both records exist?
         if now_record is None or then_record is None:
@@ -496,3 +755,17 @@ class TrendObj(object):
         return weewx.units.ValueHelper(trend, 'current',
                                        self.formatter,
                                        self.converter)
+
+    def _get_records(self):
+        """Return the current record and the one "time_delta" ago. They are
+        fetched the first time only, then reused for all observation types."""
+        if self._records is None:
+            db_manager = self.db_lookup(self.data_binding)
+            timestamps = (self.nowtime, self.nowtime - self.time_delta_val)
+            if self.record_cache is not None:
+                self._records = tuple(self.record_cache.get_record(db_manager, ts, self.time_grace_val)
+                                      for ts in timestamps)
+            else:
+                self._records = tuple(db_manager.getRecord(ts, self.time_grace_val)
+                                      for ts in timestamps)
+        return self._records
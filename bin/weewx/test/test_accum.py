@@ -65,6 +65,38 @@ class AccumTest(unittest.TestCase):
         self.assertEqual(ss.sum, 2*tsum)
         self.assertEqual(ss.count, 2*tcount)
         
+    def test_dirty(self):
+        
+        # Default statistics have never been stored, so they start dirty:
+        ss = weewx.accum.ScalarStats()
+        self.assertTrue(ss.dirty)
+        
+        # Statistics set from a stored tuple start clean:
+        ss.setStats((10.0, start_ts, 20.0, start_ts, 30.0, 2, 9000.0, 600))
+        self.assertFalse(ss.dirty)
+        
+        # A value that does not change the highs and lows leaves them clean...
+        ss.addHiLo(15.0, stop_ts)
+        self.assertFalse(ss.dirty)
+        # ... one that does, does not:
+        ss.addHiLo(25.0, stop_ts)
+        self.assertTrue(ss.dirty)
+        
+        ss.dirty = False
+        ss.addSum(None)
+        self.assertFalse(ss.dirty)
+        ss.addSum(15.0)
+        self.assertTrue(ss.dirty)
+        
+        vs = weewx.accum.VecStats()
+        self.assertTrue(vs.dirty)
+        vs.setStats(vs.getStatsTuple())
+        self.assertFalse(vs.dirty)
+        vs.addHiLo((None, None), stop_ts)
+        self.assertFalse(vs.dirty)
+        vs.addSum((5.0, 90.0))
+        self.assertTrue(vs.dirty)
+        
 if __name__ == '__main__':
     unittest.main()
             
@@ -0,0 +1,53 @@
+#
+#    Copyright (c) 2009-2016 Tom Keffer <tkeffer@gmail.com>
+#
+#    See the file LICENSE.txt for your full rights.
+#
+"""Test the memoized position of the sun against the almanac"""
+
+import os
+import random
+import unittest
+
+os.environ['TZ'] = 'America/Los_Angeles'
+
+try:
+    import ephem
+except ImportError:
+    ephem = None
+
+import weewx.almanac
+
+# Midnight, 1 May 2011, local time
+start_ts = 1304233200
+latitude = 45.686
+longitude = -121.566
+altitude = 100.0
+
+class SunPositionTest(unittest.TestCase):
+
+    @unittest.skipIf(ephem is None, "Module ephem is not installed")
+    def test_sun_position(self):
+        random.seed(2468)
+        # The first few times fall on the minute, which is not interpolated
+        times = [start_ts + 60 * i for i in range(5)]
+        times += [start_ts + random.random() * 3 * 86400 for _ in range(3000)]
+        for time_ts in times:
+            (alt, earth_distance) = weewx.almanac.get_sun_position(time_ts, latitude, longitude,
+                                                                   altitude)
+            sun = weewx.almanac.Almanac(time_ts, latitude, longitude, altitude=altitude).sun
+            # Within an arc second while the sun is clear of the horizon. Near
+            # the horizon, within 0.03 degrees (108 arc seconds).
+            tolerance = 1.0 / 3600 if sun.alt > 2.0 else 0.03
+            self.assertTrue(abs(alt - sun.alt) <= tolerance,
+                            "Elevation %f differs from %f at %s" % (alt, sun.alt, time_ts))
+            self.assertTrue(abs(earth_distance - sun.earth_distance) <= 1e-6 * sun.earth_distance,
+                            "Distance %f differs from %f at %s"
+                            % (earth_distance, sun.earth_distance, time_ts))
+
+def suite():
+    tests = ['test_sun_position']
+    return unittest.TestSuite(map(SunPositionTest, tests))
+
+if __name__ == '__main__':
+    unittest.TextTestRunner(verbosity=2).run(suite())
@@ -0,0 +1,113 @@
+#
+#    Copyright (c) 2009-2016 Tom Keffer <tkeffer@gmail.com>
+#
+#    See the file LICENSE.txt for your full rights.
+#
+"""Test the cache of compiled templates in weewx.cheetahgenerator"""
+
+from __future__ import with_statement
+
+import glob
+import os
+import shutil
+import syslog
+import tempfile
+import time
+import unittest
+
+import Cheetah.Template
+
+import weewx.cheetahgenerator
+
+class TemplateCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        syslog.openlog('test_cheetahgenerator', syslog.LOG_CONS)
+        syslog.setlogmask(syslog.LOG_UPTO(syslog.LOG_DEBUG))
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.tmp_dir, 'template_cache')
+        self.template = os.path.join(self.tmp_dir, 'test.txt.tmpl')
+        self._write_template("First $value\n", time.time() - 100)
+        weewx.cheetahgenerator._template_cache.clear()
+        self.compile = Cheetah.Template.Template.__dict__['compile']
+        self.compiled = 0
+
+    def tearDown(self):
+        Cheetah.Template.Template.compile = self.compile
+        weewx.cheetahgenerator._template_cache.clear()
+        shutil.rmtree(self.tmp_dir)
+
+    def _write_template(self, text, mtime):
+        with open(self.template, 'w') as template_file:
+            template_file.write(text)
+        os.utime(self.template, (mtime, mtime))
+
+    def _count_compiles(self):
+        """Count the templates compiled from now on."""
+        compile_func = self.compile.__func__
+        def counting_compile(cls, *args, **kwargs):
+            self.compiled += 1
+            return compile_func(cls, *args, **kwargs)
+        Cheetah.Template.Template.compile = classmethod(counting_compile)
+
+    def _fill(self):
+        template_class = weewx.cheetahgenerator.get_template_class(self.template, self.cache_dir)
+        return str(template_class(searchList=[{'value': 42}]))
+
+    def _cached_modules(self):
+        return sorted(os.path.basename(path) for path in glob.glob(os.path.join(self.cache_dir, 'tmpl_*')))
+
+    def test_disk_cache(self):
+        self._count_compiles()
+        self.assertEqual(self._fill(), "First 42\n")
+        self.assertEqual(self.compiled, 1)
+        modules = self._cached_modules()
+        self.assertEqual(len(modules), 1)
+        self.assertTrue(modules[0].endswith('.py'))
+
+        # In memory, nothing gets compiled again
+        self.assertEqual(self._fill(), "First 42\n")
+        # Nor in a fresh process, which loads the module from the cache directory
+        weewx.cheetahgenerator._template_cache.clear()
+        self.assertEqual(self._fill(), "First 42\n")
+        self.assertEqual(self.compiled, 1)
+
+        # Once the template changes, it is compiled again, and replaces the old module
+        self._write_template("Second $value\n", time.time())
+        self.assertEqual(self._fill(), "Second 42\n")
+        self.assertEqual(self.compiled, 2)
+        new_modules = self._cached_modules()
+        self.assertEqual(len(new_modules), 1)
+        self.assertNotEqual(new_modules, modules)
+        # The prefix made from the path of the template is the same
+        self.assertEqual(new_modules[0][:22], modules[0][:22])
+
+    def test_concurrent_files(self):
+        self._fill()
+        module_name = self._cached_modules()[0]
+        # Another process is in the middle of writing a module for the same template
+        tmp_name = module_name + '.12345.tmp'
+        open(os.path.join(self.cache_dir, tmp_name), 'w').close()
+        self._write_template("Second $value\n", time.time())
+        self.assertEqual(self._fill(), "Second 42\n")
+        modules = self._cached_modules()
+        self.assertEqual(len(modules), 2)
+        self.assertTrue(tmp_name in modules)
+
+    def test_bad_module(self):
+        self._fill()
+        module_path = os.path.join(self.cache_dir, self._cached_modules()[0])
+        with open(module_path, 'w') as module_file:
+            module_file.write("def (\n")
+        # The module cannot be loaded, so the template gets compiled instead
+        weewx.cheetahgenerator._template_cache.clear()
+        self._count_compiles()
+        self.assertEqual(self._fill(), "First 42\n")
+        self.assertEqual(self.compiled, 1)
+
+def suite():
+    tests = ['test_disk_cache', 'test_concurrent_files', 'test_bad_module']
+    return unittest.TestSuite(map(TemplateCacheTest, tests))
+
+if __name__ == '__main__':
+    unittest.TextTestRunner(verbosity=2).run(suite())
@@ -21,6 +21,8 @@ import configobj
 os.environ['TZ'] = 'America/Los_Angeles'
 
 import weeutil.weeutil
+import weewx
+import weewx.manager
 import weewx.tags
 import gen_fake_data
 from weewx.units import ValueHelper
@@ -177,6 +179,64 @@ class Common(unittest.TestCase):
                                                   'sum', 'count', 'wsum', 'sumtime', 
                                                   'last', 'lasttime')]))
             
+    def testFastRebuild(self):
+        with weewx.manager.open_manager_with_config(self.config_dict, 'wx_binding') as manager:
+            # Pick a week that includes the spring DST change:
+            start_d = datetime.date(2010, 3, 10)
+            stop_d  = datetime.date(2010, 3, 16)
+            sod_list = [int(time.mktime((start_d + datetime.timedelta(days=i)).timetuple())) for i in range(7)]
+            
+            # The SQL calculation should agree with the accumulator for every type of every day: 
+            self.assertEqual(manager.check_sql_day_summaries(start_d, stop_d, trans_days=3), [])
+            
+            origStats = [manager._get_day_summary(sod) for sod in sod_list]
+            
+            # Rebuild the week, the fast way:
+            nrecs, ndays = manager.backfill_day_summary(start_d=start_d, stop_d=stop_d, 
+                                                        progress_fn=None, trans_days=3, fast=True)
+            self.assertEqual(ndays, 7)
+            self.assertEqual(nrecs, manager.getSql("SELECT COUNT(*) FROM archive WHERE dateTime > ? AND dateTime <= ?",
+                                                   (sod_list[0], sod_list[-1] + 24*3600))[0])
+            
+            newStats = [manager._get_day_summary(sod) for sod in sod_list]
+            for (orig, new) in zip(origStats, newStats):
+                self.assertEqual(sorted(orig.keys()), sorted(new.keys()))
+                for obstype in orig:
+                    self.assertTrue(weewx.manager._stats_equal(orig[obstype].getStatsTuple(), 
+                                                               new[obstype].getStatsTuple()), 
+                                    "Failing type %s on %s" % (obstype, orig.timespan))
+            
+            # Leave the week as the other tests expect it:
+            manager.backfill_day_summary(start_d=start_d, stop_d=stop_d, progress_fn=None)
+            
+    def testParallelRebuild(self):
+        with weewx.manager.open_manager_with_config(self.config_dict, 'wx_binding') as manager:
+            start_d = datetime.date(2010, 3, 10)
+            stop_d  = datetime.date(2010, 3, 16)
+            sod_list = [int(time.mktime((start_d + datetime.timedelta(days=i)).timetuple())) for i in range(7)]
+            origStats = [manager._get_day_summary(sod).items() for sod in sod_list]
+            lastUpdate = manager._read_metadata('lastUpdate')
+
+            # Rebuild the week, using worker processes:
+            nrecs, ndays = manager.backfill_day_summary(start_d=start_d, stop_d=stop_d, 
+                                                        progress_fn=None, trans_days=2, jobs=3)
+            self.assertEqual(ndays, 7)
+            for (sod, orig) in zip(sod_list, origStats):
+                new = manager._get_day_summary(sod)
+                self.assertEqual(sorted((obstype, stats.getStatsTuple()) for (obstype, stats) in orig),
+                                 sorted((obstype, stats.getStatsTuple()) for (obstype, stats) in new.items()))
+            
+            # Pretend a rebuild was aborted on 25 August. It should pick up from there and
+            # finish, with the same results:
+            sod = int(time.mktime((2010, 9, 1, 0, 0, 0, 0, 0, -1)))
+            origStats = manager._get_day_summary(sod).items()
+            manager._write_metadata('lastUpdate', str(sod - 7 * 24 * 3600))
+            nrecs, ndays = manager.backfill_day_summary(progress_fn=None, trans_days=2, jobs=3)
+            self.assertTrue(ndays >= 8)
+            self.assertEqual(manager._read_metadata('lastUpdate'), lastUpdate)
+            self.assertEqual(sorted((obstype, stats.getStatsTuple()) for (obstype, stats) in origStats),
+                             sorted((obstype, stats.getStatsTuple()) for (obstype, stats) in manager._get_day_summary(sod).items()))
+
     def testTags(self):
         """Test common tags."""
         global skin_dict
@@ -272,6 +332,313 @@ class Common(unittest.TestCase):
             self.assertTrue(tagStats.year().inHumidity.exists)
             self.assertFalse(tagStats.year().inHumidity.has_data)
 
+    def testTagsCache(self):
+        """Test memoizing aggregates across binders"""
+        global skin_dict
+        db_binder = weewx.manager.DBBinder(self.config_dict)
+        stop_ts = time.mktime((2010,4,01,0,0,0,0,0,-1))
+        cache = weewx.tags.AggregateCache()
+
+        # Two binders, as if they were from two different templates, one using
+        # the default binding, the other naming it explicitly:
+        tagStats1 = weewx.tags.TimeBinder(db_binder.bind_default(), stop_ts, aggregate_cache=cache,
+                                          rain_year_start=1, skin_dict=skin_dict)
+        tagStats2 = weewx.tags.TimeBinder(db_binder.bind_default(), stop_ts, aggregate_cache=cache,
+                                          rain_year_start=1, skin_dict=skin_dict)
+        
+        self.assertEqual(str(tagStats1.month().outTemp.max), "59.0°F")
+        self.assertEqual((cache.hits, cache.misses), (0, 1))
+        self.assertEqual(str(tagStats2.month(data_binding='wx_binding').outTemp.max), "59.0°F")
+        # The time of the maximum was fetched along with it:
+        self.assertEqual(str(tagStats1.month().outTemp.maxtime), "31-Mar-2010 19:00")
+        self.assertEqual((cache.hits, cache.misses), (2, 1))
+        # Iterating over days goes through the cache as well:
+        for day in tagStats2.month().days():
+            day.outTemp.max
+        for day in tagStats1.month().days():
+            day.outTemp.max
+        self.assertEqual((cache.hits, cache.misses), (33, 32))
+        # Aggregates with a value:
+        self.assertEqual(tagStats1.year().outTemp.max_ge((90, 'degree_F', 'group_temperature')).raw,
+                         tagStats2.year().outTemp.max_ge((90, 'degree_F', 'group_temperature')).raw)
+        self.assertEqual((cache.hits, cache.misses), (34, 33))
+        # Degree days are never cached:
+        tagStats1.year().heatdeg.sum
+        self.assertEqual((cache.hits, cache.misses), (34, 33))
+
+        cache.clear()
+        self.assertEqual(str(tagStats1.month().outTemp.max), "59.0°F")
+        self.assertEqual((cache.hits, cache.misses), (34, 34))
+
+    def testRecordCache(self):
+        """Test fetching the records of $current and $trend once"""
+        global skin_dict
+        db_binder = weewx.manager.DBBinder(self.config_dict)
+        stop_ts = time.mktime((2010,4,01,0,0,0,0,0,-1))
+        cache = weewx.tags.RecordCache()
+        trend_dict = {'time_delta' : 10800, 'time_grace' : 300}
+
+        # Reference values, fetched without a cache:
+        current = weewx.tags.RecordBinder(db_binder.bind_default(), stop_ts).current()
+        trend = weewx.tags.TimeBinder(db_binder.bind_default(), stop_ts, trend=trend_dict).trend()
+        expected = [str(current.outTemp), str(current.barometer), str(trend.outTemp), str(trend.barometer)]
+
+        # Two binders, as if they were from two different templates:
+        recordBinder1 = weewx.tags.RecordBinder(db_binder.bind_default(), stop_ts, record_cache=cache)
+        recordBinder2 = weewx.tags.RecordBinder(db_binder.bind_default(), stop_ts, record_cache=cache)
+        current = recordBinder1.current()
+        self.assertEqual([str(current.outTemp), str(current.barometer)], expected[:2])
+        # The record is fetched once for all observation types:
+        self.assertEqual((cache.hits, cache.misses), (0, 1))
+        current = recordBinder2.current(data_binding='wx_binding')
+        self.assertEqual([str(current.outTemp), str(current.barometer)], expected[:2])
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+        # The trend fetches the current record, and the one 'time_delta' ago. Both
+        # with a grace period, so neither is the record above:
+        tagStats = weewx.tags.TimeBinder(db_binder.bind_default(), stop_ts, record_cache=cache,
+                                         trend=trend_dict)
+        trend = tagStats.trend()
+        self.assertEqual([str(trend.outTemp), str(trend.barometer)], expected[2:])
+        self.assertEqual((cache.hits, cache.misses), (1, 3))
+        self.assertEqual(str(tagStats.trend().outTemp), expected[2])
+        self.assertEqual((cache.hits, cache.misses), (3, 3))
+
+        # Only the most recently used records are kept:
+        cache.max_size = 2
+        self.assertEqual(str(recordBinder1.current(timestamp=stop_ts - 3600).outTemp),
+                         str(weewx.tags.RecordBinder(db_binder.bind_default(), stop_ts).current(timestamp=stop_ts - 3600).outTemp))
+        self.assertEqual(len(cache.cache), 2)
+        self.assertEqual((cache.hits, cache.misses), (3, 4))
+        recordBinder1.current().outTemp
+        self.assertEqual((cache.hits, cache.misses), (3, 5))
+
+    def test_saved_aggregates(self):
+        """Test saving aggregates of closed periods in the database"""
+        with weewx.manager.open_manager_with_config(self.config_dict, 'wx_binding') as manager:
+            agg_table = '%s_day__aggregates' % manager.table_name
+            self.assertFalse('_aggregates' in manager.daykeys)
+            march = weeutil.weeutil.TimeSpan(time.mktime((2010,3,01,0,0,0,0,0,-1)),
+                                             time.mktime((2010,4,01,0,0,0,0,0,-1)))
+            saved_str = "SELECT value FROM %s WHERE start=? AND stop=? AND obs_type=? AND aggregate_type=?" % agg_table
+            manager.getSql("DELETE FROM %s" % agg_table)
+            
+            expected = manager._calc_day_aggregate(march, 'outTemp', 'max', None)
+            self.assertEqual(manager.getAggregate(march, 'outTemp', 'max')[0], expected)
+            self.assertEqual(manager.getSql(saved_str, march + ('outTemp', 'max'))[0], expected)
+            # Next time, the saved value is used:
+            manager.getSql("UPDATE %s SET value=? WHERE obs_type='outTemp'" % agg_table, (-99.0,))
+            self.assertEqual(manager.getAggregate(march, 'outTemp', 'max')[0], -99.0)
+            # Integer aggregates stay integers:
+            maxtime = manager.getAggregate(march, 'outTemp', 'maxtime')[0]
+            self.assertEqual(manager.getAggregate(march, 'outTemp', 'maxtime')[0], maxtime)
+            self.assertTrue(isinstance(manager.getAggregate(march, 'outTemp', 'maxtime')[0], int))
+            
+            # Single days, and periods that include the current day, are not saved:
+            day = weeutil.weeutil.archiveDaySpan(march.start, 0)
+            month = weeutil.weeutil.archiveMonthSpan(manager.last_timestamp)
+            manager.getAggregate(day, 'outTemp', 'max')
+            manager.getAggregate(month, 'outTemp', 'max')
+            self.assertEqual(manager.getSql("SELECT COUNT(*) FROM %s" % agg_table)[0], 2)
+            
+            # Changing a value in March removes the aggregates:
+            ts = time.mktime((2010,3,15,12,0,0,0,0,-1))
+            value = manager.getRecord(ts)['outTemp']
+            manager.updateValue(ts, 'outTemp', value)
+            self.assertEqual(manager.getSql("SELECT COUNT(*) FROM %s" % agg_table)[0], 0)
+            self.assertEqual(manager.getAggregate(march, 'outTemp', 'max')[0], expected)
+            
+            # So does rebuilding a day in March, but not one in April:
+            manager.backfill_day_summary(start_d=datetime.date(2010,4,1), stop_d=datetime.date(2010,4,1))
+            self.assertEqual(manager.getSql("SELECT COUNT(*) FROM %s" % agg_table)[0], 1)
+            manager.backfill_day_summary(start_d=datetime.date(2010,3,31), stop_d=datetime.date(2010,3,31))
+            self.assertEqual(manager.getSql("SELECT COUNT(*) FROM %s" % agg_table)[0], 0)
+
+    def test_saved_aggregates_race(self):
+        """A late record that comes in while an aggregate of its period is being
+        calculated keeps the aggregate from being saved"""
+        with weewx.manager.open_manager_with_config(self.config_dict, 'wx_binding') as manager, \
+                weewx.manager.open_manager_with_config(self.config_dict, 'wx_binding') as other:
+            agg_table = '%s_day__aggregates' % manager.table_name
+            march = weeutil.weeutil.TimeSpan(time.mktime((2010,3,01,0,0,0,0,0,-1)),
+                                             time.mktime((2010,4,01,0,0,0,0,0,-1)))
+            saved_str = "SELECT value FROM %s WHERE start=? AND stop=? AND obs_type=? AND aggregate_type=?" % agg_table
+            manager.getSql("DELETE FROM %s" % agg_table)
+            lastUpdate = manager._read_metadata('lastUpdate')
+            late_record = manager.getRecord(time.mktime((2010,3,15,12,0,0,0,0,-1)))
+            late_record.update({'dateTime': late_record['dateTime'] + 120, 'outTemp': 150.0})
+            
+            calc_day_aggregate = manager._calc_day_aggregate
+            def calc_then_add(*args):
+                _result = calc_day_aggregate(*args)
+                # Another manager, such as that of the main thread, adds a record meanwhile
+                other.addRecord(late_record)
+                return _result
+            manager._calc_day_aggregate = calc_then_add
+            try:
+                self.assertNotEqual(manager.getAggregate(march, 'outTemp', 'max')[0], 150.0)
+                del manager._calc_day_aggregate
+                # The stale value was not saved:
+                self.assertEqual(manager.getSql(saved_str, march + ('outTemp', 'max')), None)
+                self.assertEqual(manager.getAggregate(march, 'outTemp', 'max')[0], 150.0)
+                self.assertEqual(manager.getSql(saved_str, march + ('outTemp', 'max'))[0], 150.0)
+            finally:
+                # Put the database back the way it was
+                manager.getSql("DELETE FROM %s WHERE dateTime=?" % manager.table_name, (late_record['dateTime'],))
+                manager._write_metadata('lastUpdate', lastUpdate)
+                manager.backfill_day_summary(start_d=datetime.date(2010,3,15), stop_d=datetime.date(2010,3,15))
+                manager._write_metadata('lastUpdate', lastUpdate)
+                manager.getSql("DELETE FROM %s" % agg_table)
+
+    def test_hybrid_agg(self):
+        """Test aggregates over spans that do not start and end on midnight"""
+        with weewx.manager.open_manager_with_config(self.config_dict, 'wx_binding') as manager:
+            spans = [weeutil.weeutil.TimeSpan(time.mktime((2010,3,10,13,20,0,0,0,-1)),
+                                              time.mktime((2010,4,9,13,20,0,0,0,-1))),
+                     weeutil.weeutil.TimeSpan(time.mktime((2010,3,10,0,0,0,0,0,-1)),
+                                              time.mktime((2010,3,17,6,0,0,0,0,-1))),
+                     weeutil.weeutil.TimeSpan(time.mktime((2010,7,1,18,0,0,0,0,-1)),
+                                              time.mktime((2010,7,3,0,0,0,0,0,-1)))]
+            
+            def check():
+                for span in spans:
+                    for obs_type in ('outTemp', 'barometer', 'rain', 'windSpeed'):
+                        for aggregate in ('sum', 'count', 'avg', 'min', 'max', 'mintime', 'maxtime'):
+                            expected = weewx.manager.Manager.getAggregate(manager, span, obs_type, aggregate)
+                            result = manager.getAggregate(span, obs_type, aggregate)
+                            if aggregate in ('sum', 'avg'):
+                                self.assertAlmostEqual(result[0], expected[0], 9)
+                            else:
+                                self.assertEqual(result[0], expected[0])
+                            self.assertEqual(result[1:], expected[1:])
+            check()
+            
+            # The daily summaries can hold highs and lows from LOOP packets that are
+            # not in the archive. They must not show up in the results:
+            day_table = manager._day_table('outTemp')
+            for sql in ("UPDATE %s SET %s = %s + 5 WHERE dateTime = ?" % 
+                        (day_table, manager._day_column('outTemp', 'max'), manager._day_column('outTemp', 'max')),
+                        "UPDATE %s SET %s = %s - 5 WHERE dateTime = ?" % 
+                        (day_table, manager._day_column('outTemp', 'min'), manager._day_column('outTemp', 'min'))):
+                for day in ((2010,3,12), (2010,3,15), (2010,7,2)):
+                    manager.getSql(sql, (time.mktime(day + (0,0,0,0,0,-1)),))
+            check()
+            for day in ((2010,3,12), (2010,3,15), (2010,7,2)):
+                manager.backfill_day_summary(start_d=datetime.date(*day), stop_d=datetime.date(*day))
+
+    def test_batch_agg(self):
+        """Test calculating several aggregates together"""
+        with weewx.manager.open_manager_with_config(self.config_dict, 'wx_binding') as manager:
+            spans = [weeutil.weeutil.TimeSpan(time.mktime((2010,3,1,0,0,0,0,0,-1)),
+                                              time.mktime((2010,4,1,0,0,0,0,0,-1))),
+                     weeutil.weeutil.TimeSpan(time.mktime((2010,1,1,0,0,0,0,0,-1)),
+                                              manager.last_timestamp),
+                     weeutil.weeutil.TimeSpan(time.mktime((2010,3,10,13,20,0,0,0,-1)),
+                                              time.mktime((2010,4,9,13,20,0,0,0,-1))),
+                     weeutil.weeutil.TimeSpan(time.mktime((2010,3,14,1,0,0,0,0,-1)),
+                                              time.mktime((2010,3,14,8,0,0,0,0,-1))),
+                     weeutil.weeutil.TimeSpan(time.mktime((2009,1,1,0,0,0,0,0,-1)),
+                                              time.mktime((2009,2,1,0,0,0,0,0,-1)))]
+            aggregates = ['min', 'mintime', 'max', 'maxtime', 'sum', 'count', 'avg', 'last', 'maxmin',
+                          'minmaxtime', 'meanmax', 'maxsumtime']
+            manager.getSql("DELETE FROM %s_day__aggregates" % manager.table_name)
+            for span in spans:
+                for obs_type in ('outTemp', 'barometer', 'rain', 'windSpeed'):
+                    agg_list = aggregates if manager._is_summary_span(span) else aggregates[:8]
+                    # Once to calculate them, and once to read any saved ones:
+                    for results in [manager.getAggregates(span, obs_type, agg_list) for i in range(2)]:
+                        self.assertEqual(sorted(results.keys()), sorted(agg_list))
+                        for aggregate in agg_list:
+                            expected = manager.getAggregate(span, obs_type, aggregate)
+                            if aggregate in ('sum', 'avg', 'meanmax'):
+                                self.assertAlmostEqual(results[aggregate][0], expected[0], 9)
+                            else:
+                                self.assertEqual(results[aggregate][0], expected[0])
+                            self.assertEqual(results[aggregate][1:], expected[1:])
+                    # The same, from the archive table:
+                    results = weewx.manager.Manager.getAggregates(manager, span, obs_type, aggregates[:8])
+                    for aggregate in aggregates[:8]:
+                        expected = weewx.manager.Manager.getAggregate(manager, span, obs_type, aggregate)
+                        self.assertEqual(results[aggregate], expected)
+            # Degree days, and aggregates with a value:
+            results = manager.getAggregates(spans[0], 'heatdeg', ['sum', 'avg'], skin_dict=skin_dict)
+            self.assertEqual(results['sum'], manager.getAggregate(spans[0], 'heatdeg', 'sum', skin_dict=skin_dict))
+            val = (50, 'degree_F', 'group_temperature')
+            results = manager.getAggregates(spans[0], 'outTemp', ['max_ge', 'min_le'], val=val)
+            self.assertEqual(results['min_le'], manager.getAggregate(spans[0], 'outTemp', 'min_le', val=val))
+
+    def test_span_agg(self):
+        """Test calculating aggregates over a series of periods together"""
+        with weewx.manager.open_manager_with_config(self.config_dict, 'wx_binding') as manager:
+            aggregates = ['min', 'mintime', 'max', 'maxtime', 'sum', 'count', 'avg', 'meanmin', 'maxsumtime', 'last']
+            for span_list in (list(weeutil.weeutil.genDaySpans(time.mktime((2010,3,1,0,0,0,0,0,-1)),
+                                                               time.mktime((2010,3,31,0,0,0,0,0,-1)))),
+                              list(weeutil.weeutil.genMonthSpans(time.mktime((2009,12,1,0,0,0,0,0,-1)),
+                                                                 time.mktime((2010,12,1,0,0,0,0,0,-1)))),
+                              list(weeutil.weeutil.genHourSpans(time.mktime((2010,3,14,1,0,0,0,0,-1)),
+                                                                time.mktime((2010,3,14,8,0,0,0,0,-1)))),
+                              list(weeutil.weeutil.intervalgen(time.mktime((2010,3,13,13,0,0,0,0,-1)),
+                                                               time.mktime((2010,3,16,0,0,0,0,0,-1)), 10800))):
+                # Aggregates such as 'meanmin' need whole days:
+                agg_list = aggregates if weeutil.weeutil.isMidnight(span_list[0].stop) else aggregates[:7]
+                for obs_type in ('outTemp', 'rain', 'windSpeed'):
+                    results = manager.getSpanAggregates(span_list, obs_type, agg_list)
+                    self.assertEqual(len(results), len(span_list))
+                    for (span, result) in zip(span_list, results):
+                        for aggregate in agg_list:
+                            expected = manager.getAggregate(span, obs_type, aggregate)
+                            if aggregate in ('sum', 'avg', 'meanmin'):
+                                self.assertAlmostEqual(result[aggregate][0], expected[0], 9)
+                            else:
+                                self.assertEqual(result[aggregate][0], expected[0])
+                            self.assertEqual(result[aggregate][1:], expected[1:])
+
+        # Iterating over the days of a month fetches the aggregates of each type once:
+        db_binder = weewx.manager.DBBinder(self.config_dict)
+        stop_ts = time.mktime((2010,4,01,0,0,0,0,0,-1))
+        tagStats = weewx.tags.TimeBinder(db_binder.bind_default(), stop_ts, rain_year_start=1, skin_dict=skin_dict)
+        for day in tagStats.month().days():
+            tsb = weewx.tags.TimespanBinder(day.timespan, db_binder.bind_default(), context='day', skin_dict=skin_dict)
+            self.assertEqual(str(day.outTemp.max), str(tsb.outTemp.max))
+            self.assertEqual(str(day.outTemp.mintime), str(tsb.outTemp.mintime))
+            self.assertEqual(str(day.rain.sum), str(tsb.rain.sum))
+            self.assertEqual(day.outTemp.max_ge((50, 'degree_F', 'group_temperature')).raw,
+                             tsb.outTemp.max_ge((50, 'degree_F', 'group_temperature')).raw)
+            self.assertEqual(str(day.heatdeg.sum), str(tsb.heatdeg.sum))
+        prefetch_manager = day.db_lookup()
+        self.assertTrue(isinstance(prefetch_manager, weewx.tags.PrefetchManager))
+        self.assertEqual(sorted(prefetch_manager.blocks.keys()), ['outTemp', 'rain'])
+
+        # So does iterating over custom spans:
+        for span in tagStats.day(days_ago=3).spans(interval=10800):
+            tsb = weewx.tags.TimespanBinder(span.timespan, db_binder.bind_default(), context='day')
+            self.assertEqual(str(span.outTemp.min), str(tsb.outTemp.min))
+            self.assertEqual(str(span.outTemp.maxtime), str(tsb.outTemp.maxtime))
+            self.assertEqual(str(span.rain.sum), str(tsb.rain.sum))
+        self.assertEqual(sorted(span.db_lookup().blocks.keys()), ['outTemp', 'rain'])
+
+    def test_records(self):
+        """Test iterating over the records of a span"""
+        db_binder = weewx.manager.DBBinder(self.config_dict)
+        stop_ts = time.mktime((2010,4,01,0,0,0,0,0,-1))
+        tagStats = weewx.tags.TimeBinder(db_binder.bind_default(), stop_ts, rain_year_start=1, skin_dict=skin_dict)
+        manager = db_binder.get_manager()
+        day = tagStats.day(days_ago=1)
+        expected = list(manager.genBatchRecords(day.timespan.start, day.timespan.stop))
+        results = []
+        for (i, record) in enumerate(day.records()):
+            row = [record.dateTime.raw, record.outTemp.raw]
+            # A type first used part way through:
+            if i >= 100:
+                row.append(record.barometer.raw)
+            results.append(row)
+        self.assertEqual(results, [[r['dateTime'], r['outTemp']] + ([r['barometer']] if i >= 100 else [])
+                                   for (i, r) in enumerate(expected)])
+        # Only the types used are read:
+        records = list(manager.genBatchRecords(day.timespan.start, day.timespan.stop, obs_types=['outTemp', 'foo']))
+        self.assertEqual(sorted(records[0].keys()), ['dateTime', 'interval', 'outTemp', 'usUnits'])
+        self.assertEqual(len(records), len(expected))
+
     def test_agg_intervals(self):
         """Test aggregation spans that do not span a day"""
         db_binder = weewx.manager.DBBinder(self.config_dict)
@@ -308,6 +675,106 @@ class Common(unittest.TestCase):
                     self.assertEqual(str(table_answer), str(daily_answer), 
                                      msg="aggregation=%s; %s vs %s" % (aggregation, table_answer, daily_answer))
             
+    def test_agg_vectors(self):
+        """Test aggregated vectors from a GROUP BY query, or from the daily summaries
+        and the rollups, against one query of the archive table per interval"""
+        
+        # Spans that include the spring DST boundary, and most of the data:
+        spans = [(time.mktime((2010,3,13,18,0,0,0,0,-1)), time.mktime((2010,3,15,6,0,0,0,0,-1))),
+                 (time.mktime((2010,1,1,0,0,0,0,0,-1)),   time.mktime((2010,9,1,0,0,0,0,0,-1)))]
+        intervals = [3600, 3*3600, 86400, 365.25 / 12 * 24 * 3600]
+
+        with weewx.manager.open_manager_with_config(self.config_dict, 'wx_binding') as manager:
+            try:
+                # First from the daily summaries alone, then with the hours, months
+                # and years rolled up as well
+                for levels in [[], ['hour', 'month', 'year']]:
+                    manager.rebuild_rollups(levels)
+                    for timespan in spans:
+                        for aggregate_interval in intervals:
+                            for aggregate_type in ['sum', 'count', 'avg', 'max', 'min']:
+                                self._check_agg_vectors(manager, timespan, aggregate_type, aggregate_interval)
+            finally:
+                manager.rebuild_rollups([])
+
+    def _check_agg_vectors(self, manager, timespan, aggregate_type, aggregate_interval):
+        manager.group_by_aggregation = True
+        grouped_vecs = manager.getSqlVectors(timespan, 'outTemp', aggregate_type, aggregate_interval)
+        manager.group_by_aggregation = False
+        weewx.manager.DaySummaryManager.summary_vectors = False
+        try:
+            interval_vecs = manager.getSqlVectors(timespan, 'outTemp', aggregate_type, aggregate_interval)
+        finally:
+            manager.group_by_aggregation = True
+            weewx.manager.DaySummaryManager.summary_vectors = True
+        self.assertEqual(grouped_vecs[0], interval_vecs[0])
+        self.assertEqual(grouped_vecs[1], interval_vecs[1])
+        self.assertEqual(len(grouped_vecs[2][0]), len(interval_vecs[2][0]))
+        for (grouped, single) in zip(grouped_vecs[2][0], interval_vecs[2][0]):
+            self.assertAlmostEqual(grouped, single)
+
+    def test_vector_cache(self):
+        """Test memoizing vectors, and slicing them from those of longer timespans"""
+        week = (time.mktime((2010,3,10,0,0,0,0,0,-1)), time.mktime((2010,3,17,0,0,0,0,0,-1)))
+        # Includes the spring DST boundary:
+        day = (time.mktime((2010,3,14,0,0,0,0,0,-1)), time.mktime((2010,3,15,0,0,0,0,0,-1)))
+        # Starts in the middle of an hour:
+        offset_day = (day[0] + 1800, day[1])
+        cache = weewx.manager.VectorCache()
+
+        with weewx.manager.open_manager_with_config(self.config_dict, 'wx_binding') as manager:
+            for (obs_type, aggregate_type, aggregate_interval) in [('outTemp', None, None),
+                                                                   ('outTemp', 'avg', 3600),
+                                                                   ('windvec', None, None),
+                                                                   ('windvec', 'max', 3600)]:
+                cache.hits = cache.misses = 0
+                self.assertEqual(cache.get_vectors(manager, week, obs_type, aggregate_type, aggregate_interval),
+                                 manager.getSqlVectors(week, obs_type, aggregate_type, aggregate_interval))
+                self.assertEqual(cache.get_vectors(manager, week, obs_type, aggregate_type, aggregate_interval),
+                                 manager.getSqlVectors(week, obs_type, aggregate_type, aggregate_interval))
+                self.assertEqual((cache.hits, cache.misses), (1, 1))
+                # The day is sliced from the week:
+                self.assertEqual(cache.get_vectors(manager, day, obs_type, aggregate_type, aggregate_interval),
+                                 manager.getSqlVectors(day, obs_type, aggregate_type, aggregate_interval))
+                self.assertEqual((cache.hits, cache.misses), (2, 1))
+                # Aggregation intervals that were not fetched are not:
+                self.assertEqual(cache.get_vectors(manager, offset_day, obs_type, aggregate_type, aggregate_interval),
+                                 manager.getSqlVectors(offset_day, obs_type, aggregate_type, aggregate_interval))
+                self.assertEqual((cache.hits, cache.misses), (3, 1) if aggregate_type is None else (2, 2))
+
+    @unittest.skipIf(weewx.manager.numpy is None, "Module numpy is not installed")
+    def test_windvec_vectors(self):
+        """Test aggregated wind vectors calculated with numpy against pure Python"""
+        
+        timespan = (time.mktime((2010,3,1,0,0,0,0,0,-1)), time.mktime((2010,4,1,0,0,0,0,0,-1)))
+        
+        with weewx.manager.open_manager_with_config(self.config_dict, 'wx_binding') as manager:
+            for obs_type in ['windvec', 'windgustvec']:
+                for aggregate_interval in [3*3600, 86400]:
+                    for aggregate_type in ['sum', 'count', 'avg', 'max', 'min', 'last']:
+                        numpy_vecs = manager.getSqlVectors(timespan, obs_type, aggregate_type, aggregate_interval)
+                        save_numpy, weewx.manager.numpy = weewx.manager.numpy, None
+                        try:
+                            python_vecs = manager.getSqlVectors(timespan, obs_type, aggregate_type, aggregate_interval)
+                        finally:
+                            weewx.manager.numpy = save_numpy
+                        self.assertEqual(numpy_vecs[0], python_vecs[0])
+                        self.assertEqual(numpy_vecs[1], python_vecs[1])
+                        self.assertEqual(numpy_vecs[2][1:], python_vecs[2][1:])
+                        self.assertEqual(len(numpy_vecs[2][0]), len(python_vecs[2][0]))
+                        for (numpy_val, python_val) in zip(numpy_vecs[2][0], python_vecs[2][0]):
+                            self.assertAlmostEqual(numpy_val.real if aggregate_type != 'count' else numpy_val,
+                                                   python_val.real if aggregate_type != 'count' else python_val)
+                            if aggregate_type != 'count':
+                                self.assertAlmostEqual(numpy_val.imag, python_val.imag)
+
+            # Spot check the count against the archive table. A direction is required unless the speed is zero:
+            count_vecs = manager.getSqlVectors(timespan, 'windvec', 'count', 86400)
+            res = manager.getSql("SELECT COUNT(windSpeed) FROM archive WHERE dateTime>? AND dateTime<=? "
+                                 "AND (windSpeed = 0 OR windDir IS NOT NULL)", 
+                                 (count_vecs[0][0][0], count_vecs[1][0][0]))
+            self.assertEqual(count_vecs[2][0][0], res[0])
+
     def test_rainYear(self):
         db_binder = weewx.manager.DBBinder(self.config_dict)
         db_lookup = db_binder.bind_default()
@@ -338,6 +805,72 @@ class Common(unittest.TestCase):
         self.assertEqual(str(tagStats.year().cooldeg.sum), "1026.2°F-day")
     
 
+def windvec(mag, direction):
+    return complex(mag * math.cos(math.radians(90.0 - direction)),
+                   mag * math.sin(math.radians(90.0 - direction)))
+
+class WindAggregateTest(unittest.TestCase):
+    """Test the aggregation of wind vectors, with and without numpy, on rows
+    made up to cover the corner cases."""
+
+    span_list = [weeutil.weeutil.TimeSpan(start, start + 100) for start in range(1000, 1400, 100)]
+
+    # Rows of (dateTime, magnitude, direction, usUnits)
+    rows = [(1000, 9.0, 0.0, weewx.US),         # On the start of the first span, so not in it
+            (1010, 5.0, 90.0, weewx.US),
+            (1020, None, 180.0, weewx.US),      # No magnitude
+            (1030, 0.0, None, weewx.US),        # No direction, and no wind
+            (1040, 3.0, None, weewx.US),        # No direction, but wind
+            (1050, 5.0, 270.0, weewx.US),       # Ties for the max with the one at 1010
+            (1100, 2.0, 45.0, weewx.US),        # On the stop of the first span
+            (1150, 2.0, 0.0, weewx.US),
+            (1160, 1.0, 90.0, weewx.US),
+            (1170, 1.0, 180.0, weewx.US),       # Ties for the min with the one at 1160
+            (1200, None, 90.0, weewx.METRIC),   # Last in its span, but no magnitude
+            (1210, 4.0, 10.0, weewx.US),
+            (1300, 0.0, None, weewx.US),        # Last in its span, with no wind
+            (1350, 4.0, None, weewx.US),        # The only one in its span, and not good
+            (1450, 9.0, 0.0, weewx.US)]         # After the last span
+
+    # Key is the aggregate type, value is the result for each span
+    expected = {'count': [4, 3, 2, None],
+                'sum': [windvec(5.0, 90.0) + windvec(5.0, 270.0) + windvec(2.0, 45.0),
+                        windvec(2.0, 0.0) + windvec(1.0, 90.0) + windvec(1.0, 180.0),
+                        windvec(4.0, 10.0), None],
+                'avg': [(windvec(5.0, 90.0) + windvec(5.0, 270.0) + windvec(2.0, 45.0)) / 4,
+                        (windvec(2.0, 0.0) + windvec(1.0, 90.0) + windvec(1.0, 180.0)) / 3,
+                        windvec(4.0, 10.0) / 2, None],
+                'max': [windvec(5.0, 90.0), windvec(2.0, 0.0), windvec(4.0, 10.0), None],
+                'min': [0j, windvec(1.0, 90.0), 0j, None],
+                'last': [windvec(2.0, 45.0), None, 0j, None]}
+
+    def _check(self, aggregate_wind):
+        for aggregate_type in ['count', 'sum', 'avg', 'max', 'min', 'last']:
+            (results, std_unit_system) = aggregate_wind(self.span_list, self.rows, aggregate_type)
+            self.assertEqual(std_unit_system, weewx.US)
+            expected = [(span, value) for (span, value)
+                        in zip(self.span_list, self.expected[aggregate_type]) if value is not None]
+            self.assertEqual([span for (span, _) in results], [span for (span, _) in expected],
+                             "Spans differ for aggregate type %s" % aggregate_type)
+            for ((_, value), (_, expected_value)) in zip(results, expected):
+                if aggregate_type == 'count':
+                    self.assertEqual(value, expected_value)
+                else:
+                    self.assertAlmostEqual(value.real, expected_value.real, 9)
+                    self.assertAlmostEqual(value.imag, expected_value.imag, 9)
+
+        self.assertEqual(aggregate_wind(self.span_list, [], 'avg'), ([], None))
+        # The unit system of good records cannot change
+        rows = sorted(self.rows + [(1360, 1.0, 90.0, weewx.METRIC)])
+        self.assertRaises(weewx.UnsupportedFeature, aggregate_wind, self.span_list, rows, 'avg')
+
+    def test_aggregate_wind(self):
+        self._check(weewx.manager._aggregate_wind)
+
+    @unittest.skipIf(weewx.manager.numpy is None, "Module numpy is not installed")
+    def test_aggregate_wind_numpy(self):
+        self._check(weewx.manager._aggregate_wind_numpy)
+
 class TestSqlite(Common):
 
     def __init__(self, *args, **kwargs):
@@ -352,11 +885,12 @@ class TestMySQL(Common):
         
     
 def suite():
-    tests = ['test_create_stats', 'testScalarTally', 'testWindTally', 'testRebuild',
-             'testTags', 'test_rainYear', 'test_agg_intervals', 'test_agg', 'test_heatcool']
+    tests = ['test_create_stats', 'testScalarTally', 'testWindTally', 'testRebuild', 'testFastRebuild', 'testParallelRebuild',
+             'testTags', 'testTagsCache', 'testRecordCache', 'test_saved_aggregates', 'test_saved_aggregates_race', 'test_hybrid_agg', 'test_batch_agg', 'test_span_agg', 'test_records', 'test_rainYear', 'test_agg_intervals', 'test_agg', 'test_agg_vectors', 'test_vector_cache', 'test_windvec_vectors', 'test_heatcool']
     
     # Test both sqlite and MySQL:
-    return unittest.TestSuite(map(TestSqlite, tests) + map(TestMySQL, tests))
+    return unittest.TestSuite(map(TestSqlite, tests) + map(TestMySQL, tests) +
+                              map(WindAggregateTest, ['test_aggregate_wind', 'test_aggregate_wind_numpy']))
 
 if __name__ == '__main__':
 
@@ -9,7 +9,10 @@ from __future__ import with_statement
 import unittest
 import time
 
+import weecfg.database
+import weewx.accum
 import weewx.manager
+import weewx.wxmanager
 import weedb
 import weeutil.weeutil
 
@@ -219,6 +222,255 @@ class Common(unittest.TestCase):
                 # Compare them.
                 self.assertAlmostEqual(expected_avg, barvec[2][0][irec])
 
+    def test_bulk_add(self):
+        # Add the first half of the records one at a time:
+        with weewx.manager.Manager.open_with_create(self.archive_db_dict, schema=archive_schema) as archive:
+            for irec in range(nrecs/2):
+                archive.addRecord(expected_record(irec))
+            
+        # Now add all of them in bulk, using a small batch size. The first half
+        # are duplicates, so they should get quietly swallowed. One record carries
+        # an extra type, and another a type not in the schema.
+        record_list = [_rec for _rec in genRecords()]
+        record_list[-3]['windSpeed'] = 5.0
+        record_list[-2]['foo'] = 1.0
+        # A duplicate within the collection:
+        record_list.append(expected_record(nrecs-1))
+        with weewx.manager.Manager.open(self.archive_db_dict) as archive:
+            archive.batch_size = 10
+            archive.addRecord(record_list)
+            self.assertEqual(archive.first_timestamp, start_ts)
+            self.assertEqual(archive.last_timestamp, stop_ts)
+
+        with weewx.manager.Manager.open(self.archive_db_dict) as archive:
+            self.assertEqual(archive.firstGoodStamp(), start_ts)
+            self.assertEqual(archive.lastGoodStamp(), stop_ts)
+            self.assertEqual(archive.getSql("SELECT COUNT(*) FROM archive")[0], nrecs)
+            for (irec, _rec) in enumerate(archive.genBatchRecords()):
+                self.assertEqual(_rec.pop('windSpeed'), 5.0 if irec == nrecs - 3 else None)
+                self.assertEqual(expected_record(irec), _rec)
+
+            # Test changing the unit system. It should raise a UnitError exception:
+            metric_record = {'dateTime': stop_ts + interval, 'interval': interval, 'usUnits' : 16, 'outTemp': 20.0}
+            self.assertRaises(weewx.UnitError, archive.addRecord, [metric_record])
+
+    def test_bulk_add_daily(self):
+        # Add the records to the daily summaries one at a time, then in bulk,
+        # and compare the results.
+        with weewx.manager.DaySummaryManager.open_with_create(self.archive_db_dict, schema=archive_schema) as archive:
+            for _rec in genRecords():
+                archive.addRecord(_rec)
+            single_summaries = [archive._get_day_summary(weeutil.weeutil.startOfArchiveDay(ts)) for ts in (start_ts, stop_ts)]
+        weedb.drop(self.archive_db_dict)
+        with weewx.manager.DaySummaryManager.open_with_create(self.archive_db_dict, schema=archive_schema) as archive:
+            archive.batch_size = 10
+            archive.addRecord(genRecords())
+            bulk_summaries = [archive._get_day_summary(weeutil.weeutil.startOfArchiveDay(ts)) for ts in (start_ts, stop_ts)]
+            self.assertEqual(archive._read_metadata('lastUpdate'), str(stop_ts))
+        for (single_summary, bulk_summary) in zip(single_summaries, bulk_summaries):
+            for obs_type in ('barometer', 'inTemp', 'outTemp'):
+                self.assertEqual(single_summary[obs_type].getStatsTuple(), bulk_summary[obs_type].getStatsTuple())
+
+    def test_day_cache(self):
+        # Two managers on the same database, each adding records for the same day.
+        # Each must notice the other's updates to the daily summaries.
+        with weewx.manager.DaySummaryManager.open_with_create(self.archive_db_dict, schema=archive_schema) as archive1:
+            with weewx.manager.DaySummaryManager.open(self.archive_db_dict) as archive2:
+                for irec in range(12):
+                    archive = archive1 if irec % 3 else archive2
+                    archive.addRecord(expected_record(irec))
+                
+                # Both managers keep the day in memory, but only the last one to write is current:
+                self.assertEqual(archive1._day_cache[0].timespan.start, weeutil.weeutil.startOfArchiveDay(timefunc(11)))
+                self.assertEqual(archive1._day_cache[1], str(timefunc(11)))
+                self.assertEqual(archive2._day_cache[1], str(timefunc(9)))
+                for archive in (archive1, archive2):
+                    day_summary = archive._get_day_summary(weeutil.weeutil.startOfArchiveDay(timefunc(11)))
+                    # Records 0 through 11 all fall on the same day, except the first, which is at midnight
+                    self.assertEqual(day_summary['outTemp'].count, 11)
+                    self.assertAlmostEqual(day_summary['outTemp'].sum, sum(temperfunc(irec) for irec in range(1, 12)))
+                    self.assertEqual(day_summary['outTemp'].max, temperfunc(11))
+
+    def test_dirty_write(self):
+        # Only daily summaries whose statistics have changed should be rewritten
+        with weewx.manager.DaySummaryManager.open_with_create(self.archive_db_dict, schema=archive_schema) as archive:
+            archive.addRecord(expected_record(1))
+            sod = weeutil.weeutil.startOfArchiveDay(timefunc(1))
+            # The records have no windSpeed, but its summary should have been created once:
+            self.assertEqual(archive.getSql("SELECT count FROM archive_day_windSpeed WHERE dateTime=?", (sod,)), (0,))
+            # Tamper with it, then add another record for the same day:
+            archive.connection.execute("UPDATE archive_day_windSpeed SET count=99 WHERE dateTime=?", (sod,))
+            archive.addRecord(expected_record(2))
+            # The windSpeed summary did not change, so it should not have been written...
+            self.assertEqual(archive.getSql("SELECT count FROM archive_day_windSpeed WHERE dateTime=?", (sod,)), (99,))
+            # ... but outTemp should have been:
+            self.assertEqual(archive.getSql("SELECT count FROM archive_day_outTemp WHERE dateTime=?", (sod,)), (2,))
+            
+            # A rebuild starts from fresh accumulators, so everything gets written:
+            archive.drop_daily()
+        with weewx.manager.DaySummaryManager.open_with_create(self.archive_db_dict, schema=archive_schema) as archive:
+            archive.backfill_day_summary()
+            self.assertEqual(archive.getSql("SELECT count FROM archive_day_windSpeed WHERE dateTime=?", (sod,)), (0,))
+
+    def test_wide_layout(self):
+        # The same records should give the same statistics in either daily summary layout
+        def gen_wind_records(irecs):
+            for irec in irecs:
+                _record = expected_record(irec)
+                _record.update({'windSpeed': 1.0 + irec % 5, 'windDir': 10.0 * irec})
+                yield _record
+        
+        def get_results(archive):
+            _results = []
+            _sod_list = [weeutil.weeutil.startOfArchiveDay(ts) for ts in (start_ts, start_ts + 3600, stop_ts)]
+            _span_list = [weeutil.weeutil.archiveDaySpan(sod, 0) for sod in _sod_list] + \
+                [weeutil.weeutil.TimeSpan(_sod_list[0], _sod_list[-1] + 24*3600)]
+            for _span in _span_list:
+                for _obs_type in ['outTemp', 'barometer', 'windSpeed']:
+                    for _agg in ['min', 'mintime', 'max', 'maxtime', 'meanmax', 'sum', 'count', 'avg']:
+                        _results.append(archive.getAggregate(_span, _obs_type, _agg))
+                for _agg in ['max', 'maxtime', 'gustdir', 'avg', 'rms', 'vecavg', 'vecdir']:
+                    _results.append(archive.getAggregate(_span, 'wind', _agg))
+            for _sod in _sod_list:
+                _day_summary = archive._get_day_summary(_sod)
+                _results.extend((_day_key, _day_summary[_day_key].getStatsTuple()) for _day_key in archive.daykeys)
+            return sorted(_results)
+        
+        with weewx.wxmanager.WXDaySummaryManager.open_with_create(self.archive_db_dict, schema=archive_schema) as archive:
+            self.assertEqual(archive.day_layout, 'table')
+            archive.addRecord(gen_wind_records(range(nrecs)))
+            table_daykeys = sorted(archive.daykeys)
+            table_results = get_results(archive)
+        
+        weedb.drop(self.archive_db_dict)
+        with weewx.wxmanager.WXDaySummaryManager.open_with_create(self.archive_db_dict, schema=archive_schema) as archive:
+            archive.addRecord(gen_wind_records(range(nrecs/2)))
+            # Records 0 through 23 fall on two days:
+            self.assertEqual(archive.set_day_layout('wide'), 2)
+            self.assertEqual(archive.set_day_layout('wide'), None)
+            self.assertTrue('archive_day' in archive.connection.tables())
+            self.assertFalse('archive_day_outTemp' in archive.connection.tables())
+            for _record in gen_wind_records(range(nrecs/2, nrecs)):
+                archive.addRecord(_record)
+        
+        with weewx.wxmanager.WXDaySummaryManager.open(self.archive_db_dict) as archive:
+            self.assertEqual(archive.day_layout, 'wide')
+            self.assertEqual(sorted(archive.daykeys), table_daykeys)
+            self.assertEqual(get_results(archive), table_results)
+            # Now convert back again:
+            self.assertEqual(archive.set_day_layout('table'), 3)
+            self.assertFalse('archive_day' in archive.connection.tables())
+            self.assertEqual(archive.connection.columnsOf('archive_day_wind')[-1], 'wsquaresum')
+            self.assertEqual(get_results(archive), table_results)
+            self.assertRaises(ValueError, archive.set_day_layout, 'narrow')
+
+    def test_drop_layout(self):
+        # Daily summaries dropped, then rebuilt, should keep their layout
+        with weewx.wxmanager.WXDaySummaryManager.open_with_create(self.archive_db_dict, schema=archive_schema) as archive:
+            archive.addRecord(genRecords())
+            table_results = [archive.getAggregate(weeutil.weeutil.TimeSpan(start_ts, stop_ts), _obs_type, _agg)
+                             for _obs_type in ('outTemp', 'barometer') for _agg in ('min', 'max', 'count')]
+            archive.set_day_layout('wide')
+            archive.drop_daily()
+            self.assertFalse(hasattr(archive, 'day_layout'))
+            self.assertFalse('archive_day' in archive.connection.tables())
+        # Without a schema, the daily summaries cannot be rebuilt
+        self.assertRaises(weedb.OperationalError, weewx.wxmanager.WXDaySummaryManager.open, self.archive_db_dict)
+        with weewx.wxmanager.WXDaySummaryManager.open_with_create(self.archive_db_dict, schema=archive_schema) as archive:
+            self.assertEqual(archive.day_layout, 'wide')
+            self.assertTrue('archive_day' in archive.connection.tables())
+            self.assertFalse('archive_day_outTemp' in archive.connection.tables())
+            archive.backfill_day_summary()
+            self.assertEqual([archive.getAggregate(weeutil.weeutil.TimeSpan(start_ts, stop_ts), _obs_type, _agg)
+                              for _obs_type in ('outTemp', 'barometer') for _agg in ('min', 'max', 'count')],
+                             table_results)
+            # Back to the default layout, which leaves nothing behind
+            archive.set_day_layout('table')
+            archive.drop_daily()
+            self.assertEqual([_table for _table in archive.connection.tables() if _table.startswith('archive_day')], [])
+        with weewx.wxmanager.WXDaySummaryManager.open_with_create(self.archive_db_dict, schema=archive_schema) as archive:
+            self.assertEqual(archive.day_layout, 'table')
+            self.assertTrue('archive_day_outTemp' in archive.connection.tables())
+
+    def test_rollups(self):
+        # The rollups kept up to date as records are added should be the same as when rebuilt
+        def gen_wind_records(irecs):
+            for irec in irecs:
+                _record = expected_record(irec)
+                _record['windSpeed'] = 1.0 + irec % 5
+                yield _record
+        
+        def get_rows(archive):
+            return [row for level in ('hour', 'month', 'year') 
+                    for row in archive.genSql("SELECT * FROM archive_%s ORDER BY dateTime" % level)]
+        
+        with weewx.wxmanager.WXDaySummaryManager.open_with_create(self.archive_db_dict, schema=archive_schema) as archive:
+            archive.addRecord(gen_wind_records(range(nrecs/2)))
+            # Records 0 through 23 fall in 24 hours, 2 months (the first is at midnight), and one year:
+            self.assertEqual(archive.rebuild_rollups(['hour', 'month', 'year']), 27)
+            self.assertRaises(ValueError, archive.rebuild_rollups, ['week'])
+            for _record in gen_wind_records(range(nrecs/2, nrecs*3/4)):
+                archive.addRecord(_record)
+            # A LOOP high, which the months and years should get, but not the hours:
+            _record = list(gen_wind_records([nrecs*3/4]))[0]
+            _accum = weewx.accum.Accum(weeutil.weeutil.TimeSpan(_record['dateTime'] - interval, _record['dateTime']))
+            _accum.addRecord({'dateTime': _record['dateTime'] - 60, 'usUnits': 1, 'outTemp': 100.0})
+            archive.addRecord(_record, accumulator=_accum)
+            archive.addRecord(gen_wind_records(range(nrecs*3/4 + 1, nrecs)))
+            rows = get_rows(archive)
+            self.assertEqual(archive.rebuild_rollups(['hour', 'month', 'year']), nrecs + 3)
+            rebuilt_rows = get_rows(archive)
+            self.assertEqual(len(rebuilt_rows), len(rows))
+            for (row, rebuilt_row) in zip(rows, rebuilt_rows):
+                for (value, rebuilt_value) in zip(row, rebuilt_row):
+                    # Sums may have been added up in a different order
+                    self.assertAlmostEqual(value, rebuilt_value)
+            
+            # Aggregates over whole months, or whole hours, should be the same as without the rollups
+            _month_span = weeutil.weeutil.archiveMonthSpan(stop_ts)
+            _hour_span = weeutil.weeutil.TimeSpan(start_ts - 2 * interval, stop_ts - 2 * interval)
+            self.assertEqual(archive._get_rollup_level(_month_span, 'outTemp', 'max'), 'month')
+            self.assertEqual(archive._get_hybrid_parts(_hour_span, 'outTemp'), 
+                             [(weeutil.weeutil.TimeSpan(_hour_span.start, start_ts), 'hour'),
+                              (weeutil.weeutil.TimeSpan(start_ts, start_ts + 24 * interval), 'day'),
+                              (weeutil.weeutil.TimeSpan(start_ts + 24 * interval, _hour_span.stop), 'hour')])
+            self.assertEqual(archive.getAggregate(_month_span, 'outTemp', 'max')[0], 100.0)
+            _rollups = archive._rollups
+            for _agg in ['min', 'mintime', 'max', 'maxtime', 'sum', 'count', 'avg']:
+                _value = archive.getAggregate(_month_span, 'outTemp', _agg)[0]
+                archive._rollups = {}
+                self.assertAlmostEqual(_value, archive.getAggregate(_month_span, 'outTemp', _agg)[0])
+                archive._rollups = _rollups
+                self.assertEqual(archive.getAggregate(_hour_span, 'outTemp', _agg),
+                                 weewx.manager.Manager.getAggregate(archive, _hour_span, 'outTemp', _agg))
+            for _agg in ['sum', 'count', 'avg']:
+                self.assertEqual(archive.getSqlVectors(_hour_span, 'outTemp', _agg, 3 * interval),
+                                 weewx.manager.Manager.getSqlVectors(archive, _hour_span, 'outTemp', _agg, 3 * interval))
+            
+            # A daily maximum windSpeed gone wrong makes its way into the rollups...
+            _max_sql = "SELECT MAX(windSpeed) FROM archive WHERE dateTime > ? AND dateTime <= ?"
+            archive.connection.execute("UPDATE %s SET %s=99.0 WHERE dateTime=?"
+                                       % (archive._day_table('windSpeed'), archive._day_column('windSpeed', 'max')),
+                                       (_month_span.start,))
+            archive._fill_rollups(start_ts - 1, stop_ts)
+            self.assertEqual(archive.getAggregate(_month_span, 'windSpeed', 'max')[0], 99.0)
+            # ... and is put right in them by recalculating it from the archive
+            config_dict = {'DataBindings': {'wx_binding': {'database_dict': self.archive_db_dict,
+                                                           'manager': 'weewx.wxmanager.WXDaySummaryManager'}}}
+            fix = weecfg.database.WindSpeedRecalculation(config_dict, {'name': 'Maximum windSpeed calculation',
+                                                                       'dry_run': False})
+            try:
+                fix.run()
+            finally:
+                fix.dbm.close()
+            self.assertEqual(archive._get_rollup_level(_month_span, 'windSpeed', 'max'), 'month')
+            self.assertEqual(archive.getAggregate(_month_span, 'windSpeed', 'max')[0],
+                             archive.getSql(_max_sql, _month_span)[0])
+            
+            # Finally, drop them:
+            self.assertEqual(archive.rebuild_rollups([]), 0)
+            self.assertFalse('archive_hour' in archive.connection.tables())
+
     def test_update(self):
         # Add a bunch of records
         self.populate_database()
@@ -246,7 +498,8 @@ class TestMySQL(Common):
     
 def suite():
     tests = ['test_no_archive', 'test_create_archive', 
-             'test_empty_archive', 'test_add_archive_records', 'test_get_records', 'test_update']
+             'test_empty_archive', 'test_add_archive_records', 'test_get_records', 'test_bulk_add', 'test_bulk_add_daily',
+             'test_day_cache', 'test_dirty_write', 'test_wide_layout', 'test_drop_layout', 'test_rollups', 'test_update']
     return unittest.TestSuite(map(TestSqlite, tests) + map(TestMySQL, tests))
             
 if __name__ == '__main__':
@@ -0,0 +1,189 @@
+#
+#    Copyright (c) 2009-2016 Tom Keffer <tkeffer@gmail.com>
+#
+#    See the file LICENSE.txt for your full rights.
+#
+"""Test the timing of the callbacks of services in weewx.engine"""
+
+from __future__ import with_statement
+
+import json
+import os
+import StringIO
+import syslog
+import unittest
+
+import configobj
+
+import weewx
+import weewx.engine
+
+stats_file = '/var/tmp/weewx_test/service_stats.json'
+
+config_str = """
+[Station]
+    location = "Sim City"
+    latitude = 45.686
+    longitude = -121.566
+    altitude = 100, meter
+    station_type = Simulator
+
+[Simulator]
+    loop_interval = 60
+    mode = generator
+    start = 2011-01-01T00:00
+    driver = weewx.drivers.simulator
+
+[StdConvert]
+    target_unit = METRIC
+
+[StdCalibrate]
+    [[Corrections]]
+        outTemp = outTemp - 0.2
+
+[Engine]
+    service_stats_file = %s
+    [[Services]]
+        process_services = weewx.engine.StdConvert, weewx.engine.StdCalibrate, %s.LateService
+""" % (stats_file, __name__)
+
+class Service(object):
+
+    def __init__(self):
+        self.calls = 0
+
+    def new_loop_packet(self, event):  # @UnusedVariable
+        self.calls += 1
+
+    def check_loop(self, event):  # @UnusedVariable
+        raise weewx.engine.BreakLoop
+
+class LateService(weewx.engine.StdService):
+    """Binds to NEW_ARCHIVE_RECORD only once the engine is running"""
+
+    def __init__(self, engine, config_dict):
+        super(LateService, self).__init__(engine, config_dict)
+        self.bind(weewx.STARTUP, self.startup)
+        self.records = 0
+
+    def startup(self, event):  # @UnusedVariable
+        self.bind(weewx.NEW_ARCHIVE_RECORD, self.new_archive_record)
+
+    def new_archive_record(self, event):  # @UnusedVariable
+        self.records += 1
+
+class ServiceStatsTest(unittest.TestCase):
+
+    def setUp(self):
+        syslog.openlog('test_engine', syslog.LOG_CONS)
+        syslog.setlogmask(syslog.LOG_UPTO(syslog.LOG_DEBUG))
+        try:
+            os.makedirs(os.path.dirname(stats_file))
+        except OSError:
+            pass
+        try:
+            os.remove(stats_file)
+        except OSError:
+            pass
+
+    def test_timed_callback(self):
+        service = Service()
+        service_stats = weewx.engine.ServiceStats(3600, stats_file)
+        callback = service_stats.wrap(weewx.NEW_LOOP_PACKET, service.new_loop_packet)
+        for _ in range(10):
+            callback(weewx.Event(weewx.NEW_LOOP_PACKET))
+        self.assertEqual(service.calls, 10)
+        # Exceptions get through, and the call is still counted
+        check = service_stats.wrap(weewx.CHECK_LOOP, service.check_loop)
+        self.assertRaises(weewx.engine.BreakLoop, check, weewx.Event(weewx.CHECK_LOOP))
+
+        stats = service_stats.callback_stats[('NEW_LOOP_PACKET', Service.__module__ + '.Service.new_loop_packet')]
+        self.assertEqual(stats.count, 10)
+        self.assertEqual(len(stats.samples), 10)
+        self.assertEqual(service_stats.callback_stats[('CHECK_LOOP', Service.__module__ + '.Service.check_loop')].count, 1)
+
+        # Nothing has been written yet
+        self.assertFalse(os.path.exists(stats_file))
+        service_stats.report()
+        with open(stats_file) as fd:
+            data = json.load(fd)
+        self.assertEqual([(x['event'], x['count']) for x in data['callbacks']],
+                         [('CHECK_LOOP', 1), ('NEW_LOOP_PACKET', 10)])
+        for x in data['callbacks']:
+            self.assertTrue(0 <= x['p50'] <= x['p95'] <= x['p99'] <= x['max'])
+
+    def test_report_interval(self):
+        service = Service()
+        service_stats = weewx.engine.ServiceStats(0, stats_file)
+        callback = service_stats.wrap(weewx.NEW_LOOP_PACKET, service.new_loop_packet)
+        callback(weewx.Event(weewx.NEW_LOOP_PACKET))
+        # With an interval of zero, the stats are reported after every call
+        self.assertTrue(os.path.exists(stats_file))
+
+    def test_percentile(self):
+        samples = range(1, 101)
+        self.assertEqual(weewx.engine._percentile(samples, 50), 50)
+        self.assertEqual(weewx.engine._percentile(samples, 95), 95)
+        self.assertEqual(weewx.engine._percentile(samples, 99), 99)
+        self.assertEqual(weewx.engine._percentile([3], 99), 3)
+        self.assertEqual(weewx.engine._percentile([], 50), None)
+
+    def _get_engine(self, service_stats):
+        config_dict = configobj.ConfigObj(StringIO.StringIO(config_str))
+        if service_stats is not None:
+            config_dict['Engine']['service_stats'] = service_stats
+        return weewx.engine.StdEngine(config_dict)
+
+    def _get_callbacks(self, engine):
+        return [callback for event_type in engine.callbacks for callback in engine.callbacks[event_type]]
+
+    def test_engine_disabled(self):
+        engine = self._get_engine(None)
+        try:
+            self.assertTrue(engine.service_stats is None)
+            engine.dispatchEvent(weewx.Event(weewx.STARTUP))
+            # The callbacks are the bound methods of the services, untouched
+            for callback in self._get_callbacks(engine):
+                self.assertFalse(isinstance(callback, weewx.engine.TimedCallback))
+                self.assertTrue(callback.im_self is not None)
+        finally:
+            engine.shutDown()
+        self.assertFalse(os.path.exists(stats_file))
+
+    def test_engine(self):
+        engine = self._get_engine('True')
+        try:
+            late_service = engine.service_obj[-1]
+            engine.dispatchEvent(weewx.Event(weewx.STARTUP))
+            # All callbacks are timed, including the one bound after the engine was built
+            callbacks = self._get_callbacks(engine)
+            self.assertEqual(len(callbacks), 6)
+            for callback in callbacks:
+                self.assertTrue(isinstance(callback, weewx.engine.TimedCallback))
+            for (i, packet) in enumerate(engine.console.genLoopPackets()):
+                if i >= 5:
+                    break
+                engine.dispatchEvent(weewx.Event(weewx.NEW_LOOP_PACKET, packet=dict(packet)))
+            engine.dispatchEvent(weewx.Event(weewx.NEW_ARCHIVE_RECORD, record=packet, origin='hardware'))
+            self.assertEqual(late_service.records, 1)
+            # Nothing is reported until the engine shuts down
+            self.assertFalse(os.path.exists(stats_file))
+        finally:
+            engine.shutDown()
+        with open(stats_file) as fd:
+            data = json.load(fd)
+        self.assertEqual(sorted((x['event'], x['callback'], x['count']) for x in data['callbacks']),
+                         [('NEW_ARCHIVE_RECORD', LateService.__module__ + '.LateService.new_archive_record', 1),
+                          ('NEW_ARCHIVE_RECORD', 'weewx.engine.StdCalibrate.new_archive_record', 1),
+                          ('NEW_ARCHIVE_RECORD', 'weewx.engine.StdConvert.new_archive_record', 1),
+                          ('NEW_LOOP_PACKET', 'weewx.engine.StdCalibrate.new_loop_packet', 5),
+                          ('NEW_LOOP_PACKET', 'weewx.engine.StdConvert.new_loop_packet', 5),
+                          ('STARTUP', LateService.__module__ + '.LateService.startup', 1)])
+
+def suite():
+    tests = ['test_timed_callback', 'test_report_interval', 'test_percentile',
+             'test_engine_disabled', 'test_engine']
+    return unittest.TestSuite(map(ServiceStatsTest, tests))
+
+if __name__ == '__main__':
+    unittest.TextTestRunner(verbosity=2).run(suite())
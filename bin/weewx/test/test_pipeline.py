@@ -0,0 +1,174 @@
+#
+#    Copyright (c) 2009-2016 Tom Keffer <tkeffer@gmail.com>
+#
+#    See the file LICENSE.txt for your full rights.
+#
+"""Test that the fused LOOP packet pipeline gives the same results as the
+services it replaces."""
+
+import os
+import StringIO
+import syslog
+import unittest
+
+import configobj
+
+os.environ['TZ'] = 'America/Los_Angeles'
+
+import weewx.engine
+import weewx.pipeline
+import weewx.units
+
+config_str = """
+[Station]
+    location = "Sim City"
+    latitude = 45.686
+    longitude = -121.566
+    altitude = 100, meter
+    station_type = Simulator
+
+[Simulator]
+    loop_interval = 60
+    mode = generator
+    start = 2011-01-01T00:00
+    driver = weewx.drivers.simulator
+
+[StdConvert]
+    target_unit = METRIC
+
+[StdCalibrate]
+    [[Corrections]]
+        # Corrects a type in the packet
+        outTemp = outTemp - 0.2
+        # Uses a type that is None in some packets
+        barometer = barometer + rain * 0
+        # Adds a type to the packet
+        extraTemp1 = inTemp + 1.0
+        # Uses a type that is not in the packet
+        extraTemp2 = soilTemp1 + 1.0
+        # Uses a module imported by weewx.engine
+        extraTemp3 = inTemp + 0 * time.timezone
+
+[StdQC]
+    [[MinMax]]
+        outTemp = -10, 8, degree_C
+        windSpeed = 0, 8, mile_per_hour
+        outHumidity = 0, 70
+
+[StdWXCalculate]
+    [[Calculations]]
+        dewpoint = software
+        windchill = prefer_hardware
+        heatindex = prefer_hardware
+        rainRate = prefer_hardware
+        maxSolarRad = prefer_hardware
+        cloudbase = prefer_hardware
+        humidex = prefer_hardware
+        appTemp = prefer_hardware
+        pressure = none
+        ET = none
+        windrun = none
+
+[DataBindings]
+    [[wx_binding]]
+        database = archive_sqlite
+        manager = weewx.manager.DaySummaryManager
+        table_name = archive
+        schema = schemas.wview.schema
+
+[Databases]
+    [[archive_sqlite]]
+        database_name = /var/tmp/weewx_test/test_pipeline.sdb
+        driver = weedb.sqlite
+
+[Engine]
+    [[Services]]
+        process_services = weewx.engine.StdConvert, weewx.engine.StdCalibrate, weewx.engine.StdQC, weewx.wxservices.StdWXCalculate
+"""
+
+class PipelineTest(unittest.TestCase):
+
+    def setUp(self):
+        syslog.openlog('test_pipeline', syslog.LOG_CONS)
+        syslog.setlogmask(syslog.LOG_UPTO(syslog.LOG_DEBUG))
+
+    def _get_engine(self, fuse, target_unit):
+        config_dict = configobj.ConfigObj(StringIO.StringIO(config_str))
+        config_dict['StdConvert']['target_unit'] = target_unit
+        config_dict['Engine']['fuse_services'] = fuse
+        return weewx.engine.StdEngine(config_dict)
+
+    def _get_packets(self, engine, count):
+        """Return simulator packets, mixed in with some that have missing
+        values, no wind, or another unit system."""
+        packets = []
+        for (i, packet) in enumerate(engine.console.genLoopPackets()):
+            if i >= count:
+                break
+            if i % 7 == 1:
+                packet['rain'] = None
+                packet['outTemp'] = None
+            if i % 11 == 2:
+                packet['windSpeed'] = 0.0
+                del packet['windDir']
+            if i % 13 == 3:
+                packet['windGust'] = None
+            if i % 5 == 4:
+                packet = weewx.units.to_METRIC(packet)
+            if i % 17 == 5:
+                packet = weewx.units.to_METRICWX(packet)
+            packets.append(packet)
+        return packets
+
+    def _compare(self, target_unit):
+        engine_a = self._get_engine(False, target_unit)
+        engine_b = self._get_engine(True, target_unit)
+        try:
+            self.assertEqual(len(engine_a.callbacks[weewx.NEW_LOOP_PACKET]), 4)
+            self.assertEqual(len(engine_b.callbacks[weewx.NEW_LOOP_PACKET]), 1)
+            packets = self._get_packets(engine_a, 2000)
+            for packet in packets:
+                event_a = weewx.Event(weewx.NEW_LOOP_PACKET, packet=dict(packet))
+                event_b = weewx.Event(weewx.NEW_LOOP_PACKET, packet=dict(packet))
+                engine_a.dispatchEvent(event_a)
+                engine_b.dispatchEvent(event_b)
+                # The results must be the same, down to the last bit
+                self.assertEqual(sorted(event_a.packet), sorted(event_b.packet))
+                for obs_type in event_a.packet:
+                    self.assertEqual(repr(event_a.packet[obs_type]), repr(event_b.packet[obs_type]),
+                                     "%s differs at %s" % (obs_type, packet['dateTime']))
+        finally:
+            engine_a.shutDown()
+            engine_b.shutDown()
+
+    def test_metric(self):
+        self._compare('METRIC')
+
+    def test_metricwx(self):
+        self._compare('METRICWX')
+
+    def test_us(self):
+        self._compare('US')
+
+    def test_fuse_callbacks(self):
+        """Only runs of services that can be fused are replaced"""
+        engine = self._get_engine(False, 'METRIC')
+        try:
+            def other(event):  # @UnusedVariable
+                pass
+            callbacks = engine.callbacks[weewx.NEW_LOOP_PACKET]
+            fused = weewx.pipeline.fuse_callbacks(callbacks[:1] + [other] + callbacks[1:])
+            self.assertEqual(len(fused), 3)
+            self.assertTrue(fused[0] is callbacks[0])
+            self.assertTrue(fused[1] is other)
+            self.assertTrue(isinstance(fused[2].im_self, weewx.pipeline.PacketPipeline))
+            self.assertEqual(len(fused[2].im_self.stages), 3)
+        finally:
+            engine.shutDown()
+
+def suite():
+    tests = ['test_metric', 'test_metricwx', 'test_us', 'test_fuse_callbacks']
+    return unittest.TestSuite(map(PipelineTest, tests))
+
+if __name__ == '__main__':
+    unittest.TextTestRunner(verbosity=2).run(suite())
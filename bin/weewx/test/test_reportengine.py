@@ -0,0 +1,94 @@
+#
+#    Copyright (c) 2009-2016 Tom Keffer <tkeffer@gmail.com>
+#
+#    See the file LICENSE.txt for your full rights.
+#
+"""Test running reports in worker processes with weewx.reportengine"""
+
+from __future__ import with_statement
+
+import os
+import shutil
+import syslog
+import tempfile
+import time
+import unittest
+
+import configobj
+
+import weewx.cheetahgenerator
+import weewx.reportengine
+
+ran_dir = '/var/tmp/weewx_test/test_reportengine'
+
+class ReportEngine(weewx.reportengine.StdReportEngine):
+    """Runs no generators. Report 'broken' fails in the worker process, outside
+    of the report itself. The others leave a file behind to show they ran,
+    with the templates the worker found already compiled."""
+
+    def run_report(self, report, skin_dict, aggregate_cache, record_cache, vector_cache):
+        if report == 'broken':
+            # The worker cannot work out the cache counts after this
+            aggregate_cache.hits = None
+        else:
+            with open(os.path.join(ran_dir, report), 'w') as ran_file:
+                for template in sorted(weewx.cheetahgenerator._template_cache):
+                    ran_file.write(os.path.basename(template) + '\n')
+
+class ParallelTest(unittest.TestCase):
+
+    def setUp(self):
+        syslog.openlog('test_reportengine', syslog.LOG_CONS)
+        syslog.setlogmask(syslog.LOG_UPTO(syslog.LOG_DEBUG))
+        try:
+            os.makedirs(ran_dir)
+        except OSError:
+            pass
+        for filename in os.listdir(ran_dir):
+            os.remove(os.path.join(ran_dir, filename))
+
+    def test_failed_report(self):
+        config_dict = {'StdReport': {'max_wait': '60'}}
+        engine = ReportEngine(config_dict, None)
+        generators = {'generator_list': 'weewx.cheetahgenerator.CheetahGenerator'}
+        report_list = [('broken', {'Generators': generators}),
+                       ('after', {'Generators': generators, 'depends_on': 'broken'}),
+                       ('other', {'Generators': generators})]
+        t_start = time.time()
+        engine._run_parallel(report_list, 2)
+        # The failed report counts as finished, so the engine neither waits
+        # for it until max_wait, nor holds back the report that depends on it.
+        self.assertTrue(time.time() - t_start < 30)
+        self.assertEqual(sorted(os.listdir(ran_dir)), ['after', 'other'])
+
+    def test_compiled_templates(self):
+        skin_root = tempfile.mkdtemp()
+        try:
+            os.mkdir(os.path.join(skin_root, 'Test'))
+            for name in ('index.html.tmpl', 'NOAA-YYYY.txt.tmpl'):
+                with open(os.path.join(skin_root, 'Test', name), 'w') as template_file:
+                    template_file.write("$current.outTemp\n")
+            config_dict = {'WEEWX_ROOT': skin_root, 'StdReport': {'SKIN_ROOT': '.'}}
+            engine = ReportEngine(config_dict, None)
+            skin_dict = configobj.ConfigObj(
+                {'skin': 'Test',
+                 'Generators': {'generator_list': 'weewx.cheetahgenerator.CheetahGenerator'},
+                 'CheetahGenerator': {'ToDate': {'index': {'template': 'index.html.tmpl'}},
+                                      'SummaryByYear': {'NOAA_year': {'template': 'NOAA-YYYY.txt.tmpl'}}}})
+            weewx.cheetahgenerator._template_cache.clear()
+            engine._run_parallel([('templates', skin_dict), ('other', {'Generators': {}})], 2)
+            # The templates were compiled before the workers were forked, so
+            # the workers inherited them. So does the next run.
+            with open(os.path.join(ran_dir, 'templates')) as ran_file:
+                self.assertEqual(ran_file.read(), "NOAA-YYYY.txt.tmpl\nindex.html.tmpl\n")
+            self.assertEqual(len(weewx.cheetahgenerator._template_cache), 2)
+        finally:
+            weewx.cheetahgenerator._template_cache.clear()
+            shutil.rmtree(skin_root)
+
+def suite():
+    tests = ['test_failed_report', 'test_compiled_templates']
+    return unittest.TestSuite(map(ParallelTest, tests))
+
+if __name__ == '__main__':
+    unittest.TextTestRunner(verbosity=2).run(suite())
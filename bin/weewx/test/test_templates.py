@@ -116,6 +116,11 @@ class Common(unittest.TestCase):
             record = manager.getRecord(testtime_ts)
         # Now run the engine again, but this time with a current record:
         self.run_engine(stn_info, record, testtime_ts)
+
+        # Finally, run the reports in worker processes, starting from scratch:
+        shutil.rmtree(os.path.join(self.config_dict['WEEWX_ROOT'], self.config_dict['StdReport']['HTML_ROOT']))
+        self.config_dict['StdReport']['report_workers'] = 2
+        self.run_engine(stn_info, record, testtime_ts)
         
     def run_engine(self, stn_info, record, testtime_ts):
         t = weewx.reportengine.StdReportEngine(self.config_dict, stn_info, record, testtime_ts)
@@ -0,0 +1,318 @@
+#
+#    Copyright (c) 2009-2016 Tom Keffer <tkeffer@gmail.com>
+#
+#    See the file LICENSE.txt for your full rights.
+#
+"""Test the calculations of weewx.wxservices that keep state from one record
+to the next, against the way they used to be calculated."""
+
+import math
+import os
+import random
+import StringIO
+import syslog
+import unittest
+
+import configobj
+
+os.environ['TZ'] = 'America/Los_Angeles'
+
+import weeutil.weeutil
+import weewx
+import weewx.manager
+import weewx.wxformulas
+import weewx.wxservices
+from weewx.wxservices import RollingWindow
+from weewx.units import METER_PER_FOOT
+
+config_str = """
+[StdWXCalculate]
+    rain_period = 900
+    et_period = 3600
+    [[Calculations]]
+        ET = prefer_hardware
+        windrun = prefer_hardware
+        rainRate = prefer_hardware
+        pressure = none
+        maxSolarRad = none
+
+[DataBindings]
+    [[wx_binding]]
+        database = archive_sqlite
+        manager = weewx.manager.Manager
+        table_name = archive
+        schema = schemas.wview.schema
+
+[Databases]
+    [[archive_sqlite]]
+        database_name = /var/tmp/weewx_test/test_wxservices.sdb
+        driver = weedb.sqlite
+"""
+
+# Midnight, 1 May 2011, local time
+start_ts = 1304233200
+altitude_vt = (100.0, 'meter', 'group_altitude')
+latitude = 45.686
+longitude = -121.566
+
+class RollingWindowTest(unittest.TestCase):
+
+    def test_window(self):
+        window = RollingWindow(10)
+        self.assertEqual((window.min, window.max, window.avg, window.sum, window.count),
+                         (None, None, None, 0, 0))
+        window.add(100, 3.0)
+        window.add(101, None)
+        window.add(103, 1.0)
+        window.add(105, 5.0)
+        window.add(107, 1.0)
+        self.assertEqual((window.min, window.max, window.avg, window.count), (1.0, 5.0, 2.5, 4))
+        # The window ending at 110 starts after 100
+        window.expire(110)
+        self.assertEqual((window.min, window.max, window.sum, window.count), (1.0, 5.0, 7.0, 3))
+        # Still the same values after 112. The minimum at 107 is left after 113
+        window.expire(112)
+        self.assertEqual((window.min, window.max, window.count), (1.0, 5.0, 3))
+        window.expire(113)
+        self.assertEqual((window.min, window.max, window.count), (1.0, 5.0, 2))
+        window.expire(115)
+        self.assertEqual((window.min, window.max, window.avg, window.count), (1.0, 1.0, 1.0, 1))
+        window.expire(117)
+        self.assertEqual((window.min, window.max, window.avg, window.sum, window.count),
+                         (None, None, None, 0, 0))
+
+    def test_rounding(self):
+        window = RollingWindow(10)
+        for (ts, value) in ((1, 0.1), (2, 0.2), (3, 0.3)):
+            window.add(ts, value)
+        window.expire(100)
+        # No residue is left in the sum of an empty window
+        self.assertEqual(window.sum, 0)
+        window.add(101, 0.7)
+        self.assertEqual(window.sum, 0.7)
+
+    def test_against_list(self):
+        window = RollingWindow(50)
+        values = []
+        ts = 0
+        random.seed(1234)
+        for _ in range(3000):
+            ts += random.randint(1, 20)
+            window.expire(ts)
+            values = [(t, v) for (t, v) in values if t > ts - 50]
+            value = random.choice([None, random.randint(0, 5), random.random() * 10])
+            window.add(ts, value)
+            if value is not None:
+                values.append((ts, value))
+            x = [v for (_, v) in values]
+            self.assertEqual(window.count, len(x))
+            self.assertEqual(window.min, min(x) if x else None)
+            self.assertEqual(window.max, max(x) if x else None)
+            self.assertAlmostEqual(window.sum, sum(x), 9)
+
+class OldRainRate(object):
+    """rainRate as it was calculated before RollingWindow, from lists of rain
+    events."""
+
+    def __init__(self, rain_period):
+        self.rain_period = rain_period
+        self.rain_events = []
+        self.archive_rain_events = []
+
+    def calc_rainRate(self, data, data_type):
+        if data_type == 'loop':
+            if (self.rain_events and self.rain_events[0][0] <= data['dateTime'] - self.rain_period):
+                self.rain_events = [e for e in self.rain_events
+                                    if e[0] > data['dateTime'] - self.rain_period]
+            if 'rain' in data and data['rain']:
+                self.rain_events.append((data['dateTime'], data['rain']))
+        elif data_type == 'archive':
+            if (self.archive_rain_events and
+                    self.archive_rain_events[0][0] <= data['dateTime'] - self.rain_period):
+                self.archive_rain_events = [e for e in self.archive_rain_events
+                                            if e[0] > data['dateTime'] - self.rain_period]
+            if 'rain' in data and data['rain']:
+                self.archive_rain_events.append((data['dateTime'], data['rain']))
+        rainsum = 0
+        if len(self.rain_events) != 0:
+            for e in self.rain_events:
+                rainsum += e[1]
+        elif data_type == 'archive':
+            for e in self.archive_rain_events:
+                rainsum += e[1]
+        return 3600 * rainsum / self.rain_period
+
+def old_ET(calc, dbmanager, data):
+    """ET as it was calculated before RollingWindow, with a query for every
+    archive record. Only for records in US units."""
+    end_ts = data['dateTime']
+    r = dbmanager.getSql("SELECT MAX(outTemp), MIN(outTemp), AVG(radiation), AVG(windSpeed),"
+                         " MAX(outHumidity), MIN(outHumidity) FROM archive"
+                         " WHERE dateTime>? AND dateTime <=?", (end_ts - calc.et_period, end_ts))
+    if r is None or None in r:
+        return None
+    (T_max, T_min, rad_avg, wind_avg, rh_max, rh_min) = r
+    ET_rate = weewx.wxformulas.evapotranspiration_US(
+        T_min, T_max, rh_min, rh_max, rad_avg, wind_avg, calc.wind_height / METER_PER_FOOT,
+        calc.latitude, calc.longitude, calc.altitude_ft, end_ts)
+    return ET_rate * data['interval'] * 60 / 3600.0 if ET_rate is not None else None
+
+def old_windrun(dbmanager, data):
+    """windrun as it was calculated before the state was kept, with a query
+    over the whole day for every archive record. Only for records in US
+    units."""
+    ets = data['dateTime']
+    sts = weeutil.weeutil.startOfDay(ets)
+    run = 0.0
+    for row in dbmanager.genSql("SELECT `interval`,windSpeed FROM archive"
+                                " WHERE dateTime>? AND dateTime<=?", (sts, ets)):
+        if None not in row:
+            run += row[1] * row[0] / 60.0
+    if data.get('windSpeed') is not None:
+        run += data['windSpeed'] * data['interval'] / 60.0
+    return run
+
+def gen_records(count, interval=300):
+    """Generate archive records in US units, with a few values missing."""
+    for i in range(count):
+        ts = start_ts + (i + 1) * interval
+        hour = (ts - start_ts) / 3600.0
+        record = {'dateTime': ts, 'usUnits': weewx.US, 'interval': interval / 60,
+                  'outTemp': 55.0 + 15.0 * math.sin(math.pi * (hour - 9) / 12),
+                  'outHumidity': 60.0 + 20.0 * math.cos(math.pi * hour / 12),
+                  'radiation': max(0.0, 800.0 * math.sin(math.pi * (hour - 6) / 12)),
+                  'windSpeed': 5.0 + 4.0 * math.sin(math.pi * hour / 7),
+                  'rain': 0.01 if i % 5 == 0 else 0.0}
+        if i % 9 == 4:
+            record['radiation'] = None
+        if i % 11 == 6:
+            record['windSpeed'] = None
+        if i % 13 == 7:
+            record['outTemp'] = None
+        yield record
+
+class WXCalculateTest(unittest.TestCase):
+
+    def setUp(self):
+        syslog.openlog('test_wxservices', syslog.LOG_CONS)
+        syslog.setlogmask(syslog.LOG_UPTO(syslog.LOG_DEBUG))
+        self.config_dict = configobj.ConfigObj(StringIO.StringIO(config_str))
+        database_name = self.config_dict['Databases']['archive_sqlite']['database_name']
+        try:
+            os.makedirs(os.path.dirname(database_name))
+        except OSError:
+            pass
+        try:
+            os.remove(database_name)
+        except OSError:
+            pass
+        self.db_binder = weewx.manager.DBBinder(self.config_dict)
+        self.dbmanager = self.db_binder.get_manager('wx_binding', initialize=True)
+
+    def tearDown(self):
+        self.db_binder.close()
+
+    def _get_calc(self):
+        return weewx.wxservices.WXCalculate(self.config_dict, altitude_vt, latitude, longitude,
+                                            self.db_binder)
+
+    def test_rainRate(self):
+        calc = self._get_calc()
+        old = OldRainRate(calc.rain_period)
+        random.seed(4321)
+        ts = start_ts
+        while ts < start_ts + 6 * 3600:
+            ts += 300
+            hour = (ts - start_ts) // 3600
+            # No LOOP packets at all in hour 2, so the archive records are used
+            if hour != 2:
+                for loop_ts in range(ts - 300 + 2, ts + 1, 2):
+                    packet = {'dateTime': loop_ts, 'usUnits': weewx.US,
+                              'rain': random.choice([0.0, 0.0, 0.0, None, 0.01, 0.02])}
+                    calc.do_calculations(packet, 'loop')
+                    self.assertAlmostEqual(packet['rainRate'], old.calc_rainRate(packet, 'loop'), 9)
+            record = {'dateTime': ts, 'usUnits': weewx.US, 'interval': 5,
+                      'rain': random.choice([0.0, 0.01, 0.05])}
+            calc.do_calculations(record, 'archive')
+            self.assertAlmostEqual(record['rainRate'], old.calc_rainRate(record, 'archive'), 9)
+
+    def _check_ET(self, calc, record):
+        expected = old_ET(calc, self.dbmanager, record)
+        data = dict(record)
+        calc.do_calculations(data, 'archive')
+        if 'ET' in record:
+            # It came from the hardware
+            self.assertEqual(data['ET'], record['ET'])
+        elif expected is None:
+            self.assertEqual(data['ET'], None)
+        else:
+            self.assertAlmostEqual(data['ET'], expected, 9)
+        self.dbmanager.addRecord(data)
+
+    def test_ET(self):
+        calc = self._get_calc()
+        records = list(gen_records(150))
+        for (i, record) in enumerate(records):
+            if i % 7 == 3:
+                # ET from the hardware. The record must still count for the
+                # records that follow.
+                record['ET'] = 0.001
+        late = records[40]
+        for (i, record) in enumerate(records):
+            if i == 40 or 60 <= i < 64:
+                # Held back, or missing altogether
+                continue
+            if i == 80:
+                # Gets into the database without going through the calculation
+                self.dbmanager.addRecord(record)
+                continue
+            self._check_ET(calc, record)
+            if i == 45:
+                # The held back record arrives out of order
+                self._check_ET(calc, late)
+        # A restart, with no state
+        calc = self._get_calc()
+        for record in list(gen_records(170))[150:]:
+            self._check_ET(calc, record)
+
+    def _check_windrun(self, calc, record, expected=None):
+        if expected is None:
+            expected = old_windrun(self.dbmanager, record)
+        data = dict(record)
+        calc.do_calculations(data, 'archive')
+        self.assertAlmostEqual(data['windrun'], expected, 9)
+        self.dbmanager.addRecord(data)
+
+    def test_windrun(self):
+        calc = self._get_calc()
+        # A little over a day, so the day rolls over at record 287
+        records = list(gen_records(320))
+        late = records[40]
+        for (i, record) in enumerate(records):
+            if i == 40:
+                continue
+            if i == 150:
+                # A restart, with no state
+                calc = self._get_calc()
+            self._check_windrun(calc, record)
+            if i == 45:
+                # The held back record arrives out of order
+                self._check_windrun(calc, late)
+            if i in (100, 200):
+                # The same record again. The copy in the database is not
+                # counted, where it used to be counted twice.
+                copy = self.dbmanager.getRecord(record['dateTime'])
+                expected = old_windrun(self.dbmanager, record)
+                if copy['windSpeed'] is not None:
+                    expected -= copy['windSpeed'] * copy['interval'] / 60.0
+                self._check_windrun(calc, record, expected)
+
+def suite():
+    tests = [RollingWindowTest('test_window'), RollingWindowTest('test_rounding'),
+             RollingWindowTest('test_against_list'),
+             WXCalculateTest('test_rainRate'), WXCalculateTest('test_ET'),
+             WXCalculateTest('test_windrun')]
+    return unittest.TestSuite(tests)
+
+if __name__ == '__main__':
+    unittest.TextTestRunner(verbosity=2).run(suite())
@@ -270,14 +270,13 @@ def solar_rad_Bras(lat, lon, altitude_m, ts=None, nfac=2):
     0.00
     0.00
     """
-    from weewx.almanac import Almanac
+    from weewx.almanac import get_sun_position
     if ts is None:
         ts = time.time()
     sr = 0.0
     try:
-        alm = Almanac(ts, lat, lon, altitude_m)
-        el = alm.sun.alt  # solar elevation degrees from horizon
-        R = alm.sun.earth_distance
+        # solar elevation degrees from horizon, and earth distance in AU
+        (el, R) = get_sun_position(ts, lat, lon, altitude_m)
         # NREL solar constant W/m^2
         nrel = 1367.0
         # radiation on horizontal surface at top of atmosphere (bras eqn 2.9)
@@ -336,16 +335,15 @@ def solar_rad_RS(lat, lon, altitude_m, ts=None, atc=0.8):
     0.00
     0.00
     """
-    from weewx.almanac import Almanac
+    from weewx.almanac import get_sun_position
     if atc < 0.7 or atc > 0.91:
         atc = 0.8
     if ts is None:
         ts = time.time()
     sr = 0.0
     try:
-        alm = Almanac(ts, lat, lon, altitude_m)
-        el = alm.sun.alt  # solar elevation degrees from horizon
-        R = alm.sun.earth_distance
+        # solar elevation degrees from horizon, and earth distance in AU
+        (el, R) = get_sun_position(ts, lat, lon, altitude_m)
         z = altitude_m
         nrel = 1367.0  # NREL solar constant, W/m^2
         sinal = math.sin(math.radians(el))
@@ -6,6 +6,7 @@
 
 """Services specific to weather."""
 
+import collections
 import syslog
 
 import weedb
@@ -14,7 +15,7 @@ import weewx.engine
 import weewx.wxformulas
 import weeutil.weeutil
 
-from weewx.units import CtoF, mps_to_mph, kph_to_mph, METER_PER_FOOT
+from weewx.units import METER_PER_FOOT
 
 class StdWXCalculate(weewx.engine.StdService):
     """Wrapper class for WXCalculate.
@@ -163,8 +164,17 @@ class WXCalculate(object):
         self.longitude = long_f
         self.temperature_12h_ago = None
         self.ts_12h_ago = None
-        self.rain_events = []
-        self.archive_rain_events = []
+        # The rain over the last rain_period, from LOOP packets and from archive records
+        self.rain_window = RollingWindow(self.rain_period)
+        self.archive_rain_window = RollingWindow(self.rain_period)
+        # The observations over the last et_period that go into ET, from the
+        # archive records in the database. Seeded from the database.
+        self.et_windows = None
+        # The time of the last archive record in et_windows
+        self.et_last_ts = None
+        # The wind run of the archive records of a day that are in the database,
+        # as a tuple (start of day, up to this time, wind run), or None.
+        self.windrun_state = None
 
         # report about which values will be calculated...
         syslog.syslog(syslog.LOG_INFO, "wxcalculate: The following values will be calculated: %s" %
@@ -177,6 +187,12 @@ class WXCalculate(object):
         if self.ignore_zero_wind:
             self.adjust_winddir(data_dict)
         data_us = weewx.units.to_US(data_dict)
+        self.calculate_US(data_us, data_type)
+        data_x = weewx.units.to_std_system(data_us, data_dict['usUnits'])
+        data_dict.update(data_x)
+
+    def calculate_US(self, data_us, data_type):
+        """Add the derived quantities to a record in US units."""
         for obs in self._dispatch_list:
             calc = False
             if obs in self.calculations:
@@ -189,8 +205,11 @@ class WXCalculate(object):
                 calc = True
             if calc:
                 getattr(self, 'calc_' + obs)(data_us, data_type)
-        data_x = weewx.units.to_std_system(data_us, data_dict['usUnits'])
-        data_dict.update(data_x)
+        if data_type == 'archive':
+            # The record is about to go into the database. Make it part of the
+            # ET period of the records that follow, even if its ET came from
+            # the hardware.
+            self._archive_et_record(data_us)
 
     def adjust_winddir(self, data):
         """If wind speed is zero, then the wind direction is undefined.
@@ -252,39 +271,25 @@ class WXCalculate(object):
     # period for the amount of rain.  the window size is controlled by the
     # rain_period parameter.
     def calc_rainRate(self, data, data_type):
-        # if this is a loop packet then cull and add to the queue
+        # if this is a loop packet then cull and add to the loop window
         if data_type == 'loop':
-            # punt any old events from the loop event list...
-            if (self.rain_events and self.rain_events[0][0] <= data['dateTime'] - self.rain_period):
-                events = []
-                for e in self.rain_events:
-                    if e[0] > data['dateTime'] - self.rain_period:
-                        events.append((e[0], e[1]))
-                self.rain_events = events
+            self.rain_window.expire(data['dateTime'])
             # ...then add new rain event if there is one
             if 'rain' in data and data['rain']:
-                self.rain_events.append((data['dateTime'], data['rain']))
+                self.rain_window.add(data['dateTime'], data['rain'])
         elif data_type == 'archive':
-            # punt any old events from the archive event list...
-            if (self.archive_rain_events and self.archive_rain_events[0][0] <= data['dateTime'] - self.rain_period):
-                events = []
-                for e in self.archive_rain_events:
-                    if e[0] > data['dateTime'] - self.rain_period:
-                        events.append((e[0], e[1]))
-                self.archive_rain_events = events
+            self.archive_rain_window.expire(data['dateTime'])
             # ...then add new rain event if there is one
             if 'rain' in data and data['rain']:
-                self.archive_rain_events.append((data['dateTime'], data['rain']))
+                self.archive_rain_window.add(data['dateTime'], data['rain'])
         # for both loop and archive, add up the rain...
         rainsum = 0
-        if len(self.rain_events) != 0:
-            # we have loop rain events so add them up
-            for e in self.rain_events:
-                rainsum += e[1]
+        if self.rain_window.count:
+            # we have loop rain events so use them
+            rainsum = self.rain_window.sum
         elif data_type == 'archive':
-            # no loop rain events but do we have any archive rain events
-            for e in self.archive_rain_events:
-                rainsum += e[1]
+            # no loop rain events but we may have archive rain events
+            rainsum = self.archive_rain_window.sum
         # ...then divide by the period and scale to an hour
         data['rainRate'] = 3600 * rainsum / self.rain_period
 
@@ -324,40 +329,46 @@ class WXCalculate(object):
         """Get maximum and minimum temperatures and average radiation and
         wind speed for the indicated period then calculate the amount of
         evapotranspiration during the interval.  Convert to US units if necessary
-        since this service operates in US unit system."""
+        since this service operates in US unit system.
+
+        The observations over the period are kept in rolling windows, read from
+        the database with the first archive record, after a gap, or when a record
+        arrives out of order. Each archive record is then added to them by
+        calculate_US(), whether its ET is calculated or not."""
         # calculate ET only for archive packets
         if data_type != 'archive':
             return
         end_ts = data['dateTime']
-        start_ts = end_ts - self.et_period
         interval = self._get_archive_interval(data)
+        # A record that arrives out of order is calculated from a fresh read of
+        # the database. So is a record that follows a gap: the records in
+        # between may have reached the database some other way.
+        out_of_order = self.et_windows is not None and end_ts < self.et_last_ts
+        try:
+            if self.et_windows is None or out_of_order or \
+                    (interval and end_ts - self.et_last_ts > interval):
+                self._seed_et_windows(end_ts)
+        except weedb.DatabaseError:
+            self.et_windows = None
+            return
+        et_windows = self.et_windows
+        if out_of_order:
+            # The windows do not hold the records that came after this one.
+            # Read them again with the next record.
+            self.et_windows = None
+        for window in et_windows.values():
+            window.expire(end_ts)
+        T_max    = et_windows['outTemp'].max
+        T_min    = et_windows['outTemp'].min
+        rad_avg  = et_windows['radiation'].avg
+        wind_avg = et_windows['windSpeed'].avg
+        rh_max   = et_windows['outHumidity'].max
+        rh_min   = et_windows['outHumidity'].min
+        # Make sure everything is there:
+        if None in (T_max, T_min, rad_avg, wind_avg, rh_max, rh_min):
+            data['ET'] = None
+            return
         try:
-            dbmanager = self.db_binder.get_manager(self.binding)
-            r = dbmanager.getSql(
-                "SELECT"
-                " MAX(outTemp), MIN(outTemp), AVG(radiation), AVG(windSpeed),"
-                " MAX(outHumidity), MIN(outHumidity), MAX(usUnits), MIN(usUnits)"
-                " FROM %s WHERE dateTime>? AND dateTime <=?"
-                % dbmanager.table_name, (start_ts, end_ts))
-            # Make sure everything is there:
-            if r is None or None in r:
-                data['ET'] = None
-                return
-            # Unpack the results
-            T_max, T_min, rad_avg, wind_avg, rh_max, rh_min, std_unit_min, std_unit_max = r
-            # Check for mixed units
-            if std_unit_min != std_unit_max:
-                syslog.syslog(syslog.LOG_NOTICE, "wxservices: Mixed unit system not allowed in ET calculation")
-                data['ET'] = None
-                return
-            std_unit = std_unit_min
-            if std_unit == weewx.METRIC or std_unit == weewx.METRICWX:
-                T_max = CtoF(T_max)
-                T_min = CtoF(T_min)
-                if std_unit == weewx.METRICWX:
-                    wind_avg = mps_to_mph(wind_avg)
-                else:
-                    wind_avg = kph_to_mph(wind_avg)
             # Wind height is in meters, so convert it:
             height_ft = self.wind_height / METER_PER_FOOT
 
@@ -371,37 +382,82 @@ class WXCalculate(object):
         except ValueError, e:
             weeutil.weeutil.log_traceback()
             syslog.syslog(syslog.LOG_ERR, "wxservices: Calculation of evapotranspiration failed: %s" % e)
-        except weedb.DatabaseError:
-            pass
+
+    def _seed_et_windows(self, end_ts):
+        """Fill the windows for ET with the archive records of the period
+        ending at end_ts."""
+        self.et_windows = dict((obs_type, RollingWindow(self.et_period))
+                               for obs_type in ('outTemp', 'radiation', 'windSpeed', 'outHumidity'))
+        self.et_last_ts = end_ts - self.et_period
+        dbmanager = self.db_binder.get_manager(self.binding)
+        for row in dbmanager.genSql("SELECT dateTime, usUnits, outTemp, radiation, windSpeed, outHumidity"
+                                    " FROM %s WHERE dateTime>? AND dateTime<=? ORDER BY dateTime ASC"
+                                    % dbmanager.table_name, (end_ts - self.et_period, end_ts)):
+            self._add_et_record(weewx.units.to_US(dict(zip(('dateTime', 'usUnits', 'outTemp', 'radiation',
+                                                            'windSpeed', 'outHumidity'), row))))
+
+    def _archive_et_record(self, record_us):
+        """Add an archive record to the windows for ET, unless they have not
+        been seeded yet, or already hold the record."""
+        if self.et_windows is not None and record_us['dateTime'] > self.et_last_ts:
+            self._add_et_record(record_us)
+
+    def _add_et_record(self, record_us):
+        for obs_type in self.et_windows:
+            self.et_windows[obs_type].add(record_us['dateTime'], record_us.get(obs_type))
+        self.et_last_ts = record_us['dateTime']
 
     def calc_windrun(self, data, data_type):
         """Calculate the wind run since the beginning of the day.  Convert to
-        US if necessary since this service operates in US unit system."""
+        US if necessary since this service operates in US unit system.
+
+        The wind run of the records in the database is kept from one archive
+        record to the next, so only the records added since then are read. All
+        the records of the day are read at the start of a day, after a restart,
+        or when a record arrives out of order. A copy of the current record
+        that is already in the database is not counted."""
         # calculate windrun only for archive packets
         if data_type == 'loop':
             return
         ets = data['dateTime']
         sts = weeutil.weeutil.startOfDay(ets)
-        run = 0.0
+        if self.windrun_state is not None and self.windrun_state[0] == sts \
+                and self.windrun_state[1] < ets:
+            (_, since_ts, run) = self.windrun_state
+        else:
+            (since_ts, run) = (sts, 0.0)
         try:
-            dbmanager = self.db_binder.get_manager(self.binding)
-            for row in dbmanager.genSql("SELECT `interval`,windSpeed,usUnits"
-                                        " FROM %s"
-                                        " WHERE dateTime>? AND dateTime<=?" %
-                                        dbmanager.table_name, (sts, ets)):
-                if row and None not in row:
-                    vals_us = weewx.units.to_US({'interval' : row[0],
-                                                 'windSpeed' : row[1],
-                                                 'usUnits' : row[2]})
-                    run += vals_us['windSpeed'] * vals_us['interval'] / 60.0
+            # Timestamps are whole seconds. Stop just short of the current
+            # record, so it gets read with the next one, once it has been
+            # added to the database.
+            stop_ts = max(ets - 1, sts)
+            run += self._get_windrun(since_ts, stop_ts)
         except weedb.DatabaseError:
+            self.windrun_state = None
             data['windrun'] = None
         else:
+            self.windrun_state = (sts, stop_ts, run)
             # Include the "current" record
             if data.get('windSpeed') is not None:
                 run += data['windSpeed'] * data['interval'] / 60.0
             data['windrun'] = run
 
+    def _get_windrun(self, start_ts, stop_ts):
+        """Return the wind run of the archive records timestamped after
+        start_ts, up to and including stop_ts, in miles."""
+        run = 0.0
+        dbmanager = self.db_binder.get_manager(self.binding)
+        for row in dbmanager.genSql("SELECT `interval`,windSpeed,usUnits"
+                                    " FROM %s"
+                                    " WHERE dateTime>? AND dateTime<=?" %
+                                    dbmanager.table_name, (start_ts, stop_ts)):
+            if row and None not in row:
+                vals_us = weewx.units.to_US({'interval' : row[0],
+                                             'windSpeed' : row[1],
+                                             'usUnits' : row[2]})
+                run += vals_us['windSpeed'] * vals_us['interval'] / 60.0
+        return run
+
     def _get_archive_interval(self, data):
         if 'interval' in data and data['interval']:
             # cache the interval so it can be used for loop calculations
@@ -432,3 +488,66 @@ class WXCalculate(object):
             self.ts_12h_ago = ts12
 
         return self.temperature_12h_ago
+
+class RollingWindow(object):
+    """Running statistics of the values over a sliding window of time.
+
+    Values are added in time order. Those that fall out of the window are
+    dropped with expire(). The sum and count are updated as values come and
+    go, the minimum and maximum are kept at the head of monotonic deques, so
+    no operation has to go through the whole window.
+
+    The window ending at time ts holds the values timestamped after
+    ts - period, up to and including ts.
+    """
+
+    def __init__(self, period):
+        self.period = period
+        self.sum = 0
+        self.count = 0
+        self._values = collections.deque()
+        # Candidates for the minimum, in increasing order of time and value:
+        self._min_deque = collections.deque()
+        # Candidates for the maximum, in increasing order of time, decreasing order of value:
+        self._max_deque = collections.deque()
+
+    def add(self, ts, value):
+        """Add a value. Values of None are ignored."""
+        if value is None:
+            return
+        self._values.append((ts, value))
+        self.sum += value
+        self.count += 1
+        # A value is never the minimum while a later one is no greater
+        while self._min_deque and self._min_deque[-1][1] >= value:
+            self._min_deque.pop()
+        self._min_deque.append((ts, value))
+        while self._max_deque and self._max_deque[-1][1] <= value:
+            self._max_deque.pop()
+        self._max_deque.append((ts, value))
+
+    def expire(self, ts):
+        """Drop the values that are not in the window ending at time ts."""
+        cutoff = ts - self.period
+        while self._values and self._values[0][0] <= cutoff:
+            self.sum -= self._values.popleft()[1]
+            self.count -= 1
+        if not self._values:
+            # Don't let rounding errors linger
+            self.sum = 0
+        while self._min_deque and self._min_deque[0][0] <= cutoff:
+            self._min_deque.popleft()
+        while self._max_deque and self._max_deque[0][0] <= cutoff:
+            self._max_deque.popleft()
+
+    @property
+    def min(self):
+        return self._min_deque[0][1] if self._min_deque else None
+
+    @property
+    def max(self):
+        return self._max_deque[0][1] if self._max_deque else None
+
+    @property
+    def avg(self):
+        return self.sum / float(self.count) if self.count else None